@@ -0,0 +1,156 @@
+# cwlog.py - Queue-based structured logging for the servers
+#
+# A log call only puts the record on a bounded queue; a background thread
+# formats and writes it.  A slow terminal or journal then delays the log
+# instead of ingest and broadcast, and when the queue is full records are
+# dropped (and counted) rather than blocking the caller.
+#
+#   cw        server events (devices, web clients, errors, startup)
+#   cw.chars  one record per received character or auto-space; rate limited
+#
+# --log-format json writes one JSON object per line with ts, level, logger,
+# msg and the record's structured fields; --quiet keeps warnings and errors.
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+QUEUE_SIZE = 10000
+
+log = logging.getLogger('cw')
+char_log = logging.getLogger('cw.chars')
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks and leaves formatting to the writer"""
+
+    def __init__(self, record_queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket over records; notes how many were skipped on the next one"""
+
+    def __init__(self, rate, burst=None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or max(1.0, rate * 2)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.suppressed = 0
+        self.suppressed_total = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if self.rate <= 0:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens < 1.0:
+                self.suppressed += 1
+                self.suppressed_total += 1
+                return False
+            self.tokens -= 1.0
+            if self.suppressed:
+                record.suppressed = self.suppressed
+                self.suppressed = 0
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """The plain console lines the servers always printed"""
+
+    def format(self, record):
+        message = record.getMessage()
+        if record.name == char_log.name:
+            stamp = datetime.datetime.fromtimestamp(record.created).strftime("%H:%M:%S")
+            message = f"[{stamp}] {message}"
+        if getattr(record, 'suppressed', 0):
+            message += f" ({record.suppressed} similar messages suppressed)"
+        if record.exc_info:
+            message += "\n" + self.formatException(record.exc_info)
+        return message
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_handler = None
+_char_filter = None
+
+
+def setup(fmt='text', quiet=False, char_rate=20.0, stream=None, loggers=('werkzeug',)):
+    """Route the 'cw' loggers (and ``loggers``) through a background writer"""
+    global _handler, _char_filter
+    record_queue = queue.Queue(QUEUE_SIZE)
+    _handler = DroppingQueueHandler(record_queue)
+
+    writer = logging.StreamHandler(stream or sys.stdout)
+    writer.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+    listener = logging.handlers.QueueListener(record_queue, writer)
+    listener.start()
+    atexit.register(listener.stop)  # Flush what is queued on exit
+
+    level = logging.WARNING if quiet else logging.INFO
+    for logger in (log, *map(logging.getLogger, loggers)):
+        logger.handlers = [_handler]
+        logger.setLevel(level)
+        logger.propagate = False
+
+    _char_filter = RateLimitFilter(char_rate)
+    char_log.addFilter(_char_filter)
+    return listener
+
+
+def stats():
+    """Queue depth and dropped/suppressed record counts"""
+    if _handler is None:
+        return {}
+    return {
+        'queued': _handler.queue.qsize(),
+        'dropped': _handler.dropped,
+        'suppressed': _char_filter.suppressed_total
+    }
+
+
+def add_arguments(parser):
+    """The logging options shared by both servers"""
+    parser.add_argument('--log-format', choices=['text', 'json'], default='text',
+                        help="text: console lines; json: one JSON object per line")
+    parser.add_argument('--quiet', action='store_true',
+                        help="only log warnings and errors")
+    parser.add_argument('--log-char-rate', type=float, default=20.0,
+                        help="per-character log lines per second before they are "
+                             "suppressed (0 = no limit)")
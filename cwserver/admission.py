@@ -0,0 +1,132 @@
+# admission.py - Admission control for the device port
+#
+# Checked in the accept loop before a connection gets a thread or is parsed:
+# a global cap on concurrent device connections and a per-device token
+# bucket on connection rate.  A second per-device bucket caps the character
+# rate once a message is decoded, so one stuck key can't flood the net.
+import threading
+import time
+
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens per second, up to ``burst``"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp')
+
+    def __init__(self, rate, burst, now=None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic() if now is None else now
+
+    def consume(self, now, amount=1):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+
+class DeviceLimits:
+    """Buckets and counters for one device (client IP)"""
+
+    __slots__ = ('connections', 'chars', 'rejected', 'throttled', 'last_seen')
+
+    def __init__(self, conn_rate, conn_burst, char_rate, char_burst, now):
+        self.connections = TokenBucket(conn_rate, conn_burst, now)
+        self.chars = TokenBucket(char_rate, char_burst, now)
+        self.rejected = 0
+        self.throttled = 0
+        self.last_seen = now
+
+
+class AdmissionControl:
+    """Per-device rate limits plus a global concurrent-connection cap"""
+
+    def __init__(self, max_concurrent=64, connect_rate=20.0, connect_burst=40,
+                 char_rate=15.0, char_burst=30, max_tracked=4096):
+        self.max_concurrent = max_concurrent
+        self.connect_rate = connect_rate
+        self.connect_burst = connect_burst
+        self.char_rate = char_rate
+        self.char_burst = char_burst
+        self.max_tracked = max_tracked
+
+        self.devices = {}
+        self.active = 0
+        self.lock = threading.Lock()
+
+        # Counters
+        self.accepted = 0
+        self.rejected_rate = 0
+        self.rejected_busy = 0
+        self.throttled_chars = 0
+
+    def _limits(self, key, now):
+        limits = self.devices.get(key)
+        if limits is None:
+            if len(self.devices) >= self.max_tracked:
+                self._evict_idle(now)
+            limits = DeviceLimits(self.connect_rate, self.connect_burst,
+                                  self.char_rate, self.char_burst, now)
+            self.devices[key] = limits
+        limits.last_seen = now
+        return limits
+
+    def _evict_idle(self, now):
+        """Forget the least recently seen half of the table"""
+        by_age = sorted(self.devices.items(), key=lambda item: item[1].last_seen)
+        for key, _ in by_age[:len(by_age) // 2]:
+            del self.devices[key]
+
+    def admit_connection(self, key):
+        """True if a new connection from ``key`` may be handled.
+
+        Every admitted connection must be given back with ``release()``.
+        """
+        now = time.monotonic()
+        with self.lock:
+            limits = self._limits(key, now)
+            if self.active >= self.max_concurrent:
+                self.rejected_busy += 1
+                limits.rejected += 1
+                return False
+            if not limits.connections.consume(now):
+                self.rejected_rate += 1
+                limits.rejected += 1
+                return False
+            self.active += 1
+            self.accepted += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
+
+    def admit_char(self, key):
+        """True if ``key`` is still within its character rate"""
+        now = time.monotonic()
+        with self.lock:
+            limits = self._limits(key, now)
+            if limits.chars.consume(now):
+                return True
+            self.throttled_chars += 1
+            limits.throttled += 1
+            return False
+
+    def stats(self):
+        with self.lock:
+            return {
+                'active_connections': self.active,
+                'max_concurrent': self.max_concurrent,
+                'accepted': self.accepted,
+                'rejected_rate': self.rejected_rate,
+                'rejected_busy': self.rejected_busy,
+                'throttled_chars': self.throttled_chars,
+                'devices': {
+                    key: {'rejected': limits.rejected, 'throttled': limits.throttled}
+                    for key, limits in self.devices.items()
+                    if limits.rejected or limits.throttled
+                }
+            }
@@ -0,0 +1,96 @@
+# assets.py - Self-hosted, precompressed static assets for the web UI
+#
+# The page's CSS and JS and the Socket.IO client live in static/src, so
+# the UI works without internet access.  At startup every file is read
+# once, named by its content hash (app.js -> app.3f2a9c1b0d.js) and
+# compressed with gzip and, if the brotli package is installed, brotli.
+# Hashed names never change content, so browsers may cache them for a year;
+# a new version gets a new name from the re-rendered page.
+#
+# The page itself is rendered once and served from memory the same way,
+# with an ETag so a reload costs a 304.
+import gzip
+import hashlib
+import os
+
+from flask import Response, abort, render_template, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'src')
+URL_PREFIX = '/assets/'
+LONG_CACHE = 'public, max-age=31536000, immutable'
+MIMETYPES = {
+    '.js': 'application/javascript; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.html': 'text/html; charset=utf-8'
+}
+
+
+class Asset:
+    """One response body in identity, gzip and brotli encodings"""
+
+    def __init__(self, data, mimetype):
+        self.mimetype = mimetype
+        self.etag = hashlib.sha256(data).hexdigest()[:10]
+        self.encodings = {'identity': data, 'gzip': gzip.compress(data, 9, mtime=0)}
+        if brotli is not None:
+            self.encodings['br'] = brotli.compress(data, quality=11)
+
+    def response(self, cache_control):
+        """The smallest encoding the client accepts, or a 304"""
+        headers = {'Cache-Control': cache_control, 'ETag': f'"{self.etag}"', 'Vary': 'Accept-Encoding'}
+        if request.if_none_match.contains(self.etag):
+            return Response(status=304, headers=headers)
+
+        accepted = request.accept_encodings
+        for encoding in ('br', 'gzip'):
+            if encoding in self.encodings and accepted[encoding]:
+                headers['Content-Encoding'] = encoding
+                break
+        else:
+            encoding = 'identity'
+        return Response(self.encodings[encoding], content_type=self.mimetype, headers=headers)
+
+
+class AssetStore:
+    """Hashed static assets plus render-once pages for a Flask app"""
+
+    def __init__(self, source_dir=SOURCE_DIR):
+        self.by_name = {}     # app.js -> app.<hash>.js
+        self.by_hashed = {}   # app.<hash>.js -> Asset
+        self.pages = {}       # template name -> Asset
+        for name in sorted(os.listdir(source_dir)):
+            with open(os.path.join(source_dir, name), 'rb') as f:
+                data = f.read()
+            stem, ext = os.path.splitext(name)
+            if name.endswith('.min.js'):
+                stem, ext = name[:-len('.min.js')], '.min.js'
+            asset = Asset(data, MIMETYPES.get(os.path.splitext(name)[1], 'application/octet-stream'))
+            hashed = f"{stem}.{asset.etag}{ext}"
+            self.by_name[name] = hashed
+            self.by_hashed[hashed] = asset
+
+    def init_app(self, app):
+        app.add_url_rule(URL_PREFIX + '<name>', 'asset', self.serve)
+        app.add_template_global(self.url, 'asset_url')
+
+    def url(self, name):
+        return URL_PREFIX + self.by_name[name]
+
+    def serve(self, name):
+        asset = self.by_hashed.get(name)
+        if asset is None:
+            abort(404)
+        return asset.response(LONG_CACHE)
+
+    def page(self, template):
+        """A template rendered on first use and served from memory after"""
+        asset = self.pages.get(template)
+        if asset is None:
+            html = render_template(template).encode('utf-8')
+            asset = self.pages.setdefault(template, Asset(html, MIMETYPES['.html']))
+        return asset.response('no-cache')
@@ -0,0 +1,348 @@
+# bus.py - Local pub/sub bus for running several web workers off one ingest process
+#
+# The ingest process owns the Morse receiver and publishes every Socket.IO
+# emit onto the bus.  Web worker processes subscribe to the bus, mirror the
+# display state from the event stream and fan the events out to their own
+# browsers.  The bundled broker is dependency-free and talks over a Unix
+# socket; any message queue supported by Flask-SocketIO (redis://, kafka://,
+# amqp://, ...) can be used instead.
+import json
+import logging
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+import socketio
+
+log = logging.getLogger('cw')
+
+DEFAULT_BUS_PATH = '/tmp/cw-network-bus.sock'
+
+# Reserved rooms: nobody joins them, so emits addressed to them only travel
+# over the bus.  Web workers receive mirror snapshots, the ingest process
+# receives control requests coming from browsers.
+MIRROR_ROOM = '__cw_mirror__'
+INGEST_ROOM = '__cw_ingest__'
+
+_HEADER = struct.Struct('!I')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+def send_frame(sock, message):
+    """Send one length-prefixed JSON frame"""
+    payload = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock, size):
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            return None
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def recv_frame(sock):
+    """Receive one length-prefixed JSON frame, None on EOF"""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    (size,) = _HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"Bus frame too large: {size} bytes")
+    payload = _recv_exact(sock, size)
+    if payload is None:
+        return None
+    return json.loads(payload.decode('utf-8'))
+
+
+def unix_path_from_url(url):
+    """Return the socket path of a unix:// bus URL"""
+    return url[len('unix://'):] or DEFAULT_BUS_PATH
+
+
+class BusBroker:
+    """Fan-out broker: every published frame goes to every subscriber in order.
+
+    Frames are numbered with a broker-wide sequence.  A frame flagged with
+    ``retain`` (a state snapshot) resets the replay backlog, so a subscriber
+    that joins late gets the latest snapshot followed by everything that
+    happened since.
+    """
+
+    def __init__(self, path=DEFAULT_BUS_PATH, backlog_size=5000):
+        self.path = path
+        self.epoch = uuid.uuid4().hex
+        self.seq = 0
+        self.backlog = deque(maxlen=backlog_size)
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        self.server_socket = None
+        self.running = False
+
+    def start(self):
+        """Bind the Unix socket and start accepting peers"""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server_socket.bind(self.path)
+        self.server_socket.listen(64)
+        self.running = True
+
+        accept_thread = threading.Thread(target=self.accept_loop)
+        accept_thread.daemon = True
+        accept_thread.start()
+        log.info(f"Bus broker listening on unix://{self.path}")
+
+    def stop(self):
+        self.running = False
+        if self.server_socket:
+            self.server_socket.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def accept_loop(self):
+        while self.running:
+            try:
+                peer, _ = self.server_socket.accept()
+            except OSError:
+                if self.running:
+                    time.sleep(0.1)
+                continue
+
+            peer_thread = threading.Thread(target=self.handle_peer, args=(peer,))
+            peer_thread.daemon = True
+            peer_thread.start()
+
+    def handle_peer(self, peer):
+        """First frame is a hello; after that every frame is a publish"""
+        outbox = None
+        try:
+            hello = recv_frame(peer)
+            if not hello:
+                return
+
+            if hello.get('subscribe'):
+                outbox = self.add_subscriber(peer, hello)
+
+            while True:
+                message = recv_frame(peer)
+                if message is None:
+                    break
+                self.publish(message)
+        except (OSError, ValueError) as e:
+            if self.running:
+                log.error(f"Bus peer error: {e}")
+        finally:
+            if outbox is not None:
+                self.remove_subscriber(peer)
+            peer.close()
+
+    def add_subscriber(self, peer, hello):
+        outbox = deque()
+        ready = threading.Condition()
+        with self.lock:
+            if hello.get('epoch') == self.epoch:
+                since = hello.get('since', 0)
+                replay = [m for m in self.backlog if m['seq'] > since]
+            else:
+                replay = list(self.backlog)
+            outbox.extend(replay)
+            self.subscribers[peer] = (outbox, ready)
+
+        writer = threading.Thread(target=self.subscriber_writer, args=(peer, outbox, ready))
+        writer.daemon = True
+        writer.start()
+        return outbox
+
+    def remove_subscriber(self, peer):
+        with self.lock:
+            entry = self.subscribers.pop(peer, None)
+        if entry:
+            outbox, ready = entry
+            with ready:
+                ready.notify()
+
+    def publish(self, message):
+        with self.lock:
+            self.seq += 1
+            message['seq'] = self.seq
+            message['epoch'] = self.epoch
+            if message.pop('retain', False):
+                self.backlog.clear()
+            self.backlog.append(message)
+            targets = list(self.subscribers.values())
+
+        for outbox, ready in targets:
+            with ready:
+                outbox.append(message)
+                ready.notify()
+
+    def subscriber_writer(self, peer, outbox, ready):
+        """Drain one subscriber's outbox so a slow worker never blocks the others"""
+        while True:
+            with ready:
+                while not outbox and peer in self.subscribers:
+                    ready.wait(1.0)
+                if peer not in self.subscribers:
+                    return
+                batch = list(outbox)
+                outbox.clear()
+            try:
+                for message in batch:
+                    send_frame(peer, message)
+            except OSError:
+                self.remove_subscriber(peer)
+                return
+
+
+class UnixSocketManager(socketio.PubSubManager):
+    """Socket.IO client manager backed by the bundled Unix socket broker"""
+
+    name = 'unixsocket'
+
+    def __init__(self, url='unix://' + DEFAULT_BUS_PATH, channel='flask-socketio',
+                 write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.path = unix_path_from_url(url)
+        self.publish_socket = None
+        self.publish_lock = threading.Lock()
+        self.last_seq = 0
+        self.epoch = None
+
+    def _connect(self, hello):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        send_frame(sock, hello)
+        return sock
+
+    def _publish(self, data):
+        if data.get('room') == MIRROR_ROOM:
+            data = dict(data, retain=True)
+        with self.publish_lock:
+            for attempt in range(2):
+                try:
+                    if self.publish_socket is None:
+                        self.publish_socket = self._connect({'subscribe': False})
+                    send_frame(self.publish_socket, data)
+                    return
+                except OSError as e:
+                    if self.publish_socket is not None:
+                        self.publish_socket.close()
+                    self.publish_socket = None
+                    if attempt:
+                        self._get_logger().error(f"Bus publish failed: {e}")
+
+    def _listen(self):
+        retry_delay = 0.5
+        while True:
+            try:
+                sock = self._connect({'subscribe': True, 'epoch': self.epoch,
+                                      'since': self.last_seq})
+            except OSError:
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 5.0)
+                continue
+
+            retry_delay = 0.5
+            try:
+                while True:
+                    message = recv_frame(sock)
+                    if message is None:
+                        break
+                    self.epoch = message.get('epoch')
+                    self.last_seq = message.get('seq', self.last_seq)
+                    yield message
+            except (OSError, ValueError) as e:
+                self._get_logger().error(f"Bus connection lost: {e}")
+            finally:
+                sock.close()
+            time.sleep(retry_delay)
+
+
+class MirrorMixin:
+    """Hands every emit received from the bus to ``on_event`` first.
+
+    ``on_event(event, data, room)`` keeps the local copy of the display
+    state in step with the ingest process; ``room`` is None for broadcasts,
+    MIRROR_ROOM or INGEST_ROOM for process traffic, or the sid of one
+    client.  Returning True means the event has been fully handled and must
+    not be delivered to local clients.
+    """
+
+    on_event = None
+
+    def emit(self, event, data, namespace=None, room=None, skip_sid=None,
+             callback=None, to=None, **kwargs):
+        room = to or room
+        if room is not None and callback is None and self.is_connected(room, namespace or '/'):
+            # Addressed to a client of this process: no need for the bus
+            kwargs['ignore_queue'] = True
+        return super().emit(event, data, namespace=namespace, room=room, skip_sid=skip_sid,
+                            callback=callback, **kwargs)
+
+    def _handle_emit(self, message):
+        if self.on_event is not None and message.get('namespace') in (None, '/'):
+            data = message.get('data') or [None]
+            if self.on_event(message['event'], data[0], message.get('room')):
+                return
+        super()._handle_emit(message)
+
+
+class MirroredUnixSocketManager(MirrorMixin, UnixSocketManager):
+    pass
+
+
+def _external_manager_class(url):
+    if url.startswith(('redis://', 'rediss://')):
+        return socketio.RedisManager
+    if url.startswith('kafka://'):
+        return socketio.KafkaManager
+    if url.startswith('zmq'):
+        return socketio.ZmqManager
+    return socketio.KombuManager
+
+
+def create_client_manager(url, on_event=None, write_only=False):
+    """Build a Socket.IO client manager for a bus URL"""
+    if url.startswith('unix://'):
+        manager_class = MirroredUnixSocketManager
+    else:
+        base = _external_manager_class(url)
+        manager_class = type('Mirrored' + base.__name__, (MirrorMixin, base), {})
+
+    manager = manager_class(url, channel='flask-socketio', write_only=write_only)
+    manager.on_event = on_event
+    return manager
+
+
+def start_listening(sio):
+    """Start the bus listener of a Flask-SocketIO instance with no web server.
+
+    Socket.IO only initializes its client manager when the first browser
+    connects, which never happens in the ingest process.
+    """
+    server = sio.server
+    if not server.manager_initialized:
+        server.manager_initialized = True
+        server.manager.initialize()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_BUS_PATH
+    broker = BusBroker(path)
+    broker.start()
+    print("Press Ctrl+C to stop the broker")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        broker.stop()
@@ -3,9 +3,12 @@ from flask import Flask, render_template_string
 from flask_socketio import SocketIO, emit
 import time
 
+import assets
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'test_secret'
 socketio = SocketIO(app, cors_allowed_origins="*")
+assets.AssetStore().init_app(app)
 
 # Simple HTML template for testing
 TEST_TEMPLATE = '''
@@ -13,7 +16,7 @@ TEST_TEMPLATE = '''
 <html>
 <head>
     <title>WebSocket Test</title>
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/socket.io/4.0.1/socket.io.js"></script>
+    <script src="{{ asset_url('socket.io.min.js') }}"></script>
 </head>
 <body>
     <h1>WebSocket Connection Test</h1>
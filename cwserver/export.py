@@ -0,0 +1,93 @@
+# export.py - Streaming NDJSON/CSV export of history
+#
+# Rows are pulled from the history stores a chunk at a time through a
+# position cursor; each chunk is read under the store's lock, formatted
+# outside it and handed to the response before the next one is read.
+# Memory stays at one chunk whatever the export size, and ingest only ever
+# waits for one chunk copy.
+import csv
+import io
+import json
+import zlib
+
+CHUNK_ROWS = 1000
+
+CHAR_FIELDS = ('timestamp', 'device', 'color', 'char', 'morse')
+LINE_FIELDS = ('id', 'timestamp', 'devices', 'text')
+
+
+def char_rows(chars, since=None, until=None, device=None):
+    """Characters from a CharHistory as dicts, in time order"""
+    position = chars.position_at(since)
+    end = chars.end_position()  # Stop at what existed when the export started
+    while position < end:
+        rows, position = chars.read(position, min(CHUNK_ROWS, end - position))
+        if not rows:
+            return
+        for row in rows:
+            if until is not None and row[0] > until:
+                return
+            if device is None or row[1] == device:
+                yield dict(zip(CHAR_FIELDS, row))
+
+
+def line_rows(index, since=None, until=None, device=None):
+    """Completed lines from a TranscriptIndex, in time order"""
+    line_id = index.id_at(since)
+    end = index.next_id
+    while line_id < end:
+        lines, line_id = index.read(line_id, min(CHUNK_ROWS, end - line_id))
+        if not lines:
+            return
+        for line in lines:
+            if until is not None and line['timestamp'] > until:
+                return
+            if device is None or device in line['devices']:
+                yield line
+
+
+def ndjson_chunks(rows):
+    buffer = []
+    for row in rows:
+        buffer.append(json.dumps(row, separators=(',', ':')))
+        if len(buffer) >= CHUNK_ROWS:
+            yield '\n'.join(buffer) + '\n'
+            buffer = []
+    if buffer:
+        yield '\n'.join(buffer) + '\n'
+
+
+def csv_chunks(rows, fields):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(fields)
+    count = 0
+    for row in rows:
+        writer.writerow([' '.join(row[f]) if isinstance(row[f], list) else row[f] for f in fields])
+        count += 1
+        if count >= CHUNK_ROWS:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+            count = 0
+    yield out.getvalue()
+
+
+def encode(chunks, compress=False):
+    """UTF-8 encode text chunks, gzip-compressing them on the fly if asked"""
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode('utf-8')
+        return
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(rows, fmt, fields, compress=False):
+    """Response body for an export"""
+    chunks = csv_chunks(rows, fields) if fmt == 'csv' else ndjson_chunks(rows)
+    return encode(chunks, compress)
@@ -0,0 +1,137 @@
+# frames.py - Encode-once broadcast frames and the reconnect replay log
+#
+# A broadcast event is serialized into Socket.IO/Engine.IO packets exactly
+# once, when it is published.  The same immutable frame object is queued for
+# every web client and kept in the replay log, so sending it costs a queue
+# put per client instead of a JSON encode per client.  Server-Sent Events
+# readers (/api/stream) read the same log through a cursor.
+import json
+import threading
+import uuid
+from collections import deque
+
+from engineio import packet as eio_packet
+from socketio import packet as sio_packet
+
+try:
+    import msgpack
+except ImportError:  # optional: binary mode is simply not offered
+    msgpack = None
+
+CODECS = ('json', 'msgpack') if msgpack is not None else ('json',)
+
+# Event name used to carry a MessagePack-encoded [event, data] pair
+MSGPACK_EVENT = 'mp'
+
+
+def encode_sse(event, data, event_id=None):
+    """One Server-Sent Events message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, separators=(',', ':')))
+    return ("\n".join(lines) + "\n\n").encode('utf-8')
+
+
+def encode_packets(event, data, packet_class=sio_packet.Packet):
+    """Encode one Socket.IO event into ready-to-send Engine.IO packets"""
+    pkt = packet_class(sio_packet.EVENT, namespace='/', data=[event, data])
+    encoded = pkt.encode()
+    if not isinstance(encoded, list):
+        encoded = [encoded]
+    return tuple(eio_packet.Packet(eio_packet.MESSAGE, p) for p in encoded)
+
+
+class Frame:
+    """An immutable, pre-encoded broadcast event"""
+
+    __slots__ = ('seq', 'event', 'data', '_json', '_msgpack', '_without_morse', '_sse')
+
+    def __init__(self, seq, event, data):
+        if seq is not None and isinstance(data, dict):
+            data = dict(data, seq=seq)
+        elif seq is not None and data is None:
+            data = {'seq': seq}
+        self.seq = seq
+        self.event = event
+        self.data = data
+        self._json = encode_packets(event, data)
+        self._msgpack = None
+        self._without_morse = None
+        self._sse = None
+
+    def __setattr__(self, name, value):
+        if name in ('seq', 'event', 'data', '_json') and hasattr(self, name):
+            raise AttributeError(f"Frame.{name} is read-only")
+        object.__setattr__(self, name, value)
+
+    def packets(self, codec='json'):
+        """Engine.IO packets for a client using ``codec``"""
+        if codec == 'msgpack' and msgpack is not None:
+            if self._msgpack is None:
+                payload = msgpack.packb([self.event, self.data], use_bin_type=True)
+                self._msgpack = encode_packets(MSGPACK_EVENT, payload)
+            return self._msgpack
+        return self._json
+
+    def sse(self, epoch):
+        """Server-Sent Events encoding, shared by every stream reader"""
+        if self._sse is None:
+            self._sse = encode_sse(self.event, self.data, f"{epoch}:{self.seq}")
+        return self._sse
+
+    def without_morse(self):
+        """The same frame minus audio-only fields (encoded once, on demand)"""
+        if not isinstance(self.data, dict) or 'morse' not in self.data:
+            return self
+        if self._without_morse is None:
+            data = {k: v for k, v in self.data.items() if k not in ('morse', 'seq')}
+            self._without_morse = Frame(self.seq, self.event, data)
+        return self._without_morse
+
+
+class FrameLog:
+    """Sequence-numbered ring of recent broadcast frames"""
+
+    def __init__(self, maxlen=2000):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.frames = deque(maxlen=maxlen)
+        self.lock = threading.Lock()
+        self.appended = threading.Condition(self.lock)
+
+    def append(self, event, data=None):
+        """Encode an event once and remember it for replay"""
+        with self.lock:
+            self.seq += 1
+            frame = Frame(self.seq, event, data)
+            self.frames.append(frame)
+            self.appended.notify_all()
+        return frame
+
+    def since(self, epoch, seq):
+        """Frames after ``seq``, or None if they are no longer all available"""
+        with self.lock:
+            return self._since(epoch, seq)
+
+    def _since(self, epoch, seq):
+        if epoch != self.epoch or seq > self.seq:
+            return None
+        if seq == self.seq:
+            return []
+        if not self.frames or self.frames[0].seq > seq + 1:
+            return None
+        start = seq + 1 - self.frames[0].seq
+        return [self.frames[i] for i in range(start, len(self.frames))]
+
+    def wait(self, epoch, seq, timeout=None):
+        """Like since(), but blocks until there is something after ``seq``"""
+        with self.lock:
+            if epoch == self.epoch and seq == self.seq:
+                self.appended.wait(timeout)
+            return self._since(epoch, seq)
+
+    def position(self):
+        """(epoch, seq) a client should resume from"""
+        return self.epoch, self.seq
@@ -0,0 +1,287 @@
+# history.py - Compact columnar ring buffer of received characters
+#
+# Each character used to be a dict of five Python objects, several hundred
+# bytes apiece.  Here every field is a column in a preallocated array:
+#
+#   times     float64  receive (or keying) time
+#   devices   uint16   id into the interned (ip, color) table
+#   symbols   uint16   id into the interned symbol table ('A', '<AR>', ...)
+#   morse     uint16   dit/dah tree index of the pattern (see morse_decoder)
+#
+# 14 bytes per character, so 100k characters take about 1.4 MB.  Appends
+# are O(1); a character that arrives late is inserted in time order.
+#
+# The intern tables only grow as new devices and symbols arrive, so every
+# time the ring turns over they are compacted to the values the stored
+# characters still use and the id columns are renumbered in place.  A
+# character whose value does not fit even then is not stored.
+import os
+import sys
+import threading
+from array import array
+from functools import lru_cache
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from morse_decoder import pattern_index, index_pattern
+
+MAX_MORSE_ELEMENTS = 15  # fits a uint16 tree index; longer patterns are stored as 0
+
+
+def encode_morse(morse):
+    """Fixed-width encoding of a '.-' pattern, 0 if it can't be represented"""
+    if not morse or len(morse) > MAX_MORSE_ELEMENTS or morse.strip('.-'):
+        return 0
+    return pattern_index(morse)
+
+
+@lru_cache(maxsize=1024)
+def decode_morse(code):
+    return index_pattern(code) if code else ''
+
+
+class InternTable:
+    """Values <-> small integer ids"""
+
+    def __init__(self, limit=0x10000):
+        self.limit = limit
+        self.ids = {}
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def intern(self, value):
+        """Id of ``value``, None if it is new and the table is full"""
+        value_id = self.ids.get(value)
+        if value_id is None:
+            value_id = len(self.values)
+            if value_id >= self.limit:
+                return None
+            self.ids[value] = value_id
+            self.values.append(value)
+        return value_id
+
+
+class CharHistory:
+    """Fixed-capacity ring of characters stored column by column"""
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.devices = array('H', bytes(2 * capacity))
+        self.symbols = array('H', bytes(2 * capacity))
+        self.morse = array('H', bytes(2 * capacity))
+        self.device_table = InternTable()  # (ip, color)
+        self.symbol_table = InternTable()
+        self.start = 0   # slot of the oldest character
+        self.count = 0
+        self.appended = 0  # characters ever stored; positions count from here
+        self.compacted_at = 0  # self.appended at the last table compaction
+        self.dropped = 0   # characters not stored because a table was full
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def _ids(self, char, device, color):
+        """(device id, symbol id) of a new character, None if they don't fit"""
+        if self.appended - self.compacted_at >= self.capacity:
+            self._compact()  # The ring has turned over since the last time
+        device_id = self.device_table.intern((device, color))
+        symbol_id = self.symbol_table.intern(char)
+        if (device_id is None or symbol_id is None) and self.appended != self.compacted_at:
+            self._compact()
+            device_id = self.device_table.intern((device, color))
+            symbol_id = self.symbol_table.intern(char)
+        if device_id is None or symbol_id is None:
+            self.dropped += 1
+            return None
+        return device_id, symbol_id
+
+    def _compact(self):
+        """Drop table values no stored character refers to, renumbering the
+        id columns in place"""
+        self.compacted_at = self.appended
+        segments = self._segments()
+        for column, name in ((self.devices, 'device_table'), (self.symbols, 'symbol_table')):
+            table = getattr(self, name)
+            used = set()
+            for start, stop in segments:
+                used.update(column[start:stop])
+            if len(used) == len(table):
+                continue
+            compacted = InternTable(table.limit)
+            remap = [0] * len(table)
+            for old_id in sorted(used):
+                remap[old_id] = compacted.intern(table.values[old_id])
+            for start, stop in segments:
+                column[start:stop] = array(column.typecode, map(remap.__getitem__, column[start:stop]))
+            setattr(self, name, compacted)
+
+    def _write(self, slot, ids, morse, timestamp):
+        self.times[slot] = timestamp
+        self.devices[slot], self.symbols[slot] = ids
+        self.morse[slot] = encode_morse(morse)
+
+    def _copy(self, src, dst):
+        for column in (self.times, self.devices, self.symbols, self.morse):
+            column[dst] = column[src]
+
+    def append(self, char, device, color, morse, timestamp):
+        """Add a character, or insert it in time order if it arrived late"""
+        with self.lock:
+            ids = self._ids(char, device, color)
+            if ids is None:
+                return
+            if self.count and timestamp < self.times[(self.start + self.count - 1) % self.capacity]:
+                self._insert(ids, morse, timestamp)
+                return
+            if self.count == self.capacity:
+                slot = self.start
+                self.start = (self.start + 1) % self.capacity
+            else:
+                slot = (self.start + self.count) % self.capacity
+                self.count += 1
+            self._write(slot, ids, morse, timestamp)
+            self.appended += 1
+
+    def _insert(self, ids, morse, timestamp):
+        """Shift the newer characters by one slot; costs as many steps as
+        characters were received since this one was keyed"""
+        capacity = self.capacity
+        position = self.count
+        while position > 0 and self.times[(self.start + position - 1) % capacity] > timestamp:
+            position -= 1
+        if self.count == capacity:
+            if position == 0:
+                return  # Older than anything kept
+            # Drop the oldest to make room
+            self.start = (self.start + 1) % capacity
+            self.count -= 1
+            position -= 1
+        for i in range(self.count, position, -1):
+            self._copy((self.start + i - 1) % capacity, (self.start + i) % capacity)
+        self.count += 1
+        self._write((self.start + position) % capacity, ids, morse, timestamp)
+        self.appended += 1
+
+    def clear(self):
+        with self.lock:
+            self.start = 0
+            self.count = 0
+            self.device_table = InternTable()
+            self.symbol_table = InternTable()
+            self.compacted_at = self.appended
+
+    def snapshot(self):
+        """Intern tables plus every column as raw bytes, oldest first"""
+        with self.lock:
+            columns = {}
+            for name, column in (('times', self.times), ('devices', self.devices),
+                                 ('symbols', self.symbols), ('morse', self.morse)):
+                end = self.start + self.count
+                part = column[self.start:min(end, self.capacity)]
+                if end > self.capacity:
+                    part += column[:end - self.capacity]
+                columns[name] = part.tobytes()
+            return {
+                'count': self.count,
+                'appended': self.appended,
+                'device_table': list(self.device_table.values),
+                'symbol_table': list(self.symbol_table.values),
+                'byteorder': sys.byteorder,
+                'columns': columns
+            }
+
+    def restore(self, snapshot):
+        """Replace the contents with a snapshot(); keeps the newest that fit"""
+        with self.lock:
+            self.device_table = InternTable()
+            for device, color in snapshot['device_table']:
+                self.device_table.intern((device, color))
+            self.symbol_table = InternTable()
+            for symbol in snapshot['symbol_table']:
+                self.symbol_table.intern(symbol)
+
+            count = min(snapshot['count'], self.capacity)
+            skip = snapshot['count'] - count
+            for name, column in (('times', self.times), ('devices', self.devices),
+                                 ('symbols', self.symbols), ('morse', self.morse)):
+                values = array(column.typecode)
+                values.frombytes(snapshot['columns'][name])
+                if snapshot['byteorder'] != sys.byteorder:
+                    values.byteswap()
+                column[:count] = values[skip:]
+            self.start = 0
+            self.count = count
+            self.appended = snapshot['appended']
+            self.compacted_at = self.appended
+
+    def position_at(self, timestamp=None):
+        """Position of the first character at or after ``timestamp``.
+
+        Positions stay valid while the ring moves on; ``read()`` skips what
+        has been overwritten since.
+        """
+        with self.lock:
+            low, high = 0, self.count
+            if timestamp is not None:
+                while low < high:
+                    middle = (low + high) // 2
+                    if self.times[(self.start + middle) % self.capacity] < timestamp:
+                        low = middle + 1
+                    else:
+                        high = middle
+            return self.appended - self.count + low
+
+    def end_position(self):
+        with self.lock:
+            return self.appended
+
+    def read(self, position, limit=1000):
+        """Up to ``limit`` rows from ``position`` as (timestamp, device, color,
+        char, morse) tuples, and the position after them"""
+        with self.lock:
+            devices = self.device_table.values
+            symbols = self.symbol_table.values
+            oldest = self.appended - self.count
+            position = max(position, oldest)
+            rows = []
+            for offset in range(position - oldest, min(self.count, position - oldest + limit)):
+                slot = (self.start + offset) % self.capacity
+                device, color = devices[self.devices[slot]]
+                rows.append((self.times[slot], device, color,
+                             symbols[self.symbols[slot]], self.morse[slot]))
+        return [row[:4] + (decode_morse(row[4]),) for row in rows], position + len(rows)
+
+    def _segments(self, limit=None):
+        """Physical (start, stop) slot ranges of the newest ``limit`` characters.
+
+        At most two ranges because the ring may wrap.
+        """
+        count = self.count if limit is None else min(limit, self.count)
+        first = (self.start + self.count - count) % self.capacity
+        end = first + count
+        if end <= self.capacity:
+            return [(first, end)] if count else []
+        return [(first, self.capacity), (0, end - self.capacity)]
+
+    def recent(self, limit=None):
+        """Newest ``limit`` characters as dicts, oldest first"""
+        result = []
+        with self.lock:
+            devices = self.device_table.values
+            symbols = self.symbol_table.values
+            rows = [row for start, stop in self._segments(limit) for row in zip(
+                self.times[start:stop], self.devices[start:stop],
+                self.symbols[start:stop], self.morse[start:stop])]
+        for timestamp, device_id, symbol_id, morse in rows:
+            device, color = devices[device_id]
+            result.append({
+                'char': symbols[symbol_id],
+                'color': color,
+                'device': device,
+                'morse': decode_morse(morse),
+                'timestamp': timestamp
+            })
+        return result
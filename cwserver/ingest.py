@@ -0,0 +1,376 @@
+# ingest.py - Multi-process device port for --ingest-workers N
+#
+# One Python process tops out on accepting, reading and parsing device
+# connections long before the line assembly does.  With --ingest-workers N
+# the process that owns line assembly and broadcast no longer listens on the
+# device port itself: N worker processes bind it with SO_REUSEPORT and the
+# kernel spreads connections across them.  Workers read and parse the
+# device messages and forward them over a Unix socket to the owner.
+#
+# Each worker keeps one connection to the owner and pipelines over it: every
+# request carries an id, the owner applies them in arrival order and answers
+# {'id': ..., 'reply': ...}, and a reader thread hands each reply to the
+# client thread waiting for it.  Any number of device connections per worker
+# can therefore be in flight at once.
+#
+# Per-device ordering: by default the kernel hashes the full address and
+# port tuple, so consecutive connections from one device could land on
+# different workers.  Each worker therefore attaches a classic BPF program
+# to the port (SO_ATTACH_REUSEPORT_CBPF) that picks the socket by source IP
+# modulo the worker count, and every device always reaches the same worker.
+# Within a worker, connections get a per-device turn in accept order and
+# forward only when the previous connection from that device is done, so
+# a device's messages reach the owner in the order they were sent - also
+# for legacy firmware that sends a character and closes without waiting.
+#
+# Device admission limits are per device, so with sharding each worker can
+# apply the full connection rate; without it (no BPF support) the rate is
+# divided between the workers.
+import ctypes
+import logging
+import os
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bus import send_frame, recv_frame
+from device_protocol import read_device_message, parse_fields, parse_batch, parse_message
+import admission
+import cwlog
+
+log = logging.getLogger('cw')
+
+DEFAULT_INGEST_PATH = '/tmp/cw-network-ingest.sock'
+
+SO_ATTACH_REUSEPORT_CBPF = 51
+SKF_NET_OFF = -0x100000   # BPF loads relative to the IP header
+
+
+def shard_by_source_ip(server_socket, workers):
+    """Make the SO_REUSEPORT group pick a socket by source IP % workers.
+
+    The program is shared by the whole group; attaching it again from
+    another worker replaces it with the same one.  False if the kernel
+    does not support it.
+    """
+    program = [
+        (0x20, 0, 0, (SKF_NET_OFF + 12) & 0xFFFFFFFF),  # A = IPv4 source address
+        (0x94, 0, 0, workers),                         # A %= workers
+        (0x16, 0, 0, 0),                               # return A
+    ]
+    instructions = ctypes.create_string_buffer(
+        b''.join(struct.pack('HBBI', *instruction) for instruction in program))
+    fprog = struct.pack('HL', len(program), ctypes.addressof(instructions))
+    try:
+        server_socket.setsockopt(socket.SOL_SOCKET, SO_ATTACH_REUSEPORT_CBPF, fprog)
+        return True
+    except OSError as e:
+        log.warning(f"Cannot shard the device port by source IP ({e}); "
+                    f"a device's connections may reach different workers")
+        return False
+
+
+class DeviceTurns:
+    """Forwarding turns per device, handed out in accept order"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.issued = {}    # ip -> next ticket
+        self.serving = {}   # ip -> ticket whose turn it is
+
+    def ticket(self, ip):
+        with self.cond:
+            ticket = self.issued.get(ip, 0)
+            self.issued[ip] = ticket + 1
+            self.serving.setdefault(ip, ticket)
+            return ticket
+
+    def wait(self, ip, ticket):
+        with self.cond:
+            self.cond.wait_for(lambda: self.serving[ip] == ticket)
+
+    def done(self, ip, ticket):
+        """End a turn (call exactly once per ticket, after its wait())"""
+        with self.cond:
+            self.serving[ip] = ticket + 1
+            if self.serving[ip] == self.issued[ip]:
+                del self.serving[ip], self.issued[ip]  # Nothing queued for it
+            self.cond.notify_all()
+
+
+class IngestOwner:
+    """Owner end: accepts worker connections and applies their messages.
+
+    ``handler(message)`` runs for every forwarded message and returns the
+    reply sent back to the worker.
+    """
+
+    def __init__(self, handler, path=DEFAULT_INGEST_PATH):
+        self.handler = handler
+        self.path = path
+        self.server_socket = None
+        self.running = False
+        self.workers = []
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server_socket.bind(self.path)
+        self.server_socket.listen(64)
+        self.running = True
+
+        accept_thread = threading.Thread(target=self.accept_loop)
+        accept_thread.daemon = True
+        accept_thread.start()
+
+    def accept_loop(self):
+        while self.running:
+            try:
+                worker, _ = self.server_socket.accept()
+            except OSError:
+                if self.running:
+                    time.sleep(0.1)
+                continue
+
+            worker_thread = threading.Thread(target=self.handle_worker, args=(worker,))
+            worker_thread.daemon = True
+            worker_thread.start()
+
+    def handle_worker(self, worker):
+        try:
+            while True:
+                request = recv_frame(worker)
+                if request is None:
+                    break
+                try:
+                    reply = self.handler(request['message'])
+                except Exception as e:
+                    log.error(f"Error applying forwarded message: {e}")
+                    reply = {}
+                send_frame(worker, {'id': request['id'], 'reply': reply})
+        except (OSError, ValueError) as e:
+            if self.running:
+                log.error(f"Ingest worker connection error: {e}")
+        finally:
+            worker.close()
+
+    def spawn_workers(self, count, host, port, max_connections=64,
+                      connect_rate=20.0, timeout=5.0):
+        """Start ``count`` worker processes sharing the device port"""
+        script = os.path.abspath(__file__)
+        for worker_id in range(count):
+            self.workers.append(subprocess.Popen([
+                sys.executable, script,
+                '--owner', self.path,
+                '--host', host,
+                '--port', str(port),
+                '--worker-id', str(worker_id),
+                '--workers', str(count),
+                '--max-connections', str(max(1, max_connections // count)),
+                '--connect-rate', str(connect_rate),
+                '--timeout', str(timeout)
+            ]))
+        log.info(f"✓ {count} ingest workers sharing port {port} (SO_REUSEPORT)")
+
+    def stop(self):
+        self.running = False
+        for worker in self.workers:
+            worker.terminate()
+        if self.server_socket:
+            self.server_socket.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class IngestWorker:
+    """Worker process: accepts device connections and forwards parsed messages"""
+
+    def __init__(self, owner_path, host='0.0.0.0', port=12345, worker_id=0, workers=1,
+                 max_connections=64, connect_rate=20.0, timeout=5.0):
+        self.owner_path = owner_path
+        self.host = host
+        self.port = port
+        self.worker_id = worker_id
+        self.workers = workers
+        self.timeout = timeout
+        self.connect_rate = connect_rate
+        self.admission = admission.AdmissionControl(
+            max_concurrent=max_connections,
+            connect_rate=connect_rate,
+            connect_burst=int(connect_rate * 2))
+        self.turns = DeviceTurns()
+
+        self.owner = None
+        self.send_lock = threading.Lock()     # owner connection and writes to it
+        self.pending_lock = threading.Lock()
+        self.pending = {}                     # request id -> [owner, done, reply]
+        self.next_id = 0
+        self.forwarded = 0
+        self.parent_pid = os.getppid()
+
+    def watch_parent(self):
+        """Exit with the owner process so the device port is freed"""
+        while os.getppid() == self.parent_pid:
+            time.sleep(1.0)
+        os._exit(0)
+
+    def connect_owner(self):
+        """Connect to the owner process, waiting for it to come up"""
+        while True:
+            try:
+                owner = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                owner.connect(self.owner_path)
+                return owner
+            except OSError:
+                owner.close()
+                time.sleep(0.2)
+
+    def owner_connection(self):
+        """The owner connection, with its reply reader; call with send_lock held"""
+        if self.owner is None:
+            self.owner = self.connect_owner()
+            reader = threading.Thread(target=self.read_replies, args=(self.owner,))
+            reader.daemon = True
+            reader.start()
+        return self.owner
+
+    def read_replies(self, owner):
+        """Hand each reply on ``owner`` to the thread waiting for it"""
+        try:
+            while True:
+                response = recv_frame(owner)
+                if response is None:
+                    break
+                with self.pending_lock:
+                    waiter = self.pending.pop(response['id'], None)
+                if waiter:
+                    waiter[2] = response['reply']
+                    waiter[1].set()
+                    self.forwarded += 1
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.drop_owner(owner)
+
+    def drop_owner(self, owner):
+        """Close a broken owner connection and fail the requests sent on it"""
+        try:
+            owner.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        owner.close()
+        with self.send_lock:
+            if self.owner is owner:
+                self.owner = None
+        with self.pending_lock:
+            failed = [request_id for request_id, waiter in self.pending.items()
+                      if waiter[0] is owner]
+            for request_id in failed:
+                self.pending.pop(request_id)[1].set()
+
+    def forward(self, message):
+        """Send a message to the owner and wait for its reply"""
+        waiter = [None, threading.Event(), None]
+        with self.send_lock:
+            owner = waiter[0] = self.owner_connection()
+            self.next_id += 1
+            request_id = self.next_id
+            with self.pending_lock:
+                self.pending[request_id] = waiter
+            try:
+                send_frame(owner, {'id': request_id, 'message': message})
+                sent = True
+            except OSError:
+                sent = False
+        if not sent:
+            self.drop_owner(owner)
+        if not waiter[1].wait(self.timeout):
+            with self.pending_lock:
+                self.pending.pop(request_id, None)
+            raise TimeoutError("no reply from the owner process")
+        if waiter[2] is None:
+            raise ConnectionError("owner process went away")
+        return waiter[2]
+
+    def run(self):
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server_socket.bind((self.host, self.port))
+        server_socket.listen(128)
+        if self.workers > 1 and not shard_by_source_ip(server_socket, self.workers):
+            # A device's connections are spread over every worker
+            rate = self.connect_rate / self.workers
+            self.admission.connect_rate = rate
+            self.admission.connect_burst = max(1, int(rate * 2))
+        with self.send_lock:
+            self.owner_connection()
+
+        watchdog = threading.Thread(target=self.watch_parent)
+        watchdog.daemon = True
+        watchdog.start()
+
+        while True:
+            client_socket, client_address = server_socket.accept()
+            if not self.admission.admit_connection(client_address[0]):
+                client_socket.close()
+                continue
+
+            client_thread = threading.Thread(
+                target=self.handle_client,
+                args=(client_socket, client_address, self.turns.ticket(client_address[0]))
+            )
+            client_thread.daemon = True
+            client_thread.start()
+
+    def handle_client(self, client_socket, client_address, ticket):
+        ip = client_address[0]
+        try:
+            client_socket.settimeout(self.timeout)
+            data = read_device_message(client_socket).decode('utf-8')
+            # Earlier connections from this device go to the owner first
+            self.turns.wait(ip, ticket)
+            if data:
+                message = parse_message(data)
+                message['ip'] = ip
+                reply = self.forward(message)
+                if 'ack' in reply:
+                    client_socket.sendall(f"ACK: {reply['ack']}\n".encode('utf-8'))
+        except Exception as e:
+            log.error(f"[worker {self.worker_id}] Error handling Morse client {client_address}: {e}")
+        finally:
+            self.turns.done(ip, ticket)
+            client_socket.close()
+            self.admission.release()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Device port worker (started by main.py --ingest-workers)")
+    parser.add_argument('--owner', default=DEFAULT_INGEST_PATH, help="Unix socket of the owner process")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--worker-id', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1, help="workers sharing the port")
+    parser.add_argument('--max-connections', type=int, default=64)
+    parser.add_argument('--connect-rate', type=float, default=20.0)
+    parser.add_argument('--timeout', type=float, default=5.0)
+    args = parser.parse_args()
+    cwlog.setup()
+
+    worker = IngestWorker(args.owner, args.host, args.port, args.worker_id, args.workers,
+                          args.max_connections, args.connect_rate, args.timeout)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
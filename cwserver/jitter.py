@@ -0,0 +1,136 @@
+# jitter.py - Playout buffer ordering device events by keying time
+#
+# Arrival time is a poor clock for word gaps: Wi-Fi jitter and the Pico's
+# blocking sends bunch characters together and stretch the gaps between
+# them.  Every record carries the character's keying time (TIME) on the
+# device clock, so events are mapped onto the server clock instead:
+#
+#   offset      min over recent (arrival - TIME) of that device and boot,
+#               i.e. the device clock seen through the fastest delivery
+#   keyed at    TIME + offset
+#   jitter      (arrival - TIME) - offset: network jitter plus the time a
+#               character waited behind a blocking send on the device
+#
+# Events are released in keying order once the playout clock (now - delay)
+# passes them.  The delay follows the 95th percentile of recent jitter
+# between a floor and a ceiling, so a quiet network costs a few tens of
+# milliseconds and a bad one gets the room it needs.  Word-gap and newline
+# decisions then compare the playout clock with the keying time of the
+# last released character.
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger('cw')
+
+OFFSET_WINDOW = 128   # arrivals per device used for the offset
+JITTER_WINDOW = 256   # jitter samples used for the delay
+
+
+class JitterBuffer:
+    """Reorders events by device keying time and releases them after a delay.
+
+    ``release(device, keyed_at, payload)`` is called from the buffer's own
+    thread in keying order.
+    """
+
+    def __init__(self, release, min_delay=0.04, max_delay=0.5):
+        self.release = release
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.delay = min_delay
+
+        self.offsets = {}   # (device, boot) -> deque of arrival - TIME
+        self.jitter = deque(maxlen=JITTER_WINDOW)
+        self.heap = []
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+        self.running = False
+
+        # Counters
+        self.buffered = 0
+        self.released = 0
+        self.late = 0
+
+    def start(self):
+        self.running = True
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def now(self):
+        """Playout clock: the server time events are being released at"""
+        return time.time() - self.delay
+
+    def offset(self, device, boot, device_time, arrival):
+        """Device clock -> server clock offset, updating the jitter estimate"""
+        samples = self.offsets.get((device, boot))
+        if samples is None:
+            # A new boot restarts the device clock; forget the old one
+            self._forget(device)
+            samples = self.offsets[(device, boot)] = deque(maxlen=OFFSET_WINDOW)
+        sample = arrival - device_time
+        samples.append(sample)
+        offset = min(samples)
+        self.jitter.append(sample - offset)
+        return offset
+
+    def forget(self, device):
+        """Drop the clock offset of a device that went away"""
+        with self.cond:
+            self._forget(device)
+
+    def _forget(self, device):
+        for key in [key for key in self.offsets if key[0] == device]:
+            del self.offsets[key]
+
+    def adapt(self):
+        """Delay = 95th percentile of recent jitter, within the limits"""
+        ordered = sorted(self.jitter)
+        p95 = ordered[int(0.95 * (len(ordered) - 1))]
+        self.delay = min(self.max_delay, max(self.min_delay, p95))
+
+    def push(self, device, boot, records, arrival=None):
+        """Buffer the (device time, payload) records of one delivery"""
+        arrival = arrival or time.time()
+        with self.cond:
+            for device_time, payload in records:
+                keyed_at = device_time + self.offset(device, boot, device_time, arrival)
+                if keyed_at + self.delay < arrival:
+                    self.late += 1  # Released straight away, still in order
+                heapq.heappush(self.heap, (keyed_at, next(self.counter), device, payload))
+                self.buffered += 1
+            self.adapt()
+            self.cond.notify()
+
+    def run(self):
+        while self.running:
+            with self.cond:
+                if not self.heap:
+                    self.cond.wait(1.0)
+                    continue
+                keyed_at = self.heap[0][0]
+                wait = keyed_at + self.delay - time.time()
+                if wait > 0:
+                    self.cond.wait(wait)
+                    continue
+                _, _, device, payload = heapq.heappop(self.heap)
+                self.released += 1
+            try:
+                self.release(device, keyed_at, payload)
+            except Exception as e:
+                log.error(f"Jitter buffer release error: {e}")
+
+    def stats(self):
+        with self.cond:
+            return {
+                'delay_ms': round(self.delay * 1000, 1),
+                'pending': len(self.heap),
+                'devices': len(self.offsets),
+                'buffered': self.buffered,
+                'released': self.released,
+                'late': self.late
+            }
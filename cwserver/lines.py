@@ -0,0 +1,132 @@
+# lines.py - Per-device line assemblers for --line-mode per-device
+#
+# In the default shared mode every device writes into one current line, so
+# two operators keying at once interleave letter by letter.  In per-device
+# mode each device gets its own assembler: current line, word-gap timer and
+# a shard of completed lines, each behind its own lock.  The merged view is
+# produced on demand by merging the shards by completion time.
+import heapq
+import threading
+import time
+from collections import deque
+
+
+class LineAssembler:
+    """Current line, word-gap timer and line history of one device"""
+
+    def __init__(self, device, color=None, line_length=100, word_gap_time=1.5,
+                 newline_timeout=8.0, max_lines=50):
+        self.device = device
+        self.color = color
+        self.line_length = line_length
+        self.word_gap_time = word_gap_time
+        self.newline_timeout = newline_timeout
+
+        self.current_line = ""
+        self.last_char_time = time.time()
+        self.auto_space_added = False
+        self.lines = deque(maxlen=max_lines)
+        self.line_count = 0
+        self.lock = threading.Lock()
+
+    def add_character(self, char, now):
+        """Append a character; returns the line it pushed out when full"""
+        with self.lock:
+            completed = None
+            if len(self.current_line) >= self.line_length:
+                completed = self._end_line(now)
+            self.current_line += char
+            self.last_char_time = now
+            self.auto_space_added = False
+            return completed
+
+    def add_space(self):
+        """Append a word space; False if there is nothing to separate"""
+        with self.lock:
+            self.auto_space_added = True
+            if (self.current_line and
+                    not self.current_line.endswith(" ") and
+                    len(self.current_line) < self.line_length):
+                self.current_line += " "
+                return True
+            return False
+
+    def end_line(self, now):
+        """Complete the current line; returns it, or None if it was blank"""
+        with self.lock:
+            return self._end_line(now)
+
+    def _end_line(self, now):
+        line = None
+        if self.current_line.strip():
+            self.line_count += 1
+            line = {
+                'text': self.current_line,
+                'line_num': self.line_count,
+                'timestamp': now,
+                'device': self.device,
+                'color': self.color
+            }
+            self.lines.append(line)
+        self.current_line = ""
+        return line
+
+    def check_gap(self, now):
+        """'space' after a word gap, 'line' after the newline timeout, else None"""
+        if not self.current_line:
+            return None
+        idle = now - self.last_char_time
+        if idle > self.newline_timeout:
+            return 'line'
+        if idle > self.word_gap_time and not self.auto_space_added:
+            return 'space'
+        return None
+
+    def apply(self, event, data):
+        """Mirror an event broadcast by the ingest process (web role)"""
+        with self.lock:
+            if event == 'new_character':
+                self.current_line += data['char']
+            elif event == 'auto_space':
+                self.current_line += " "
+            elif event == 'line_complete':
+                self.lines.append(data)
+                self.line_count = data['line_num']
+                self.current_line = ""
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'device': self.device,
+                'color': self.color,
+                'current_line': self.current_line,
+                'line_count': self.line_count,
+                'lines': list(self.lines)
+            }
+
+    @classmethod
+    def from_snapshot(cls, snapshot, **options):
+        assembler = cls(snapshot['device'], snapshot['color'], **options)
+        assembler.current_line = snapshot['current_line']
+        assembler.line_count = snapshot['line_count']
+        assembler.lines.extend(snapshot['lines'])
+        return assembler
+
+
+def merge_lines(assemblers, per_device=None):
+    """Completed lines of every shard in one list ordered by completion time"""
+    shards = []
+    for assembler in assemblers:
+        with assembler.lock:
+            shard = list(assembler.lines)
+        shards.append(shard[-per_device:] if per_device else shard)
+    return list(heapq.merge(*shards, key=lambda line: line['timestamp']))
+
+
+def current_lines(assemblers):
+    """Lines still being keyed, by device"""
+    return {
+        assembler.device: {'text': assembler.current_line, 'color': assembler.color}
+        for assembler in assemblers
+        if assembler.current_line
+    }
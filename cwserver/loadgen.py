@@ -0,0 +1,108 @@
+# loadgen.py - Device port load generator
+#
+# Simulates many devices sending characters to the device port and reports
+# the acknowledged message rate.  Each message is a one-record BATCH, so the
+# server answers with an ACK once the character has been applied and the
+# rate measured is end to end.  Devices use source addresses 127.0.0.1-254
+# so the server sees them as separate devices.
+#
+# Compare worker counts against the same load, with the per-device limits
+# raised so they don't cap the run:
+#
+#   python main.py --ingest-workers 4 --max-connects-per-sec 1e6 --max-chars-per-sec 1e6
+#   python loadgen.py --processes 8 --duration 10
+import argparse
+import multiprocessing
+import socket
+import sys
+import time
+
+
+def send_one(host, port, source_ip, boot, seq):
+    """Send one character as a batch and wait for its ACK; True on success"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(5.0)
+        if source_ip:
+            sock.bind((source_ip, 0))
+        sock.connect((host, port))
+        sock.sendall(
+            f"BATCH: {boot}\nNOW: {time.monotonic()}\n"
+            f"\nSEQ: {seq}\nCHAR: E\nMORSE: .\nTIME: {time.monotonic()}\n"
+            f"\nEND\n".encode('utf-8'))
+        reply = sock.recv(64)
+        return reply.startswith(b"ACK:")
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def device_loop(host, port, source_ip, boot, deadline, results):
+    """One simulated device: send characters back to back until the deadline"""
+    sent = 0
+    failed = 0
+    seq = 0
+    while time.monotonic() < deadline:
+        if send_one(host, port, source_ip, boot, seq):
+            sent += 1
+        else:
+            failed += 1
+        seq += 1
+    results.put((sent, failed))
+
+
+def generator_process(index, args, deadline, results):
+    import threading
+
+    threads = []
+    for i in range(args.devices):
+        device = index * args.devices + i
+        source_ip = f"127.0.0.{device % 254 + 1}" if args.host.startswith('127.') else None
+        thread = threading.Thread(
+            target=device_loop,
+            args=(args.host, args.port, source_ip, f"load{device:04d}", deadline, results))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the device port with simulated devices")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--processes', type=int, default=4, help="generator processes")
+    parser.add_argument('--devices', type=int, default=8, help="simulated devices per process")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds to run")
+    args = parser.parse_args()
+
+    results = multiprocessing.Queue()
+    start = time.monotonic()
+    deadline = start + args.duration
+    processes = [
+        multiprocessing.Process(target=generator_process, args=(i, args, deadline, results))
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    sent = 0
+    failed = 0
+    for _ in range(args.processes * args.devices):
+        device_sent, device_failed = results.get()
+        sent += device_sent
+        failed += device_failed
+    for process in processes:
+        process.join()
+    elapsed = time.monotonic() - start
+
+    print(f"{args.processes * args.devices} devices, {elapsed:.1f}s: "
+          f"{sent} acknowledged ({sent / elapsed:,.0f}/s), {failed} failed")
+    if failed:
+        print("Failures usually mean the per-device limits were hit: start the server "
+              "with --max-connects-per-sec 1e6 --max-chars-per-sec 1e6")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
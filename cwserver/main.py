@@ -1,24 +1,109 @@
 # flask_server.py - Flask Web Server for Broadcasting Morse Code
-from flask import Flask, render_template, request, jsonify
+import sys
+
+ASYNC_MODES = ('threading', 'eventlet', 'gevent')
+
+def requested_async_mode(argv):
+    """Read --async-mode from the command line before anything is imported"""
+    for i, arg in enumerate(argv):
+        if arg == '--async-mode' and i + 1 < len(argv):
+            return argv[i + 1]
+        if arg.startswith('--async-mode='):
+            return arg.split('=', 1)[1]
+    return 'threading'
+
+# eventlet and gevent have to patch the standard library (socket, threading,
+# time) before any other module grabs a reference to it
+ASYNC_MODE = requested_async_mode(sys.argv) if __name__ == '__main__' else 'threading'
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+from flask import Flask, Response, request, jsonify
 from flask_socketio import SocketIO, emit, disconnect
 import socket
 import threading
-import datetime
 import time
 import json
-from collections import deque
+import argparse
+import atexit
+import hmac
+import os
+import signal
+import tracemalloc
+from collections import OrderedDict, deque
 
-app = Flask(__name__)
+# morse_decoder.py lives at the repository root so it can be copied to the Pico as is
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from morse_decoder import MorseDecoder
+import cwlog
+from cwlog import log, char_log
+
+import bus
+import outbox
+import frames
+import replay
+import admission
+import lines
+import ingest
+import history
+import transcript
+import export
+import assets
+import jitter
+import stats
+import snapshot
+import relay
+import profiling
+
+app = Flask(__name__, static_folder=None)  # Assets are served by assets.py
 app.config['SECRET_KEY'] = 'morse_code_secret_2024'
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+socketio = SocketIO()
+outboxes = outbox.OutboxDispatcher(socketio)
+asset_store = assets.AssetStore()
+asset_store.init_app(app)
 
 class MorseFlaskServer:
     def __init__(self):
         # Server settings
+        self.role = 'standalone'  # 'standalone', 'ingest' or 'web'
         self.morse_host = '0.0.0.0'
         self.morse_port = 12345
         self.server_socket = None
         self.running = False
+        self.client_timeout = 5.0
+        
+        # Re-decodes characters older firmware could not resolve
+        self.decoder = MorseDecoder()
+        self.known_symbols = frozenset(self.decoder.symbols[1:]) | {"?"}
+        
+        # Admission control on the device port
+        self.admission = admission.AdmissionControl()
+        
+        # Store-and-forward batches: last (boot id, sequence number) per device,
+        # kept past the device's expiry so a late resend is still deduplicated;
+        # the least recently updated go first once max_device_sequences is reached
+        self.device_sequences = OrderedDict()
+        self.max_device_sequences = 4096
+        self.max_message_size = 65536
+        self.max_batch_records = 256
+        
+        # Playout buffer ordering live characters by keying time (see
+        # jitter.py), None = apply them as they arrive
+        self.jitter = None
+        
+        # Relay links to other servers (see relay.py); node_id names this
+        # server in the origin and path of relayed characters
+        self.node_id = socket.gethostname()
+        self.relays = []
+        self.relay_seen = relay.RecentIds()
+        
+        # Device port worker processes (see ingest.py), 0 = accept in-process
+        self.ingest_workers = 0
+        self.ingest_owner = None
         
         # Text display settings
         self.current_line = ""
@@ -27,26 +112,63 @@ class MorseFlaskServer:
         self.word_gap_time = 1.5
         self.newline_timeout = 8.0
         
+        # 'shared': one line for everyone; 'per-device': one assembler per
+        # device (see lines.py)
+        self.line_mode = 'shared'
+        self.assemblers = {}
+        
         # Device tracking
         self.connected_devices = {}
         self.device_colors = ['#e74c3c', '#2ecc71', '#3498db', '#f39c12', '#9b59b6', '#1abc9c']
         self.next_color_index = 0
         
+        # Device list deltas: every add/remove/update bumps the version
+        self.device_version = 0
+        self.device_lock = threading.Lock()
+        self.dirty_devices = set()
+        self.device_update_interval = 1.0
+        self.last_device_flush = 0
+        
         # Web clients tracking
         self.web_clients = set()
+        self.stream_readers = 0  # /api/stream (SSE) connections
+        self.relay_readers = 0   # /api/relay links from other servers
+        self.admin_token = None  # enables /api/admin/* (--admin-token)
         
         # Message history for new clients
-        self.message_history = deque(maxlen=1000)  # Keep last 1000 characters
+        self.message_history = history.CharHistory(100000)  # Columnar, ~1.4 MB
         self.line_history = deque(maxlen=50)      # Keep last 50 lines
         
+        # Searchable transcript of completed lines (/api/query)
+        self.transcript = transcript.TranscriptIndex(20000)
+        
+        # Speed and activity per device and for the channel (see stats.py)
+        self.stats = stats.StatsEngine()
+        self.current_line_devices = set()
+        
         # Auto-spacing control
         self.auto_space_added = False
         
-        # Start timeout checker
-        self.start_timeout_checker()
+        # Connect-time snapshot, rebuilt only after the state changes
+        self.state_version = 0
+        # Held by every thread that changes the lines or devices (device
+        # connections, the jitter buffer, the timeout checker, relay links,
+        # replay, clear) so collect_state() sees them consistent
+        self.state_lock = threading.RLock()
+        self.connect_snapshot = (None, None)
+        self.local_ip = None
+        
+        # Session recording (see replay.py)
+        self.recorder = None
+        
+        # Bus snapshot interval (ingest role)
+        self.snapshot_interval = 5.0
+        self.last_snapshot_time = 0
         
     def start_morse_server(self):
         """Start the Morse code receiver server"""
+        if self.ingest_workers:
+            return self.start_ingest_workers()
         try:
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -54,7 +176,10 @@ class MorseFlaskServer:
             self.server_socket.listen(10)
             self.running = True
             
-            print(f"Morse receiver started on {self.morse_host}:{self.morse_port}")
+            log.info(f"Morse receiver started on {self.morse_host}:{self.morse_port}")
+            
+            # Start timeout checker
+            self.start_timeout_checker()
             
             # Start server thread
             server_thread = threading.Thread(target=self.morse_server_loop)
@@ -64,15 +189,53 @@ class MorseFlaskServer:
             return True
             
         except Exception as e:
-            print(f"Failed to start Morse server: {e}")
+            log.error(f"Failed to start Morse server: {e}")
+            return False
+    
+    def start_ingest_workers(self):
+        """Hand the device port to worker processes and apply what they forward"""
+        try:
+            # Looked up per message so the profiler's span wrapper applies
+            self.ingest_owner = ingest.IngestOwner(lambda message: self.handle_forwarded(message))
+            self.ingest_owner.start()
+            self.ingest_owner.spawn_workers(
+                self.ingest_workers, self.morse_host, self.morse_port,
+                max_connections=self.admission.max_concurrent,
+                connect_rate=self.admission.connect_rate,
+                timeout=self.client_timeout)
+            atexit.register(self.ingest_owner.stop)
+            self.running = True
+            
+            log.info(f"Morse receiver started on {self.morse_host}:{self.morse_port}")
+            self.start_timeout_checker()
+            return True
+            
+        except Exception as e:
+            log.error(f"Failed to start Morse server: {e}")
             return False
     
+    def handle_forwarded(self, message):
+        """Apply a message parsed by an ingest worker; returns the worker's reply"""
+        client_ip = message['ip']
+        with self.state_lock:
+            self.register_device(client_ip)
+            if message['kind'] == 'batch':
+                return {'ack': self.apply_batch(message['header'], message['records'], client_ip)}
+            fields = message['fields']
+            self.process_character(fields.get('CHAR'), fields.get('MORSE'), client_ip)
+            return {}
+    
     def morse_server_loop(self):
         """Main Morse server loop"""
         while self.running:
             try:
                 client_socket, client_address = self.server_socket.accept()
                 
+                # Reject floods before spending a thread or any parsing on them
+                if not self.admission.admit_connection(client_address[0]):
+                    client_socket.close()
+                    continue
+                
                 # Handle client in separate thread
                 client_thread = threading.Thread(
                     target=self.handle_morse_client, 
@@ -83,159 +246,408 @@ class MorseFlaskServer:
                 
             except socket.error as e:
                 if self.running:
-                    print(f"Morse socket error: {e}")
+                    log.error(f"Morse socket error: {e}")
     
     def handle_morse_client(self, client_socket, client_address):
         """Handle Morse code from devices"""
         client_ip = client_address[0]
         
-        # Assign color to device if new
+        with self.state_lock:
+            self.register_device(client_ip)
+        
+        try:
+            client_socket.settimeout(self.client_timeout)
+            data = ingest.read_device_message(client_socket, self.max_message_size).decode('utf-8')
+            
+            if data.startswith("BATCH:"):
+                last_seq = self.process_batch(data, client_ip)
+                client_socket.sendall(f"ACK: {last_seq}\n".encode('utf-8'))
+            elif data:
+                self.process_morse_data(data, client_ip)
+                
+        except Exception as e:
+            log.error(f"Error handling Morse client {client_address}: {e}")
+        finally:
+            client_socket.close()
+            self.admission.release()
+    
+    def register_device(self, client_ip, device_color=None):
+        """Assign a color to a new device and refresh its last seen time"""
         if client_ip not in self.connected_devices:
-            device_color = self.device_colors[self.next_color_index % len(self.device_colors)]
+            if device_color is None:
+                device_color = self.device_colors[self.next_color_index % len(self.device_colors)]
+                self.next_color_index += 1
             self.connected_devices[client_ip] = {
                 'color': device_color,
                 'last_seen': time.time(),
                 'char_count': 0
             }
-            self.next_color_index += 1
             
             # Broadcast device connection to web clients
-            self.broadcast_device_update()
-            print(f"New device connected: {client_ip}")
+            self.broadcast_device_delta('add', client_ip)
+            log.info("New device connected: %s", client_ip, extra={'fields': {'device': client_ip}})
         
         # Update last seen time
         self.connected_devices[client_ip]['last_seen'] = time.time()
-        
-        try:
-            data = client_socket.recv(1024).decode('utf-8')
-            
-            if data:
-                self.process_morse_data(data, client_ip)
-                
-        except Exception as e:
-            print(f"Error handling Morse client {client_address}: {e}")
-        finally:
-            client_socket.close()
     
     def process_morse_data(self, data, client_ip):
         """Process received morse code data"""
+        fields = ingest.parse_fields(data)
+        with self.state_lock:
+            self.process_character(fields.get('CHAR'), fields.get('MORSE'), client_ip)
+    
+    def process_batch(self, data, client_ip):
+        """Apply a store-and-forward batch; returns the last sequence number taken"""
+        header, records = ingest.parse_batch(data, self.max_batch_records)
+        with self.state_lock:
+            return self.apply_batch(header, records, client_ip)
+    
+    def apply_batch(self, header, records, client_ip):
+        """Apply parsed batch records in sequence order.
+        
+        Device timestamps are relative to the device clock, so each event is
+        placed at server time NOW - (device NOW - event TIME).  A batch with a
+        backlog keeps its own word and line breaks and is not spliced into the
+        line other devices are keying.
+        """
+        boot = header.get('BATCH', '')
+        now = time.time()
         try:
-            lines = data.strip().split('\n')
-            char = None
-            morse = None
+            device_now = float(header['NOW'])
+        except (KeyError, ValueError):
+            device_now = None
+        
+        seen_boot, last_seq = self.device_sequences.get(client_ip, (None, -1))
+        if seen_boot != boot:
+            last_seq = -1  # Device rebooted, sequence numbers start over
+        
+        # Live deliveries go through the jitter buffer, which decides the
+        # breaks from keying times; a backlog keeps its own breaks below
+        buffered = []
+        use_jitter = False
+        if self.jitter is not None and device_now is not None and records:
+            try:
+                use_jitter = device_now - float(records[0][1]['TIME']) < self.newline_timeout
+            except (KeyError, ValueError):
+                pass
+        
+        backlog = len(records) > 1 and not use_jitter
+        previous_time = None
+        delivered = 0
+        for seq, fields in records:
+            if seq <= last_seq:
+                continue  # Already applied, the device missed our ACK
+            last_seq = seq
+            
+            if use_jitter:
+                try:
+                    keyed = float(fields['TIME'])
+                except (KeyError, ValueError):
+                    keyed = device_now
+                buffered.append((keyed, (fields.get('CHAR'), fields.get('MORSE'))))
+                continue
+            
+            timestamp = now
+            if device_now is not None:
+                try:
+                    timestamp = now - max(0.0, device_now - float(fields['TIME']))
+                except (KeyError, ValueError):
+                    pass
             
-            for line in lines:
-                if line.startswith("CHAR:"):
-                    char = line.replace("CHAR:", "").strip()
-                elif line.startswith("MORSE:"):
-                    morse = line.replace("MORSE:", "").strip()
+            if backlog:
+                if fields.get('CHAR') == "[SPACE]":
+                    # Word gaps the device saw while the link was down
+                    self.add_auto_space(client_ip)
+                elif previous_time is None:
+                    self.add_new_line(client_ip)
+                elif timestamp - previous_time > self.newline_timeout:
+                    self.add_new_line(client_ip)
+                elif timestamp - previous_time > self.word_gap_time:
+                    self.add_auto_space(client_ip)
+                previous_time = timestamp
             
+            # Backlogs are bounded by max_batch_records instead of the char rate
+            if self.process_character(fields.get('CHAR'), fields.get('MORSE'), client_ip,
+                                      timestamp, rate_limit=not backlog):
+                delivered += 1
+        
+        if buffered:
+            self.jitter.push(client_ip, boot, buffered, now)
+            delivered = len(buffered)
+        
+        self.device_sequences[client_ip] = (boot, last_seq)
+        self.device_sequences.move_to_end(client_ip)
+        while len(self.device_sequences) > self.max_device_sequences:
+            self.device_sequences.popitem(last=False)
+        if backlog:
+            log.info(f"[BATCH] {client_ip} delivered {delivered} buffered characters")
+        return last_seq
+    
+    def release_buffered(self, device, keyed_at, payload):
+        """A character leaving the jitter buffer, in keying order"""
+        char, morse = payload
+        with self.state_lock:
+            self.process_character(char, morse, device, keyed_at, playout=True)
+    
+    def process_character(self, char, morse, client_ip, timestamp=None, rate_limit=True, playout=False):
+        """Apply one decoded character from a device; True if it was added.
+        
+        ``playout`` characters come from the jitter buffer and time word
+        gaps by ``timestamp`` instead of by arrival.
+        """
+        try:
             if char and morse:
                 # Skip explicit space characters
                 if char == "[SPACE]":
-                    return
+                    return False
+                
+                # Per-device character rate cap
+                if rate_limit and not self.admission.admit_char(client_ip):
+                    return False
+                
+                char = self.checked_char(char, morse)
                 
                 # Update device stats
                 self.connected_devices[client_ip]['char_count'] += 1
                 self.connected_devices[client_ip]['last_seen'] = time.time()
+                self.dirty_devices.add(client_ip)
                 
                 # Process character
                 device_color = self.connected_devices[client_ip]['color']
-                self.add_character(char, client_ip, device_color, morse)
+                self.add_character(char, client_ip, device_color, morse, timestamp, playout)
+                self.stats.record(client_ip, timestamp or time.time(), morse)
                 
                 # Broadcast to web clients
-                self.broadcast_character(char, client_ip, device_color, morse)
+                self.broadcast_character(char, client_ip, device_color, morse, timestamp)
                 
-                # Console log
-                timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-                device_count = len(self.connected_devices)
-                print(f"[{timestamp}] {client_ip} -> {char} ({morse}) [Devices: {device_count}]")
+                # Console log (formatted and written off this thread)
+                char_log.info("%s -> %s (%s) [Devices: %d]", client_ip, char, morse, len(self.connected_devices),
+                              extra={'fields': {'device': client_ip, 'char': char, 'morse': morse}})
+                return True
                 
         except Exception as e:
-            print(f"Error processing Morse data: {e}")
+            log.error(f"Error processing Morse data: {e}")
+        return False
     
-    def add_character(self, char, client_ip, device_color, morse):
-        """Add character to internal text buffer"""
-        self.auto_space_added = False
+    def checked_char(self, char, morse):
+        """A symbol from the decoder table for what a device or relay sent"""
+        # Devices with the old A-Z/0-9 table send '?' for everything else
+        if char == "?" and morse != "..--..":
+            return self.decoder.decode(morse) or "?"
+        # Anything outside the table would grow the history's symbol table
+        if char not in self.known_symbols:
+            return self.decoder.decode(morse) or "?"
+        return char
+    
+    def add_character(self, char, client_ip, device_color, morse, timestamp=None, playout=False):
+        """Add character to internal text buffer
         
-        # Check if we need a new line
-        if len(self.current_line) >= self.line_length:
-            self.add_new_line()
+        ``timestamp`` is when the character was keyed if it arrives late
+        (store-and-forward); history stays in keying order.  Word gaps are
+        timed from arrival, or from ``timestamp`` for ``playout`` characters
+        (see check_timeouts).
+        """
+        self.mark_state_changed()
+        char_time = timestamp if playout and timestamp else time.time()
         
-        # Add character to current line
-        self.current_line += char
-        self.last_char_time = time.time()
+        if self.line_mode == 'per-device':
+            assembler = self.get_assembler(client_ip, device_color)
+            completed = assembler.add_character(char, char_time)
+            if completed:
+                self.broadcast_device_line(completed)
+        else:
+            self.auto_space_added = False
+            
+            # Check if we need a new line
+            if len(self.current_line) >= self.line_length:
+                self.add_new_line()
+            
+            # Add character to current line
+            self.current_line += char
+            self.current_line_devices.add(client_ip)
+            self.last_char_time = max(self.last_char_time, char_time)
         
-        # Store in history
-        char_data = {
-            'char': char,
-            'color': device_color,
-            'device': client_ip,
-            'morse': morse,
-            'timestamp': time.time()
-        }
-        self.message_history.append(char_data)
+        if self.recorder:
+            self.recorder.record('char', char=char, device=client_ip, color=device_color, morse=morse)
+        
+        # Store in history (late characters go to their place in time order)
+        self.message_history.append(char, client_ip, device_color, morse,
+                                    timestamp or time.time())
     
-    def add_new_line(self):
-        """Start a new line"""
+    def add_new_line(self, device=None):
+        """Start a new line (the device's own line in per-device mode)"""
+        if self.line_mode == 'per-device':
+            if device in self.assemblers:
+                self.end_device_line(self.assemblers[device])
+            return
+        
+        self.mark_state_changed()
         if self.current_line.strip():
             line_data = {
                 'text': self.current_line,
                 'line_num': len(self.line_history) + 1,
-                'timestamp': time.time()
+                'timestamp': time.time(),
+                'devices': sorted(self.current_line_devices)
             }
             self.line_history.append(line_data)
+            self.index_line(line_data)
+            if self.recorder:
+                self.recorder.record('newline')
             
             # Broadcast line completion to web clients
-            socketio.emit('line_complete', line_data)
+            self.broadcast('line_complete', line_data)
         
         self.current_line = ""
+        self.current_line_devices = set()
+        self.publish_snapshot()
     
-    def add_auto_space(self):
+    def add_auto_space(self, device=None):
         """Add automatic space"""
+        if self.line_mode == 'per-device':
+            if device in self.assemblers:
+                self.add_device_space(self.assemblers[device])
+            return
+        
         if (self.current_line and 
             not self.current_line.endswith(" ") and 
             len(self.current_line) < self.line_length):
             
             self.current_line += " "
+            self.mark_state_changed()
+            if self.recorder:
+                self.recorder.record('space')
             
             # Broadcast auto-space to web clients
-            socketio.emit('auto_space', {
+            self.broadcast('auto_space', {
                 'type': 'space',
                 'timestamp': time.time()
             })
             
-            print(f"[AUTO] Added space after {self.word_gap_time}s pause")
+            char_log.info("[AUTO] Added space after %ss pause", self.word_gap_time)
+    
+    def get_assembler(self, device, color=None):
+        """Line assembler of one device, created on its first character"""
+        assembler = self.assemblers.get(device)
+        if assembler is None:
+            assembler = self.assemblers.setdefault(device, lines.LineAssembler(
+                device, color, self.line_length, self.word_gap_time, self.newline_timeout))
+        return assembler
+    
+    def add_device_space(self, assembler):
+        """Word gap on one device's line"""
+        if assembler.add_space():
+            self.mark_state_changed()
+            if self.recorder:
+                self.recorder.record('space', device=assembler.device)
+            self.broadcast('auto_space', {
+                'type': 'space',
+                'device': assembler.device,
+                'timestamp': time.time()
+            })
+    
+    def end_device_line(self, assembler):
+        """Complete one device's line"""
+        line = assembler.end_line(time.time())
+        if line:
+            self.broadcast_device_line(line)
+    
+    def broadcast_device_line(self, line):
+        self.mark_state_changed()
+        self.index_line(line)
+        if self.recorder:
+            self.recorder.record('newline', device=line['device'])
+        self.broadcast('line_complete', line)
+    
+    def index_line(self, line):
+        """Add a completed line to the transcript index"""
+        devices = line.get('devices') or ([line['device']] if line.get('device') else [])
+        self.transcript.add(line['text'], devices, line['timestamp'])
+    
+    def check_device_gaps(self, now):
+        """Per-device word gaps and line timeouts"""
+        for assembler in list(self.assemblers.values()):
+            gap = assembler.check_gap(now)
+            if gap == 'space':
+                self.add_device_space(assembler)
+            elif gap == 'line':
+                self.end_device_line(assembler)
     
     def start_timeout_checker(self):
         """Start the timeout checker thread"""
         def timeout_checker():
             while True:
                 try:
-                    current_time = time.time()
-                    time_since_last_char = current_time - self.last_char_time
-                    
-                    if self.current_line and not self.auto_space_added:
-                        if time_since_last_char > self.word_gap_time:
-                            self.add_auto_space()
-                            self.auto_space_added = True
-                        elif time_since_last_char > self.newline_timeout:
-                            self.add_new_line()
-                            self.auto_space_added = True
-                    
-                    # Clean up old devices
-                    self.cleanup_old_devices()
-                    
+                    with self.state_lock:
+                        self.check_timeouts(time.time())
                     time.sleep(0.1)
                     
                 except Exception as e:
-                    print(f"Timeout checker error: {e}")
+                    log.error(f"Timeout checker error: {e}")
                     time.sleep(1)
         
         timeout_thread = threading.Thread(target=timeout_checker)
         timeout_thread.daemon = True
         timeout_thread.start()
     
+    def check_timeouts(self, current_time):
+        """One pass of the timeout checker"""
+        # With the jitter buffer, gaps are measured on its playout clock
+        # against keying times
+        now = self.jitter.now() if self.jitter else current_time
+        time_since_last_char = now - self.last_char_time
+        
+        if self.line_mode == 'per-device':
+            self.check_device_gaps(now)
+        elif self.current_line:
+            if time_since_last_char > self.newline_timeout:
+                self.add_new_line()
+                self.auto_space_added = True
+            elif time_since_last_char > self.word_gap_time and not self.auto_space_added:
+                self.add_auto_space()
+                self.auto_space_added = True
+        
+        # Clean up old devices
+        self.cleanup_old_devices()
+        
+        # Coalesced char_count/last_seen updates
+        if current_time - self.last_device_flush > self.device_update_interval:
+            self.flush_device_updates()
+            self.last_device_flush = current_time
+        
+        # Keep web workers' mirrors fresh
+        if current_time - self.last_snapshot_time > self.snapshot_interval:
+            self.publish_snapshot()
+    
+    def structure_sizes(self):
+        """Size and bound (None if unbounded) of the long-lived structures"""
+        return {
+            'connected_devices': [len(self.connected_devices), None],
+            'web_clients': [len(self.web_clients), None],
+            'stream_readers': [self.stream_readers, None],
+            'outbox_clients': [len(outboxes.clients), None],
+            'frame_log': [len(outboxes.frame_log.frames), outboxes.frame_log.frames.maxlen],
+            'device_sequences': [len(self.device_sequences), self.max_device_sequences],
+            'jitter_offsets': [len(self.jitter.offsets) if self.jitter else 0, None],
+            'assemblers': [len(self.assemblers), None],
+            'admission_devices': [len(self.admission.devices), self.admission.max_tracked],
+            'dirty_devices': [len(self.dirty_devices), None],
+            'message_history': [len(self.message_history), self.message_history.capacity],
+            'line_history': [len(self.line_history), self.line_history.maxlen],
+            'transcript': [len(self.transcript), self.transcript.capacity],
+            'transcript_vocabulary': [len(self.transcript.vocabulary), None],
+            'device_stats': [len(self.stats.devices), None],
+            'relay_seen': [len(self.relay_seen.ids), self.relay_seen.maxlen]
+        }
+    
+    def profile_targets(self):
+        """Hot-path methods timed as spans while a profile runs"""
+        names = ['handle_forwarded', 'process_morse_data', 'apply_batch', 'process_character',
+                 'add_character', 'add_new_line', 'add_auto_space', 'check_timeouts',
+                 'broadcast', 'broadcast_character', 'broadcast_device_delta', 'broadcast_device_line']
+        targets = [(self, name) for name in names]
+        targets += [(outboxes, name) for name in ('add_client', 'remove_client', 'publish')]
+        return targets
+    
     def cleanup_old_devices(self):
         """Remove devices not seen for 30 seconds"""
         current_time = time.time()
@@ -245,59 +657,392 @@ class MorseFlaskServer:
             if current_time - info['last_seen'] > 30:
                 devices_to_remove.append(ip)
         
-        if devices_to_remove:
-            for ip in devices_to_remove:
-                del self.connected_devices[ip]
-                print(f"Device disconnected: {ip}")
+        for ip in devices_to_remove:
+            del self.connected_devices[ip]
+            self.dirty_devices.discard(ip)
+            self.stats.forget(ip)
+            if self.jitter:
+                self.jitter.forget(ip)
+            assembler = self.assemblers.pop(ip, None)
+            if assembler:
+                self.end_device_line(assembler)
+            log.info("Device disconnected: %s", ip, extra={'fields': {'device': ip}})
             
-            self.broadcast_device_update()
+            self.broadcast_device_delta('remove', ip)
+    
+    def flush_device_updates(self):
+        """Send one 'update' delta per device whose counters changed"""
+        dirty = self.dirty_devices
+        self.dirty_devices = set()
+        for ip in dirty:
+            if ip in self.connected_devices:
+                self.broadcast_device_delta('update', ip)
     
-    def broadcast_character(self, char, client_ip, device_color, morse):
-        """Broadcast character to all web clients"""
+    def broadcast(self, event, data=None):
+        """Send an event to every web client"""
+        if self.role == 'ingest':
+            # The bus carries it to the web workers
+            socketio.emit(event, data)
+        else:
+            outboxes.publish(event, data)
+    
+    def broadcast_character(self, char, client_ip, device_color, morse, timestamp=None, relayed=None):
+        """Broadcast character to all web clients
+        
+        ``relayed`` holds the origin, origin id and path of a character
+        received over a relay link.
+        """
         char_data = {
             'char': char,
             'color': device_color,
             'device': client_ip,
             'morse': morse,
-            'timestamp': time.time()
+            'timestamp': timestamp or time.time()
         }
-        socketio.emit('new_character', char_data)
+        if relayed:
+            char_data.update(relayed)
+        self.broadcast('new_character', char_data)
     
-    def broadcast_device_update(self):
-        """Broadcast device list update to web clients"""
-        device_list = []
-        for ip, info in self.connected_devices.items():
-            device_list.append({
-                'ip': ip,
-                'color': info['color'],
-                'char_count': info['char_count'],
-                'last_seen': info['last_seen']
+    def device_info(self, ip):
+        """Public view of one device"""
+        info = self.connected_devices[ip]
+        return {
+            'ip': ip,
+            'color': info['color'],
+            'char_count': info['char_count'],
+            'last_seen': info['last_seen'],
+            # Web workers keep the summary that came with the last delta
+            'stats': self.stats.summary(ip) or info.get('stats')
+        }
+    
+    def get_device_list(self):
+        """Full device list with the delta version it corresponds to"""
+        # Version first: deltas are idempotent, so a client re-applying one
+        # that is already in the list is harmless
+        version = self.device_version
+        device_list = [self.device_info(ip) for ip in list(self.connected_devices)]
+        return {
+            'devices': device_list,
+            'count': len(device_list),
+            'version': version
+        }
+    
+    def broadcast_device_delta(self, op, ip):
+        """Broadcast a single device 'add', 'remove' or 'update'"""
+        with self.device_lock:
+            self.device_version += 1
+            device = {'ip': ip} if op == 'remove' else self.device_info(ip)
+            self.mark_state_changed()
+            self.broadcast('device_delta', {
+                'version': self.device_version,
+                'op': op,
+                'device': device
             })
+    
+    def apply_relayed(self, link, events):
+        """Key characters received over a relay link into the local display"""
+        for event, data in events:
+            if event != 'new_character':
+                continue
+            device = data['device']  # '<origin node>/<device>'
+            data['char'] = self.checked_char(data['char'], data['morse'])
+            with self.state_lock:
+                self.register_device(device)
+                info = self.connected_devices[device]
+                info['char_count'] += 1
+                self.dirty_devices.add(device)
+                
+                self.add_character(data['char'], device, info['color'], data['morse'])
+                self.stats.record(device, time.time(), data['morse'])
+                self.broadcast_character(data['char'], device, info['color'], data['morse'], relayed={
+                    'origin': data['origin'],
+                    'origin_id': data['origin_id'],
+                    'path': data['path']
+                })
+            char_log.info("%s -> %s (%s) [relay %s]", device, data['char'], data['morse'], link.url,
+                          extra={'fields': {'device': device, 'char': data['char'], 'morse': data['morse'],
+                                            'origin': data['origin']}})
+    
+    def replay_event(self, event):
+        """Inject one recorded event as if it had just arrived"""
+        with self.state_lock:
+            if event['type'] == 'char':
+                client_ip = event['device']
+                self.register_device(client_ip, event['color'])
+                self.connected_devices[client_ip]['char_count'] += 1
+                self.dirty_devices.add(client_ip)
+                
+                device_color = self.connected_devices[client_ip]['color']
+                self.add_character(event['char'], client_ip, device_color, event['morse'])
+                self.stats.record(client_ip, time.time(), event['morse'])
+                self.broadcast_character(event['char'], client_ip, device_color, event['morse'])
+            elif event['type'] == 'space':
+                self.add_auto_space(event.get('device'))
+                self.auto_space_added = True
+            elif event['type'] == 'newline':
+                self.add_new_line(event.get('device'))
+    
+    def start_replay(self, path, speed=1.0):
+        """Play a recorded session into the live server in the background"""
+        def replay_worker():
+            try:
+                count, elapsed = replay.replay(replay.read_session(path), self.replay_event, speed)
+                log.info(f"[REPLAY] {count} events from {path} in {elapsed:.1f}s")
+            except Exception as e:
+                log.error(f"Replay error: {e}")
         
-        socketio.emit('device_update', {
-            'devices': device_list,
-            'count': len(device_list)
-        })
+        replay_thread = threading.Thread(target=replay_worker)
+        replay_thread.daemon = True
+        replay_thread.start()
+    
+    def clear_display(self):
+        """Clear all text and tell web clients"""
+        with self.state_lock:
+            self.mark_state_changed()
+            self.line_history.clear()
+            self.message_history.clear()
+            self.current_line = ""
+            self.current_line_devices = set()
+            self.assemblers.clear()
+            self.transcript.clear()
+        
+        self.broadcast('clear_display')
+        self.publish_snapshot()
+        log.info("📝 Display cleared by web client request")
+    
+    def get_snapshot(self):
+        """Display state needed by a web worker to serve history"""
+        return {
+            'lines': list(self.line_history),
+            'current_line': self.current_line,
+            'line_mode': self.line_mode,
+            'shards': [assembler.snapshot() for assembler in list(self.assemblers.values())],
+            'devices': self.get_device_list()
+        }
+    
+    def collect_state(self):
+        """Everything a restart needs, as snapshot sections (see snapshot.py)"""
+        with self.state_lock:
+            state = self.get_snapshot()
+            state.update({
+                'saved_at': time.time(),
+                'current_line_devices': sorted(self.current_line_devices),
+                'next_color_index': self.next_color_index,
+                'device_sequences': {ip: list(seq) for ip, seq in self.device_sequences.items()}
+            })
+            history, transcript = self.message_history.snapshot(), self.transcript.snapshot()
+        for device in state['devices']['devices']:
+            device.pop('stats', None)  # Rebuilt from new traffic
+        return snapshot.encode_state(state, history, transcript)
+    
+    def load_state(self, path):
+        """Continue from a snapshot written by collect_state()"""
+        state, chars, lines_kept = snapshot.decode_state(snapshot.read(path))
+        self.line_history.clear()
+        self.line_history.extend(state['lines'])
+        self.current_line = state['current_line']
+        self.current_line_devices = set(state['current_line_devices'])
+        if state['line_mode'] == self.line_mode:
+            self.assemblers = {
+                shard['device']: lines.LineAssembler.from_snapshot(
+                    shard, line_length=self.line_length, word_gap_time=self.word_gap_time,
+                    newline_timeout=self.newline_timeout)
+                for shard in state['shards']
+            }
+        self.connected_devices = {
+            device['ip']: {
+                'color': device['color'],
+                'last_seen': device['last_seen'],
+                'char_count': device['char_count']
+            }
+            for device in state['devices']['devices']
+        }
+        self.device_version = state['devices']['version']
+        self.next_color_index = state['next_color_index']
+        self.device_sequences = OrderedDict(
+            (ip, tuple(seq)) for ip, seq in state['device_sequences'].items())
+        self.message_history.restore(chars)
+        self.transcript.restore(lines_kept)
+        self.mark_state_changed()
+        return state['saved_at']
+    
+    def publish_snapshot(self):
+        """Send the display state to web workers over the bus"""
+        if self.role != 'ingest':
+            return
+        self.last_snapshot_time = time.time()
+        socketio.emit('history_snapshot', self.get_snapshot(), to=bus.MIRROR_ROOM)
+    
+    def on_bus_event(self, event, data, room):
+        """Apply an event received from the bus; True if it was consumed"""
+        if self.role == 'ingest':
+            if event == 'request_clear' and room == bus.INGEST_ROOM:
+                self.clear_display()
+            return True
+        
+        # Web worker: mirror the ingest process state
+        if room == bus.MIRROR_ROOM:
+            if event == 'history_snapshot':
+                self.mark_state_changed()
+                self.line_history.clear()
+                self.line_history.extend(data['lines'])
+                self.current_line = data['current_line']
+                self.line_mode = data.get('line_mode', 'shared')
+                self.assemblers = {
+                    shard['device']: lines.LineAssembler.from_snapshot(shard)
+                    for shard in data.get('shards', [])
+                }
+                self.apply_device_list(data['devices'])
+            return True
+        if room is not None:
+            # Addressed to one client: delivered locally if it is connected here
+            return room == bus.INGEST_ROOM
+        self.mark_state_changed()
+        if self.line_mode == 'per-device' and event in ('new_character', 'auto_space', 'line_complete'):
+            self.get_assembler(data['device'], data.get('color')).apply(event, data)
+            if event == 'line_complete':
+                self.index_line(data)
+            if event == 'new_character':
+                self.message_history.append(data['char'], data['device'], data['color'],
+                                            data['morse'], data['timestamp'])
+        elif event == 'new_character':
+            self.current_line += data['char']
+            self.message_history.append(data['char'], data['device'], data['color'],
+                                        data['morse'], data['timestamp'])
+        elif event == 'auto_space':
+            self.current_line += " "
+        elif event == 'line_complete':
+            self.line_history.append(data)
+            self.index_line(data)
+            self.current_line = ""
+        elif event == 'clear_display':
+            self.line_history.clear()
+            self.message_history.clear()
+            self.current_line = ""
+            self.assemblers.clear()
+            self.transcript.clear()
+        elif event == 'device_update':
+            self.apply_device_list(data)
+        elif event == 'device_delta':
+            self.apply_device_delta(data)
+        
+        outboxes.publish(event, data)
+        return True
+    
+    def apply_device_list(self, device_list):
+        """Replace the device table with a list received from the bus"""
+        with self.device_lock:
+            self.connected_devices = {
+                device['ip']: {
+                    'color': device['color'],
+                    'last_seen': device['last_seen'],
+                    'char_count': device['char_count'],
+                    'stats': device.get('stats')
+                }
+                for device in device_list['devices']
+            }
+            self.device_version = device_list['version']
+    
+    def apply_device_delta(self, delta):
+        """Apply a device delta received from the bus"""
+        with self.device_lock:
+            device = delta['device']
+            if delta['op'] == 'remove':
+                self.connected_devices.pop(device['ip'], None)
+            else:
+                self.connected_devices[device['ip']] = {
+                    'color': device['color'],
+                    'last_seen': device['last_seen'],
+                    'char_count': device['char_count'],
+                    'stats': device.get('stats')
+                }
+            self.device_version = delta['version']
+    
+    def mark_state_changed(self):
+        """Invalidate the cached connect snapshot"""
+        self.state_version += 1
+    
+    def get_connect_frames(self):
+        """Encoded events a newly connected client needs, built once per state version"""
+        local_ip = self.get_local_ip()  # The first lookup changes the state
+        version, cached = self.connect_snapshot
+        if version != self.state_version:
+            version = self.state_version
+            events = [
+                ('status_update', {
+                    'devices': len(self.connected_devices),
+                    'running': self.running,
+                    'local_ip': local_ip
+                })
+            ] + self.get_resync_events()
+            cached = [frames.Frame(None, event, data) for event, data in events]
+            self.connect_snapshot = (version, cached)
+        return cached
     
-    def get_local_ip(self):
-        """Get local IP address"""
+    def get_resync_frames(self):
+        """Cached device list and history frames for a client that fell behind"""
+        return self.get_connect_frames()[1:]
+    
+    def get_resync_events(self):
+        """Full device list and recent history for a client that lost track"""
+        return [
+            ('device_update', self.get_device_list()),
+            ('history_update', self.get_client_history())
+        ]
+    
+    def get_client_history(self):
+        """Recent history sent to a client that connects or falls behind"""
+        if self.line_mode == 'per-device':
+            assemblers = list(self.assemblers.values())
+            return {
+                'line_mode': self.line_mode,
+                'lines': lines.merge_lines(assemblers, per_device=10),  # Last 10 lines per device
+                'current_line': '',
+                'current_lines': lines.current_lines(assemblers)
+            }
+        return {
+            'line_mode': self.line_mode,
+            'lines': list(self.line_history)[-10:],  # Last 10 lines
+            'current_line': self.current_line
+        }
+    
+    def get_lines(self):
+        """Every completed line kept, merged across devices in per-device mode"""
+        if self.line_mode == 'per-device':
+            return lines.merge_lines(list(self.assemblers.values()))
+        return list(self.line_history)
+    
+    def get_local_ip(self, refresh=False):
+        """Get local IP address (looked up once, then cached)"""
+        if self.local_ip and not refresh:
+            return self.local_ip
         try:
             s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             s.connect(("8.8.8.8", 80))
             local_ip = s.getsockname()[0]
             s.close()
-            return local_ip
         except:
-            return "127.0.0.1"
+            local_ip = "127.0.0.1"
+        if local_ip != self.local_ip:
+            self.local_ip = local_ip
+            self.mark_state_changed()
+        return local_ip
 
 # Initialize the Morse server
 morse_server = MorseFlaskServer()
 
+def time_arg(name):
+    """Unix time query argument; negative values are seconds ago"""
+    value = request.args.get(name, type=float)
+    if value is not None and value < 0:
+        value += time.time()
+    return value
+
 # Flask routes
 @app.route('/')
 def index():
-    """Main page"""
-    return render_template('index.html')
+    """Main page, rendered once and served from memory"""
+    return asset_store.page('index.html')
 
 @app.route('/api/status')
 def api_status():
@@ -305,60 +1050,324 @@ def api_status():
     return jsonify({
         'running': morse_server.running,
         'devices': len(morse_server.connected_devices),
-        'local_ip': morse_server.get_local_ip(),
-        'morse_port': morse_server.morse_port
+        'local_ip': morse_server.get_local_ip(refresh=request.args.get('refresh_ip') == '1'),
+        'morse_port': morse_server.morse_port,
+        'logging': cwlog.stats(),
+        'jitter': morse_server.jitter.stats() if morse_server.jitter else None,
+        'node': morse_server.node_id,
+        'relays': [link.stats() for link in morse_server.relays]
     })
 
 @app.route('/api/history')
 def api_history():
     """API endpoint for message history"""
-    return jsonify({
-        'lines': list(morse_server.line_history),
+    result = {
+        'lines': morse_server.get_lines(),
         'current_line': morse_server.current_line,
         'devices': list(morse_server.connected_devices.keys())
+    }
+    if morse_server.line_mode == 'per-device':
+        result['current_lines'] = lines.current_lines(list(morse_server.assemblers.values()))
+    return jsonify(result)
+
+@app.route('/api/stats')
+def api_stats():
+    """API endpoint for speed and activity statistics.
+    
+    device: one sender IP, with its per-minute history (the channel's
+    without it)
+    """
+    device = request.args.get('device')
+    if device:
+        if device not in morse_server.connected_devices:
+            return jsonify({'error': 'unknown device'}), 404
+        return jsonify({
+            'device': device,
+            'stats': morse_server.device_info(device)['stats'],
+            'history': morse_server.stats.history(device)
+        })
+    return jsonify({
+        'channel': morse_server.stats.channel_summary(),
+        'devices': {ip: morse_server.device_info(ip)['stats'] for ip in list(morse_server.connected_devices)},
+        'history': morse_server.stats.history()
+    })
+
+@app.route('/api/characters')
+def api_characters():
+    """API endpoint for the most recent received characters"""
+    limit = request.args.get('limit', 1000, type=int)
+    chars = morse_server.message_history
+    return jsonify({
+        'characters': chars.recent(max(0, limit)),
+        'stored': len(chars),
+        'capacity': chars.capacity
     })
 
+@app.route('/api/query')
+def api_query():
+    """API endpoint for searching the transcript.
+    
+    q: words that must all appear, call: callsign pattern with * and ?,
+    device: sender IP, since/until: Unix time, negative = seconds ago
+    """
+    tokens = request.args.get('q', '').replace(',', ' ').split()
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    start = time.perf_counter()
+    results = morse_server.transcript.query(
+        tokens=tokens,
+        call=request.args.get('call'),
+        device=request.args.get('device'),
+        since=time_arg('since'),
+        until=time_arg('until'),
+        limit=limit)
+    return jsonify({
+        'lines': results,
+        'count': len(results),
+        'indexed': len(morse_server.transcript),
+        'took_ms': round((time.perf_counter() - start) * 1000, 3)
+    })
+
+@app.route('/api/export')
+def api_export():
+    """API endpoint streaming history as NDJSON or CSV.
+    
+    what: chars (default) or lines, format: ndjson (default) or csv,
+    since/until: Unix time, negative = seconds ago, device: sender IP,
+    gzip=1: compress while streaming
+    """
+    what = 'lines' if request.args.get('what') == 'lines' else 'chars'
+    fmt = 'csv' if request.args.get('format') == 'csv' else 'ndjson'
+    compress = request.args.get('gzip') == '1'
+    filters = {
+        'since': time_arg('since'),
+        'until': time_arg('until'),
+        'device': request.args.get('device')
+    }
+    
+    if what == 'lines':
+        rows = export.line_rows(morse_server.transcript, **filters)
+        fields = export.LINE_FIELDS
+    else:
+        rows = export.char_rows(morse_server.message_history, **filters)
+        fields = export.CHAR_FIELDS
+    
+    headers = {'Content-Disposition': f'attachment; filename=cw-{what}.{fmt}'}
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(export.stream(rows, fmt, fields, compress), mimetype=mimetype, headers=headers)
+
+def parse_event_id(event_id):
+    """(epoch, seq) of an 'epoch:seq' position, (None, None) if malformed"""
+    epoch, _, seq = (event_id or '').partition(':')
+    try:
+        return epoch, int(seq)
+    except ValueError:
+        return None, None
+
+@app.route('/api/stream')
+def api_stream():
+    """Server-Sent Events feed of the live events for read-only consumers.
+    
+    Every reader is a cursor into the shared frame log; reconnecting with
+    Last-Event-ID replays what was missed, otherwise a snapshot comes first.
+    """
+    frame_log = outboxes.frame_log
+    resume = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    
+    def snapshot():
+        """Full state with the position it corresponds to"""
+        epoch, seq = frame_log.position()
+        chunks = [frames.encode_sse(event, data, f"{epoch}:{seq}")
+                  for event, data in morse_server.get_resync_events()]
+        return b''.join(chunks), epoch, seq
+    
+    def generate():
+        morse_server.stream_readers += 1
+        try:
+            yield b"retry: 2000\n\n"
+            epoch, seq = parse_event_id(resume)
+            missed = frame_log.since(epoch, seq) if epoch else None
+            if missed is None:
+                data, epoch, seq = snapshot()
+                yield data
+            else:
+                missed = [frame.sse(epoch) for frame in missed]
+                if missed:
+                    seq += len(missed)
+                    yield b''.join(missed)
+            
+            while True:
+                pending = frame_log.wait(epoch, seq, timeout=15.0)
+                if pending is None:
+                    # Fell behind the log (or the server restarted): start over
+                    data, epoch, seq = snapshot()
+                    yield data
+                elif pending:
+                    seq = pending[-1].seq
+                    yield b''.join(frame.sse(epoch) for frame in pending)
+                else:
+                    yield b": keepalive\n\n"
+        finally:
+            morse_server.stream_readers -= 1
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/relay')
+def api_relay():
+    """Batched, compressed character feed for relay links from other servers.
+    
+    node: the subscriber's node name (nothing that passed through it is
+    sent), since: 'epoch:seq' position to resume from (see relay.py)
+    """
+    frame_log = outboxes.frame_log
+    requester = request.args.get('node', '')
+    resume = request.args.get('since')
+    
+    def generate():
+        morse_server.relay_readers += 1
+        encoder = relay.BatchEncoder()
+        
+        def batch(pending, epoch, seq, reset=False):
+            events = []
+            for frame in pending:
+                data = relay.relay_event(frame, epoch, morse_server.node_id, requester)
+                if data is not None:
+                    events.append([frame.event, data])
+            return encoder.encode({'epoch': epoch, 'seq': seq, 'events': events, 'reset': reset})
+        
+        try:
+            epoch, seq = parse_event_id(resume)
+            pending = frame_log.since(epoch, seq) if epoch else None
+            if pending is None:
+                # New link, sender restarted or the gap left the log: go live
+                epoch, seq = frame_log.position()
+                yield batch([], epoch, seq, reset=True)
+            elif pending:
+                seq = pending[-1].seq
+                yield batch(pending, epoch, seq)
+            
+            while True:
+                pending = frame_log.wait(epoch, seq, timeout=relay.KEEPALIVE)
+                if pending:
+                    # Give a burst a moment to become one batch
+                    time.sleep(relay.BATCH_DELAY)
+                    pending = frame_log.since(epoch, seq) or pending
+                    seq = pending[-1].seq
+                    yield batch(pending, epoch, seq)
+                elif pending is None:
+                    epoch, seq = frame_log.position()
+                    yield batch([], epoch, seq, reset=True)
+                else:
+                    yield batch([], epoch, seq)  # Keepalive
+        finally:
+            morse_server.relay_readers -= 1
+    
+    return Response(generate(), mimetype='application/octet-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def admin_denied():
+    """Error response unless the request carries the admin token"""
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not morse_server.admin_token:
+        return jsonify({'error': 'admin endpoints are disabled (start with --admin-token)'}), 403
+    if not hmac.compare_digest(token.encode('utf-8'), morse_server.admin_token.encode('utf-8')):
+        return jsonify({'error': 'invalid admin token'}), 403
+    return None
+
+@app.route('/api/admin/metrics')
+def api_admin_metrics():
+    """Process and structure sizes for soak tests (admin token required)"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    
+    top = min(max(request.args.get('top', 10, type=int), 0), 100)
+    result = profiling.process_metrics(top=top)
+    result['structures'] = morse_server.structure_sizes()
+    result['timestamp'] = time.time()
+    return jsonify(result)
+
+@app.route('/api/admin/profile')
+def api_admin_profile():
+    """Profile the running server for ?seconds=N (admin token required).
+    
+    format=collapsed (default) samples every thread's stack;
+    format=pstats runs cProfile inside the traced functions.
+    """
+    denied = admin_denied()
+    if denied:
+        return denied
+    
+    try:
+        seconds = float(request.args.get('seconds', profiling.DEFAULT_SECONDS))
+        session = profiling.ProfileSession(morse_server.profile_targets(),
+                                           request.args.get('format', 'collapsed'))
+        report = session.run(seconds)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    return Response(report, mimetype='text/plain')
+
+@app.route('/api/admission')
+def api_admission():
+    """API endpoint for device port throttle and drop counters"""
+    return jsonify(morse_server.admission.stats())
+
+@app.route('/api/clients')
+def api_clients():
+    """API endpoint for per-client outbound queue depth"""
+    stats = outboxes.stats()
+    stats['stream_readers'] = morse_server.stream_readers
+    stats['relay_readers'] = morse_server.relay_readers
+    return jsonify(stats)
+
 # WebSocket events
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
     """Handle web client connection"""
     client_id = request.sid
-    morse_server.web_clients.add(client_id)
+    auth = auth if isinstance(auth, dict) else {}
     
-    print(f"✓ Web client connected: {client_id}")
+    # Opt-in binary MessagePack frames
+    codec = auth.get('codec') if auth.get('codec') in frames.CODECS else 'json'
     
-    # Send current status to new client
-    emit('status_update', {
-        'devices': len(morse_server.connected_devices),
-        'running': morse_server.running,
-        'local_ip': morse_server.get_local_ip()
-    })
+    # A reconnecting client may only need the frames it missed
+    resume = None
+    if auth.get('epoch') and isinstance(auth.get('last_seq'), int):
+        resume = (auth['epoch'], auth['last_seq'])
+    morse_server.web_clients.add(client_id)
     
-    # Send device list
-    morse_server.broadcast_device_update()
+    log.info("✓ Web client connected: %s", client_id, extra={'fields': {'sid': client_id}})
     
-    # Send recent history
-    emit('history_update', {
-        'lines': list(morse_server.line_history)[-10:],  # Last 10 lines
-        'current_line': morse_server.current_line
-    })
+    # Status, device list and recent history go to this client only, ahead
+    # of the live events in its own bounded queue
+    outboxes.add_client(client_id, morse_server.get_connect_frames, codec=codec, resume=resume)
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle web client disconnection"""
     client_id = request.sid
     morse_server.web_clients.discard(client_id)
-    print(f"✗ Web client disconnected: {client_id}")
+    outboxes.remove_client(client_id)
+    log.info("✗ Web client disconnected: %s", client_id, extra={'fields': {'sid': client_id}})
 
 @socketio.on('request_clear')
 def handle_clear():
     """Handle clear request from web client"""
-    morse_server.line_history.clear()
-    morse_server.message_history.clear()
-    morse_server.current_line = ""
+    if morse_server.role == 'web':
+        # The ingest process owns the text buffer
+        socketio.emit('request_clear', {}, to=bus.INGEST_ROOM)
+        return
     
-    socketio.emit('clear_display')
-    print("📝 Display cleared by web client request")
+    morse_server.clear_display()
+
+@socketio.on('request_devices')
+def handle_request_devices():
+    """Send the full device list to a client that missed a delta"""
+    emit('device_update', morse_server.get_device_list())
 
 # Test connection endpoint
 @socketio.on('ping')
@@ -366,32 +1375,253 @@ def handle_ping():
     """Handle ping from client"""
     emit('pong', {'status': 'ok', 'timestamp': time.time()})
 
+def parse_args():
+    """Command line options"""
+    parser = argparse.ArgumentParser(description="Flask Morse Code Broadcaster")
+    parser.add_argument('--role', choices=['standalone', 'ingest', 'web'], default='standalone',
+                        help="standalone: receiver and web UI in one process; "
+                             "ingest: receiver only, publishes to the bus; "
+                             "web: web UI worker fed from the bus")
+    parser.add_argument('--bus', default=None,
+                        help=f"message bus URL, e.g. unix://{bus.DEFAULT_BUS_PATH} or redis://localhost:6379/0")
+    parser.add_argument('--no-broker', action='store_true',
+                        help="ingest role: do not start the bundled broker (use an external one)")
+    parser.add_argument('--host', default='0.0.0.0', help="web server address")
+    parser.add_argument('--port', type=int, default=5000, help="web server port")
+    parser.add_argument('--morse-port', type=int, default=12345, help="device (Pico) port")
+    parser.add_argument('--client-queue-size', type=int, default=200,
+                        help="events queued per web client before the slow-client policy applies")
+    parser.add_argument('--slow-client-policy', choices=outbox.SLOW_CLIENT_POLICIES, default='coalesce',
+                        help="coalesce: replace queued text with a line snapshot; "
+                             "drop_morse: stop sending audio fields first; "
+                             "disconnect: drop the client with a resync hint")
+    parser.add_argument('--ingest-workers', type=int, default=0,
+                        help="accept device connections in N worker processes sharing the "
+                             "port with SO_REUSEPORT (0 = in this process)")
+    parser.add_argument('--max-device-connections', type=int, default=64,
+                        help="concurrent device connections before new ones are refused")
+    parser.add_argument('--max-connects-per-sec', type=float, default=20.0,
+                        help="connection rate allowed per device (burst of twice that)")
+    parser.add_argument('--max-chars-per-sec', type=float, default=15.0,
+                        help="character rate allowed per device (burst of twice that)")
+    parser.add_argument('--line-mode', choices=['shared', 'per-device'], default='shared',
+                        help="shared: all devices write one line; "
+                             "per-device: each device keys its own lines, browsers pick "
+                             "a merged (?view=merged) or per-device (?view=device) view; "
+                             "give ingest and web roles the same mode")
+    parser.add_argument('--history-size', type=int, default=100000,
+                        help="characters kept in the in-memory history (14 bytes each)")
+    parser.add_argument('--transcript-lines', type=int, default=20000,
+                        help="completed lines kept searchable through /api/query")
+    parser.add_argument('--record', metavar='FILE', help="append every text event to an NDJSON session file")
+    parser.add_argument('--replay', metavar='FILE', help="play a recorded session into the server at startup")
+    parser.add_argument('--replay-speed', type=float, default=1.0,
+                        help="replay speed factor, 0 = as fast as possible")
+    parser.add_argument('--async-mode', choices=ASYNC_MODES, default='threading',
+                        help="threading: Werkzeug development server, one thread per client; "
+                             "eventlet/gevent: production server, one green thread per client")
+    cwlog.add_arguments(parser)
+    parser.add_argument('--jitter-buffer', type=float, default=0, metavar='MS',
+                        help="order live characters by device keying time and release them after "
+                             "at least MS milliseconds, adapting to the observed jitter (0 = off)")
+    parser.add_argument('--jitter-max', type=float, default=500, metavar='MS',
+                        help="largest playout delay the jitter buffer may adapt to")
+    parser.add_argument('--snapshot', metavar='FILE',
+                        help="save the text, history and device state to FILE periodically and on exit, "
+                             "and continue from it at startup")
+    parser.add_argument('--snapshot-interval', type=float, default=30.0, metavar='SECONDS',
+                        help="seconds between snapshots while the state changes")
+    parser.add_argument('--relay', action='append', default=[], metavar='URL',
+                        help="also show the characters keyed at the server at URL "
+                             "(e.g. http://other-site:5000); may be given several times")
+    parser.add_argument('--node-name', default=socket.gethostname(),
+                        help="name of this server in relayed characters (default: host name); "
+                             "must differ between linked servers")
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help="trace allocations so /api/admin/metrics can report the top sites")
+    parser.add_argument('--admin-token', default=os.environ.get('CW_ADMIN_TOKEN'),
+                        help="token required by /api/admin/profile and /api/admin/metrics, "
+                             "which soak.py samples (default $CW_ADMIN_TOKEN; both are "
+                             "disabled without one)")
+    return parser.parse_args()
+
+def install_profile_signal():
+    """SIGUSR1: profile for a few seconds and write the report to /tmp"""
+    def profile_in_background():
+        try:
+            path = profiling.profile_to_file(morse_server.profile_targets())
+            log.info(f"✓ Profile written to {path}")
+        except RuntimeError as e:
+            log.warning(f"Profile not started: {e}")
+    
+    def handler(signum, frame):
+        log.info(f"Profiling for {profiling.DEFAULT_SECONDS} s (SIGUSR1)...")
+        threading.Thread(target=profile_in_background, daemon=True).start()
+    
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, handler)
+
+def configure_socketio(args):
+    """Attach Socket.IO to the app, optionally through the message bus"""
+    options = {'cors_allowed_origins': "*", 'async_mode': args.async_mode}
+    
+    if args.role != 'standalone':
+        bus_url = args.bus or 'unix://' + bus.DEFAULT_BUS_PATH
+        if args.role == 'ingest' and bus_url.startswith('unix://') and not args.no_broker:
+            broker = bus.BusBroker(bus.unix_path_from_url(bus_url))
+            broker.start()
+        options['client_manager'] = bus.create_client_manager(bus_url, on_event=morse_server.on_bus_event)
+        log.info(f"✓ Using message bus: {bus_url}")
+    
+    socketio.init_app(app, **options)
+    morse_server.role = args.role
+    morse_server.line_mode = args.line_mode
+    morse_server.ingest_workers = args.ingest_workers
+    morse_server.morse_port = args.morse_port
+    morse_server.node_id = args.node_name
+    if args.history_size != morse_server.message_history.capacity:
+        morse_server.message_history = history.CharHistory(args.history_size)
+    morse_server.transcript.capacity = args.transcript_lines
+    morse_server.admin_token = args.admin_token
+    if args.jitter_buffer > 0 and args.role != 'web':
+        morse_server.jitter = jitter.JitterBuffer(morse_server.release_buffered,
+                                                  args.jitter_buffer / 1000, args.jitter_max / 1000)
+        morse_server.jitter.start()
+    if args.tracemalloc:
+        tracemalloc.start()
+    morse_server.admission = admission.AdmissionControl(
+        max_concurrent=args.max_device_connections,
+        connect_rate=args.max_connects_per_sec,
+        connect_burst=int(args.max_connects_per_sec * 2),
+        char_rate=args.max_chars_per_sec,
+        char_burst=int(args.max_chars_per_sec * 2))
+    
+    if args.record and args.role != 'web':
+        morse_server.recorder = replay.SessionRecorder(args.record)
+        log.info(f"✓ Recording session to {args.record}")
+    
+    if args.role != 'ingest':
+        outboxes.max_queue = args.client_queue_size
+        outboxes.policy = args.slow_client_policy
+        outboxes.snapshot_fn = morse_server.get_resync_frames
+        outboxes.start()
+
+def configure_snapshots(args):
+    """Restore the last snapshot before any listener opens, then keep saving"""
+    if not args.snapshot or args.role == 'web':
+        return
+    if os.path.exists(args.snapshot):
+        start = time.perf_counter()
+        try:
+            saved_at = morse_server.load_state(args.snapshot)
+            log.info(f"✓ Restored {args.snapshot} from {time.time() - saved_at:.0f}s ago: "
+                     f"{len(morse_server.message_history)} characters, "
+                     f"{len(morse_server.transcript)} lines in "
+                     f"{(time.perf_counter() - start) * 1000:.0f} ms")
+        except (OSError, ValueError) as e:
+            log.error(f"Snapshot {args.snapshot} not restored: {e}")
+    
+    writer = snapshot.SnapshotWriter(args.snapshot, morse_server.collect_state,
+                                     lambda: morse_server.state_version, args.snapshot_interval)
+    writer.saved_version = morse_server.state_version
+    writer.start()
+    atexit.register(writer.stop)
+    
+    def terminate(signum, frame):
+        # Exit through atexit so the final save runs, once
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        sys.exit(0)
+    signal.signal(signal.SIGTERM, terminate)
+
+def start_relays(args):
+    """Open the --relay links to other servers"""
+    if not args.relay:
+        return
+    if args.role == 'web':
+        log.warning("--relay is ignored in the web role; give it to the ingest process")
+        return
+    for url in args.relay:
+        link = relay.RelayLink(url, morse_server.node_id, morse_server.apply_relayed, morse_server.relay_seen)
+        morse_server.relays.append(link)
+        link.start()
+    log.info(f"✓ Relaying from {', '.join(args.relay)} as {morse_server.node_id}")
+
+def run_ingest(args):
+    """Ingest role: receive from devices and publish to the bus, no web server"""
+    bus.start_listening(socketio)
+    if not morse_server.start_morse_server():
+        log.error("❌ Failed to start Morse receiver server!")
+        log.error(f"Check if port {morse_server.morse_port} is already in use")
+        return
+    
+    if args.replay:
+        morse_server.start_replay(args.replay, args.replay_speed)
+    morse_server.publish_snapshot()
+    local_ip = morse_server.get_local_ip()
+    log.info(f"✓ Morse devices should connect to: {local_ip}:{morse_server.morse_port}")
+    log.info("✓ Publishing to web workers over the bus")
+    log.info("Press Ctrl+C to stop the server")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+
+def run_web(args):
+    """Start the Flask-SocketIO web server"""
+    local_ip = morse_server.get_local_ip()
+    log.info(f"✓ Web interface available at: http://localhost:{args.port}")
+    log.info(f"✓ Web interface available at: http://{local_ip}:{args.port}")
+    if args.async_mode == 'threading':
+        log.info("✓ Starting Flask web server (development mode)...")
+    else:
+        log.info(f"✓ Starting {args.async_mode} web server (production mode)...")
+    log.info("")
+    log.info("Web clients can connect to view live Morse code!")
+    log.info("Press Ctrl+C to stop the server")
+    log.info("-" * 50)
+    
+    options = {}
+    if args.async_mode == 'eventlet':
+        # eventlet.wsgi holds back streamed bodies until 4 KB are pending,
+        # which would stall /api/stream and /api/relay between events
+        options['minimum_chunk_size'] = 0
+    
+    try:
+        # Start Flask-SocketIO server with better configuration
+        socketio.run(app, 
+                    host=args.host, 
+                    port=args.port, 
+                    debug=False,
+                    allow_unsafe_werkzeug=True,
+                    **options)
+    except Exception as e:
+        log.error(f"Error starting Flask server: {e}")
+        log.error("Try running with: python flask_server.py")
+
 if __name__ == '__main__':
-    print("Flask Morse Code Broadcaster")
-    print("=" * 40)
+    args = parse_args()
+    cwlog.setup(args.log_format, args.quiet, args.log_char_rate)
+    log.info("Flask Morse Code Broadcaster")
+    log.info("=" * 40)
+    
+    configure_socketio(args)
+    configure_snapshots(args)
+    start_relays(args)
+    install_profile_signal()
     
-    # Start the Morse receiver server
-    if morse_server.start_morse_server():
+    if args.role == 'ingest':
+        run_ingest(args)
+    elif args.role == 'web':
+        bus.start_listening(socketio)
+        run_web(args)
+    elif morse_server.start_morse_server():
+        # Start the Morse receiver server
         local_ip = morse_server.get_local_ip()
-        print(f"✓ Morse devices should connect to: {local_ip}:{morse_server.morse_port}")
-        print(f"✓ Web interface available at: http://localhost:5000")
-        print(f"✓ Web interface available at: http://{local_ip}:5000")
-        print("✓ Starting Flask web server...")
-        print()
-        print("Web clients can connect to view live Morse code!")
-        print("Press Ctrl+C to stop the server")
-        print("-" * 50)
-        
-        try:
-            # Start Flask-SocketIO server with better configuration
-            socketio.run(app, 
-                        host='0.0.0.0', 
-                        port=5000, 
-                        debug=False,
-                        allow_unsafe_werkzeug=True)
-        except Exception as e:
-            print(f"Error starting Flask server: {e}")
-            print("Try running with: python flask_server.py")
+        log.info(f"✓ Morse devices should connect to: {local_ip}:{morse_server.morse_port}")
+        if args.replay:
+            morse_server.start_replay(args.replay, args.replay_speed)
+        run_web(args)
     else:
-        print("❌ Failed to start Morse receiver server!")
-        print("Check if port 12345 is already in use")
\ No newline at end of file
+        log.error("❌ Failed to start Morse receiver server!")
+        log.error(f"Check if port {morse_server.morse_port} is already in use")
@@ -0,0 +1,257 @@
+# outbox.py - Per-client bounded outbound queues for web viewers
+#
+# Broadcasts are not handed to Socket.IO for every browser at once.  Each
+# viewer gets its own small queue and a single sender task forwards events
+# only while the viewer's transport keeps up.  A viewer that falls behind
+# fills its own queue and is handled by the slow-consumer policy; the rest
+# of the net never waits for it.
+#
+# Queue entries are pre-encoded frames (see frames.py): a broadcast is
+# serialized once and the same packets are written to every client.
+import logging
+import threading
+import time
+from collections import deque
+
+from frames import Frame, FrameLog
+
+log = logging.getLogger('cw')
+
+SLOW_CLIENT_POLICIES = ('coalesce', 'drop_morse', 'disconnect')
+RESYNC_GRACE = 5.0  # seconds a dropped client's transport gets to take the resync hint
+
+# Events that only move the display forward and can be replaced by a snapshot
+SNAPSHOT_EVENTS = ('new_character', 'auto_space', 'line_complete', 'history_update',
+                   'device_update', 'device_delta')
+
+
+class ClientOutbox:
+    """Queue of frames waiting to be sent to one web client"""
+
+    def __init__(self, sid, codec='json'):
+        self.sid = sid
+        self.codec = codec
+        self.queue = deque()
+        self.sent = 0
+        self.coalesced = 0
+        self.morse_dropped = 0
+        self.drop_morse = False
+        self.closing = None  # when the resync hint was queued
+
+    def stats(self):
+        return {
+            'sid': self.sid,
+            'codec': self.codec,
+            'depth': len(self.queue),
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'morse_dropped': self.morse_dropped,
+            'degraded': self.drop_morse
+        }
+
+
+class OutboxDispatcher:
+    """Fans broadcasts out to per-client outboxes and drains them"""
+
+    def __init__(self, sio, max_queue=200, policy='coalesce', transport_high_water=8):
+        self.sio = sio
+        self.max_queue = max_queue
+        self.policy = policy
+        self.transport_high_water = transport_high_water
+        self.snapshot_fn = None  # returns the frames that bring a client up to date
+        self.frame_log = FrameLog()
+        self.clients = {}
+        self.disconnected = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.running = False
+
+    def start(self):
+        """Start the sender task (after Socket.IO is configured)"""
+        if not self.running:
+            self.running = True
+            self.sio.start_background_task(self.sender_loop)
+
+    def add_client(self, sid, initial_frames=None, codec='json', resume=None):
+        """Register a client; its initial frames are queued ahead of any broadcast.
+
+        ``initial_frames()`` returns unlogged frames, shared between clients.
+        ``resume`` is the (epoch, seq) the client last saw: when the replay
+        log still covers it, the missed frames are replayed instead of a
+        history snapshot.
+        """
+        with self.lock:
+            outbox = ClientOutbox(sid, codec)
+            replay = self.frame_log.since(*resume) if resume else None
+            if initial_frames is not None:
+                if replay is None:
+                    outbox.queue.extend(self.snapshot_frames(initial_frames()))
+                else:
+                    outbox.queue.extend(frame for frame in initial_frames()
+                                        if frame.event not in SNAPSHOT_EVENTS)
+            if replay:
+                outbox.queue.extend(replay)
+            self.clients[sid] = outbox
+        self.wakeup.set()
+
+    def remove_client(self, sid):
+        with self.lock:
+            self.clients.pop(sid, None)
+
+    def snapshot_frames(self, snapshot):
+        """Snapshot frames with the stream position after the history one.
+
+        The position is the only frame built per client; call with the lock
+        held so no broadcast slips in between.
+        """
+        for frame in snapshot:
+            yield frame
+            if frame.event == 'history_update':
+                epoch, seq = self.frame_log.position()
+                yield Frame(None, 'stream_position', {'epoch': epoch, 'seq': seq})
+
+    def publish(self, event, data=None):
+        """Encode an event once and queue it for every connected client"""
+        resync = []
+        with self.lock:
+            frame = self.frame_log.append(event, data)
+            for outbox in self.clients.values():
+                if outbox.closing:
+                    continue
+                if outbox.drop_morse and frame.without_morse() is not frame:
+                    outbox.queue.append(frame.without_morse())
+                    outbox.morse_dropped += 1
+                else:
+                    outbox.queue.append(frame)
+                if len(outbox.queue) > self.max_queue:
+                    if self.overflow(outbox):
+                        resync.append(outbox.sid)
+        for sid in resync:
+            self.resync_client(sid)
+        self.wakeup.set()
+
+    def overflow(self, outbox):
+        """Apply the slow-consumer policy; True if the client must resync"""
+        if self.policy == 'disconnect':
+            return True
+
+        if self.policy == 'drop_morse' and not outbox.drop_morse:
+            # Audio is the first thing to go: a late tone is useless anyway
+            outbox.drop_morse = True
+            stripped = deque()
+            for frame in outbox.queue:
+                if frame.without_morse() is not frame:
+                    outbox.morse_dropped += 1
+                stripped.append(frame.without_morse())
+            outbox.queue = stripped
+            return False
+        if self.policy == 'drop_morse' and len(outbox.queue) <= 2 * self.max_queue:
+            return False
+
+        self.coalesce(outbox)
+        return False
+
+    def coalesce(self, outbox):
+        """Replace queued text and device events with a single snapshot"""
+        kept = deque()
+        for frame in outbox.queue:
+            if frame.event in SNAPSHOT_EVENTS:
+                outbox.coalesced += 1
+            else:
+                kept.append(frame)
+        if self.snapshot_fn is not None:
+            kept.extend(self.snapshot_frames(self.snapshot_fn()))
+        outbox.queue = kept
+
+    def resync_client(self, sid):
+        """Drop a hopeless client, telling it to reconnect for a fresh snapshot.
+
+        Everything queued for it is replaced by the 'resync' hint; the sender
+        disconnects it once the hint has left its transport queue.
+        """
+        with self.lock:
+            outbox = self.clients.get(sid)
+            if outbox is None or outbox.closing:
+                return
+            outbox.queue = deque([Frame(None, 'resync', {'reason': 'slow_consumer'})])
+            outbox.closing = time.monotonic()
+        self.disconnected += 1
+        self.wakeup.set()
+    
+    def finish_resync(self, outbox, eio_sid):
+        """Disconnect a resynced client whose hint has been flushed"""
+        if outbox.queue:
+            return
+        if (eio_sid is not None and self.transport_backlog(eio_sid) and
+                time.monotonic() - outbox.closing < RESYNC_GRACE):
+            return
+        self.remove_client(outbox.sid)
+        try:
+            if eio_sid is not None:
+                self.sio.server.disconnect(outbox.sid, namespace='/')
+        except Exception as e:
+            log.error(f"Error disconnecting slow client {outbox.sid}: {e}")
+        log.warning(f"✗ Slow web client disconnected: {outbox.sid}")
+
+    def eio_sid(self, sid):
+        try:
+            return self.sio.server.manager.eio_sid_from_sid(sid, '/')
+        except (KeyError, AttributeError):
+            return None
+
+    def transport_backlog(self, eio_sid):
+        """Packets already waiting in the client's Engine.IO socket"""
+        try:
+            return self.sio.server.eio.sockets[eio_sid].queue.qsize()
+        except (KeyError, AttributeError):
+            return 0
+
+    def sender_loop(self):
+        while self.running:
+            self.wakeup.wait(0.5)
+            self.wakeup.clear()
+
+            with self.lock:
+                pending = [o for o in self.clients.values() if o.queue or o.closing]
+
+            for outbox in pending:
+                eio_sid = self.eio_sid(outbox.sid)
+                if eio_sid is None:
+                    if outbox.closing:
+                        self.finish_resync(outbox, None)
+                    continue
+                room = self.transport_high_water - self.transport_backlog(eio_sid)
+                batch = []
+                with self.lock:
+                    while outbox.queue and len(batch) < room:
+                        batch.append(outbox.queue.popleft())
+                    if not outbox.queue:
+                        outbox.drop_morse = False
+                try:
+                    # Pre-encoded packets go straight to Engine.IO
+                    for frame in batch:
+                        for pkt in frame.packets(outbox.codec):
+                            self.sio.server._send_eio_packet(eio_sid, pkt)
+                        outbox.sent += 1
+                except Exception as e:
+                    log.error(f"Error sending to web client {outbox.sid}: {e}")
+                if outbox.closing:
+                    self.finish_resync(outbox, eio_sid)
+
+            # Keep polling while someone is held back by their transport
+            with self.lock:
+                backed_up = any(o.queue or o.closing for o in self.clients.values())
+            if backed_up:
+                self.sio.sleep(0.05)
+                self.wakeup.set()
+
+    def stats(self):
+        with self.lock:
+            clients = [outbox.stats() for outbox in self.clients.values()]
+        return {
+            'policy': self.policy,
+            'max_queue': self.max_queue,
+            'slow_disconnects': self.disconnected,
+            'replay_seq': self.frame_log.seq,
+            'clients': clients
+        }
@@ -0,0 +1,190 @@
+# profiling.py - On-demand profiling of a running server
+#
+# Nothing here runs until a session is started (/api/admin/profile or
+# SIGUSR1), so there is no cost while profiling is off:
+#
+#   collapsed  a sampler thread reads every thread's stack with
+#              sys._current_frames() and counts them as collapsed stacks
+#              ("thread;outer;...;inner count", the flamegraph.pl input)
+#   pstats     cProfile, enabled in each thread while it is inside one of
+#              the traced functions (cProfile only sees its own thread)
+#
+# Either way the traced functions (process_morse_data, add_character, the
+# broadcast functions, ...) are timed as spans for the session: a timing
+# wrapper is set on the instance and removed again afterwards.
+#
+# process_metrics() is the cheap always-available part: RSS, thread count
+# and, if the server was started with --tracemalloc, the top allocation
+# sites (soak.py samples it over hours).
+import cProfile
+import io
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+DEFAULT_SECONDS = 10
+MAX_SECONDS = 120
+SAMPLE_INTERVAL = 0.005
+FORMATS = ('collapsed', 'pstats')
+
+session_lock = threading.Lock()  # One session at a time
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse(frame, thread_name):
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ';'.join(reversed(labels))
+
+
+class ProfileSession:
+    """Profile for a while and report spans plus collapsed stacks or pstats.
+
+    ``targets`` are (object, method name) pairs to trace.
+    """
+
+    def __init__(self, targets, fmt='collapsed', interval=SAMPLE_INTERVAL):
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        self.targets = targets
+        self.fmt = fmt
+        self.interval = interval
+        self.spans = {}          # name -> [calls, total seconds, max seconds]
+        self.stacks = Counter()
+        self.samples = 0
+        self.profiles = []       # One cProfile.Profile per thread
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def wrap(self, function, name):
+        stats = self.spans.setdefault(name, [0, 0.0, 0.0])
+        session = self
+
+        def traced(*args, **kwargs):
+            profile = None
+            if session.fmt == 'pstats' and not getattr(session.local, 'profile', None):
+                profile = session.local.profile = cProfile.Profile()
+                with session.lock:
+                    session.profiles.append(profile)
+                profile.enable()
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                if profile is not None:
+                    profile.disable()
+                    session.local.profile = None
+                with session.lock:
+                    stats[0] += 1
+                    stats[1] += elapsed
+                    if elapsed > stats[2]:
+                        stats[2] = elapsed
+        return traced
+
+    def instrument(self):
+        for obj, name in self.targets:
+            label = f"{type(obj).__name__}.{name}"
+            setattr(obj, name, self.wrap(getattr(obj, name), label))
+
+    def uninstrument(self):
+        for obj, name in self.targets:
+            obj.__dict__.pop(name, None)
+
+    def sample(self, deadline):
+        me = threading.get_ident()
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    self.stacks[collapse(frame, names.get(ident, str(ident)))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+
+    def run(self, seconds=DEFAULT_SECONDS):
+        """Profile for ``seconds`` (blocks) and return the text report"""
+        seconds = max(0.1, min(float(seconds), MAX_SECONDS))
+        if not session_lock.acquire(blocking=False):
+            raise RuntimeError("a profile is already running")
+        try:
+            self.instrument()
+            try:
+                deadline = time.monotonic() + seconds
+                if self.fmt == 'collapsed':
+                    self.sample(deadline)
+                else:
+                    time.sleep(seconds)
+            finally:
+                self.uninstrument()
+            return self.report(seconds)
+        finally:
+            session_lock.release()
+
+    def report(self, seconds):
+        out = io.StringIO()
+        out.write(f"# {self.fmt} profile, {seconds:g} s\n")
+        out.write(f"# {'span':<44} {'calls':>8} {'total ms':>10} {'mean us':>9} {'max us':>9}\n")
+        for name, (calls, total, longest) in sorted(self.spans.items(), key=lambda item: -item[1][1]):
+            mean = total / calls * 1e6 if calls else 0.0
+            out.write(f"# {name:<44} {calls:>8} {total * 1000:>10.1f} {mean:>9.0f} {longest * 1e6:>9.0f}\n")
+
+        if self.fmt == 'collapsed':
+            out.write(f"# {self.samples} samples every {self.interval * 1000:g} ms\n")
+            for stack, count in self.stacks.most_common():
+                out.write(f"{stack} {count}\n")
+        elif not self.profiles:
+            out.write("# no traced calls during the session\n")
+        else:
+            stats = pstats.Stats(self.profiles[0], stream=out)
+            for profile in self.profiles[1:]:
+                stats.add(profile)
+            stats.sort_stats('cumulative').print_stats(60)
+        return out.getvalue()
+
+
+def rss_bytes():
+    """Current resident set size (peak size where /proc is missing)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def process_metrics(top=10):
+    """RSS, thread count and the largest allocation sites if tracing"""
+    metrics = {
+        'rss_bytes': rss_bytes(),
+        'threads': threading.active_count(),
+        'tracemalloc': None
+    }
+    if tracemalloc.is_tracing():
+        snapshot = tracemalloc.take_snapshot()
+        metrics['tracemalloc'] = [
+            {'where': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+             'size': stat.size, 'count': stat.count}
+            for stat in snapshot.statistics('lineno')[:top]
+        ]
+    return metrics
+
+
+def profile_to_file(targets, seconds=DEFAULT_SECONDS, fmt='collapsed', directory='/tmp'):
+    """Run a session and write the report to a file; returns its path"""
+    report = ProfileSession(targets, fmt).run(seconds)
+    path = os.path.join(directory, f"cw-network-profile-{os.getpid()}-{int(time.time())}.txt")
+    with open(path, 'w') as f:
+        f.write(report)
+    return path
@@ -0,0 +1,194 @@
+# relay.py - Server-to-server links bridging nets across sites
+#
+# A server started with --relay http://other-site:5000 keeps one HTTP
+# connection open to the other server's /api/relay and keys the characters
+# it receives into its own display as if they came from local devices.
+# Each site relays only what it has seen, so two servers pointing at each
+# other bridge both ways.
+#
+# On the link, events are sent in batches: one JSON line
+#
+#   {"epoch": ..., "seq": ..., "events": [[event, data], ...]}
+#
+# per batch, all of them through one zlib stream flushed after every batch.
+# (epoch, seq) is the sender's frame log position after the batch; after a
+# drop the link reconnects with ?since=epoch:seq and gets exactly what it
+# missed, or a "reset" batch if the sender restarted or the gap is no longer
+# in its log.
+#
+# Relayed characters are tagged with their origin and the path of servers
+# they passed through.  A server never sends a character back to a server
+# on its path and drops any that arrive with itself on the path, so rings
+# of links do not loop; the origin id of each character also drops
+# duplicates arriving over two routes.
+import http.client
+import json
+import logging
+import threading
+import time
+import urllib.parse
+import urllib.request
+import zlib
+from collections import OrderedDict
+
+log = logging.getLogger('cw')
+
+RELAY_EVENTS = ('new_character',)
+BATCH_DELAY = 0.05       # wait this long after the first event for more
+KEEPALIVE = 15.0         # empty batch after this long without events
+MAX_BACKOFF = 30.0
+SEEN_IDS = 4096          # origin ids remembered for duplicate detection
+
+
+def relay_event(frame, epoch, node, requester):
+    """Link form of a frame log event, or None if ``requester`` must not get it.
+
+    Characters keyed at this site get it as origin, a unique origin id and
+    a site-qualified device name; relayed ones keep theirs.  Either way this
+    server is added to the path.
+    """
+    data = frame.data
+    if frame.event not in RELAY_EVENTS or not isinstance(data, dict):
+        return None
+    if requester in data.get('path', ()):
+        return None
+    data = {k: v for k, v in data.items() if k != 'seq'}
+    if 'origin' not in data:
+        data['origin'] = node
+        data['origin_id'] = f"{node}:{epoch}:{frame.seq}"
+        data['device'] = f"{node}/{data['device']}"
+    data['path'] = data.get('path', []) + [node]
+    return data
+
+
+class RecentIds:
+    """Bounded set of origin ids already applied, shared by all links"""
+
+    def __init__(self, maxlen=SEEN_IDS):
+        self.maxlen = maxlen
+        self.ids = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, origin_id):
+        """False if the id was seen before"""
+        with self.lock:
+            if origin_id in self.ids:
+                return False
+            self.ids[origin_id] = None
+            if len(self.ids) > self.maxlen:
+                self.ids.popitem(last=False)
+            return True
+
+
+class BatchEncoder:
+    """Batches as JSON lines through one zlib stream"""
+
+    def __init__(self):
+        self.compressor = zlib.compressobj(6)
+
+    def encode(self, batch):
+        line = json.dumps(batch, separators=(',', ':')).encode('utf-8') + b'\n'
+        return self.compressor.compress(line) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class RelayLink:
+    """One persistent subscription to a remote server's /api/relay.
+
+    ``on_events(link, events)`` is called from the link's thread with every
+    batch of (event, data) pairs that passed loop and duplicate checks.
+    """
+
+    def __init__(self, url, node, on_events, seen=None):
+        self.url = url.rstrip('/')
+        self.node = node
+        self.on_events = on_events
+        self.seen = seen or RecentIds()
+        self.epoch = None
+        self.seq = 0
+        self.running = False
+
+        # Counters
+        self.connected = False
+        self.connects = 0
+        self.batches = 0
+        self.events = 0
+        self.dropped = 0          # loops and duplicates
+        self.resets = 0
+        self.bytes_received = 0
+        self.last_error = None
+
+    def start(self):
+        self.running = True
+        thread = threading.Thread(target=self.run, name=f"relay {self.url}")
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        backoff = 1.0
+        while self.running:
+            try:
+                self.follow()
+                error = "connection closed"
+            except (OSError, ValueError, zlib.error, http.client.HTTPException) as e:
+                error = self.last_error = str(e) or type(e).__name__
+            if self.connected:
+                self.connected = False
+                backoff = 1.0
+            log.warning(f"Relay {self.url}: {error}, reconnecting in {backoff:.0f}s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+    def follow(self):
+        """Read batches until the connection drops"""
+        query = {'node': self.node}
+        if self.epoch:
+            query['since'] = f"{self.epoch}:{self.seq}"
+        url = f"{self.url}/api/relay?{urllib.parse.urlencode(query)}"
+        with urllib.request.urlopen(url, timeout=KEEPALIVE * 3) as response:
+            self.connected = True
+            self.connects += 1
+            log.info(f"✓ Relay connected to {self.url}")
+            decompressor = zlib.decompressobj()
+            pending = b''
+            while self.running:
+                chunk = response.read1(65536)
+                if not chunk:
+                    return
+                self.bytes_received += len(chunk)
+                pending += decompressor.decompress(chunk)
+                *lines, pending = pending.split(b'\n')
+                for line in lines:
+                    self.apply(json.loads(line))
+
+    def apply(self, batch):
+        if batch.get('reset') and self.epoch is not None:
+            self.resets += 1
+            log.warning(f"Relay {self.url}: resumed without the missed events")
+        self.batches += 1
+        events = []
+        for event, data in batch['events']:
+            if self.node in data.get('path', []) or not self.seen.add(data.get('origin_id')):
+                self.dropped += 1
+                continue
+            events.append((event, data))
+        self.epoch, self.seq = batch['epoch'], batch['seq']
+        if events:
+            self.events += len(events)
+            self.on_events(self, events)
+
+    def stats(self):
+        return {
+            'url': self.url,
+            'connected': self.connected,
+            'connects': self.connects,
+            'batches': self.batches,
+            'events': self.events,
+            'dropped': self.dropped,
+            'resets': self.resets,
+            'bytes_received': self.bytes_received,
+            'position': f"{self.epoch}:{self.seq}" if self.epoch else None,
+            'last_error': self.last_error
+        }
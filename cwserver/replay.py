@@ -0,0 +1,99 @@
+# replay.py - Record a session's text events and play them back
+#
+# The recorder appends one JSON object per line for every character,
+# auto-space and completed line.  Playback reads the file lazily and
+# re-injects the events with their original spacing, sped up N times or
+# as fast as possible.  Played back at full speed through the server it is
+# a repeatable throughput benchmark for the broadcast path:
+#
+#   python replay.py session.ndjson
+import json
+import sys
+import threading
+import time
+
+
+class SessionRecorder:
+    """Appends text events to an NDJSON session file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a', encoding='utf-8', buffering=1)
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def record(self, event_type, **fields):
+        fields['type'] = event_type
+        fields['t'] = time.time()
+        line = json.dumps(fields, separators=(',', ':'))
+        with self.lock:
+            self.file.write(line + '\n')
+            self.count += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_session(path):
+    """Yield recorded events one at a time without loading the file"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def paced(events, speed=1.0):
+    """Re-apply the original gaps between events, ``speed`` times faster.
+
+    A speed of 0 yields events as fast as they can be consumed.
+    """
+    previous = None
+    start = time.monotonic()
+    elapsed = 0.0
+    for event in events:
+        if speed > 0 and previous is not None:
+            elapsed += max(0.0, event['t'] - previous) / speed
+            delay = start + elapsed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        previous = event['t']
+        yield event
+
+
+def replay(events, sink, speed=1.0):
+    """Feed events to ``sink(event)``; returns (count, seconds)"""
+    count = 0
+    start = time.perf_counter()
+    for event in paced(events, speed):
+        sink(event)
+        count += 1
+    return count, time.perf_counter() - start
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the broadcast path by replaying a session")
+    parser.add_argument('session', help="NDJSON file written with main.py --record")
+    parser.add_argument('--speed', type=float, default=0,
+                        help="playback speed, 0 = as fast as possible (default)")
+    parser.add_argument('--repeat', type=int, default=1, help="play the session this many times")
+    args = parser.parse_args()
+
+    from main import morse_server
+
+    total = 0
+    seconds = 0.0
+    for _ in range(args.repeat):
+        count, elapsed = replay(read_session(args.session), morse_server.replay_event, args.speed)
+        total += count
+        seconds += elapsed
+
+    rate = total / seconds if seconds else 0
+    print(f"Replayed {total} events in {seconds:.3f}s ({rate:,.0f} events/s)")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
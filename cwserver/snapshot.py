@@ -0,0 +1,155 @@
+# snapshot.py - Binary snapshots of the live server state for fast restarts
+#
+# A snapshot is a short header and a list of named sections, each zlib
+# compressed with a CRC of its payload:
+#
+#   b'CWSNAP'  u16 version  u16 section count
+#   per section: u8 name length, name, u32 CRC-32, u32 length, zlib data
+#
+# The character history is stored as its raw columns (14 bytes a character
+# before compression), everything else as compact JSON.  Files are written
+# to a temporary name next to the target, synced and renamed over it, so a
+# crash mid-write leaves the previous snapshot intact.
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+MAGIC = b'CWSNAP'
+VERSION = 1
+HEADER = struct.Struct('<6sHH')
+SECTION = struct.Struct('<II')
+HISTORY_COLUMNS = ('times', 'devices', 'symbols', 'morse')
+
+log = logging.getLogger('cw')
+
+
+def encode_json(value):
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def pack(sections):
+    """Snapshot bytes of a {name: bytes} dict"""
+    parts = [HEADER.pack(MAGIC, VERSION, len(sections))]
+    for name, payload in sections.items():
+        name = name.encode('ascii')
+        compressed = zlib.compress(payload, 6)
+        parts.append(bytes([len(name)]) + name)
+        parts.append(SECTION.pack(zlib.crc32(payload), len(compressed)))
+        parts.append(compressed)
+    return b''.join(parts)
+
+
+def unpack(data):
+    """{name: bytes} of a snapshot; ValueError if it is damaged"""
+    try:
+        magic, version, count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"not a version {VERSION} snapshot")
+        offset = HEADER.size
+        sections = {}
+        for _ in range(count):
+            length = data[offset]
+            name = data[offset + 1:offset + 1 + length].decode('ascii')
+            offset += 1 + length
+            crc, size = SECTION.unpack_from(data, offset)
+            offset += SECTION.size
+            payload = zlib.decompress(data[offset:offset + size])
+            offset += size
+            if zlib.crc32(payload) != crc:
+                raise ValueError(f"section {name} is damaged")
+            sections[name] = payload
+        return sections
+    except (struct.error, IndexError, zlib.error, UnicodeDecodeError) as e:
+        raise ValueError(f"truncated or damaged snapshot: {e}")
+
+
+def encode_state(state, history_snapshot, transcript_snapshot):
+    """Sections of the server state, a CharHistory and a TranscriptIndex"""
+    columns = history_snapshot.pop('columns')
+    sections = {
+        'state': encode_json(state),
+        'history': encode_json(history_snapshot),
+        'transcript': encode_json(transcript_snapshot)
+    }
+    for name in HISTORY_COLUMNS:
+        sections['history.' + name] = columns[name]
+    return sections
+
+
+def decode_state(sections):
+    """(state, history snapshot, transcript snapshot) of encode_state()"""
+    try:
+        history = json.loads(sections['history'])
+        history['columns'] = {name: sections['history.' + name] for name in HISTORY_COLUMNS}
+        return (json.loads(sections['state']), history, json.loads(sections['transcript']))
+    except (KeyError, ValueError) as e:
+        raise ValueError(f"incomplete snapshot: {e}")
+
+
+def write(path, sections):
+    """Write atomically: temporary file, fsync, rename"""
+    data = pack(sections)
+    tmp = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return len(data)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return unpack(f.read())
+
+
+class SnapshotWriter:
+    """Saves ``collect()`` to ``path`` every ``interval`` seconds while
+    ``version()`` keeps changing, and once more on ``stop()``"""
+
+    def __init__(self, path, collect, version, interval=30.0):
+        self.path = path
+        self.collect = collect
+        self.version = version
+        self.interval = interval
+        self.saved_version = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def start(self):
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.save()
+
+    def save(self):
+        """Write a snapshot if the state changed since the last one"""
+        with self.lock:
+            version = self.version()
+            if version == self.saved_version:
+                return False
+            start = time.perf_counter()
+            try:
+                size = write(self.path, self.collect())
+            except Exception as e:
+                log.error(f"Snapshot to {self.path} failed: {e}")
+                return False
+            self.saved_version = version
+            log.debug(f"Snapshot {self.path}: {size} bytes in "
+                      f"{(time.perf_counter() - start) * 1000:.0f} ms")
+            return True
+
+    def stop(self):
+        self.stopped.set()
+        self.save()
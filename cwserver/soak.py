@@ -0,0 +1,313 @@
+# soak.py - Long-running soak test for memory, thread and latency drift
+#
+# Drives simulated devices and viewers against a server on localhost for
+# hours and samples /api/admin/metrics (RSS, thread count, tracemalloc top
+# sites, the size of every long-lived structure) together with latency
+# percentiles.  Each sample is one line of the --out NDJSON time series;
+# the last line is the verdict against the growth limits, measured from
+# the first sample after --warmup.
+#
+#   python soak.py --duration 4h --devices 8 --viewers 50
+#
+# By default a server is started for the run (device port 12345, with
+# --tracemalloc and the per-device limits raised); --url tests one that is
+# already running and needs its --admin-token.
+#
+#   devices   one BATCH per character; ingest latency is the ACK round trip
+#   viewers   /api/stream readers (--viewers) and Socket.IO clients like the
+#             page (--socketio-viewers) that reconnect every --viewer-lifetime
+#             seconds; delivery latency is receive time - event timestamp
+import argparse
+import json
+import os
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import socketio
+
+MESSAGE = "CQ CQ DE HS1SOAK K "
+
+
+def duration_arg(text):
+    """Seconds from '90', '90s', '15m' or '4h'"""
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {'p50': pick(0.50) * 1000, 'p95': pick(0.95) * 1000,
+            'p99': pick(0.99) * 1000, 'max': values[-1] * 1000, 'n': len(values)}
+
+
+class SoakStats:
+    """Counters and the latency samples of the current window"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.received = 0
+        self.viewer_connects = 0
+        self.viewer_errors = 0
+        self.ack_latency = []
+        self.delivery_latency = []
+
+    def add(self, name, value=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def latency(self, name, seconds):
+        with self.lock:
+            getattr(self, name).append(seconds)
+
+    def window(self):
+        """Counters plus latency percentiles since the previous window"""
+        with self.lock:
+            ack, self.ack_latency = self.ack_latency, []
+            delivery, self.delivery_latency = self.delivery_latency, []
+            return {
+                'sent': self.sent, 'failed': self.failed, 'received': self.received,
+                'viewer_connects': self.viewer_connects, 'viewer_errors': self.viewer_errors,
+                'ack_ms': percentiles(ack), 'delivery_ms': percentiles(delivery)
+            }
+
+
+def device_loop(args, index, stats, deadline):
+    """One device keying MESSAGE over and over, pausing between words"""
+    source_ip = f"127.0.0.{index % 254 + 1}"
+    boot = f"soak{index:04d}"
+    seq = 0
+    position = random.randrange(len(MESSAGE))
+    while time.monotonic() < deadline:
+        char = MESSAGE[position % len(MESSAGE)]
+        position += 1
+        if char == ' ':
+            time.sleep(random.uniform(1.6, 2.5))  # A word gap
+            continue
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        start = time.monotonic()
+        try:
+            sock.settimeout(10.0)
+            sock.bind((source_ip, 0))
+            sock.connect((args.device_host, args.device_port))
+            sock.sendall(
+                f"BATCH: {boot}\nNOW: {start}\n"
+                f"\nSEQ: {seq}\nCHAR: {char}\nMORSE: .\nTIME: {start}\n"
+                f"\nEND\n".encode('utf-8'))
+            if sock.recv(64).startswith(b"ACK:"):
+                stats.add('sent')
+                stats.latency('ack_latency', time.monotonic() - start)
+            else:
+                stats.add('failed')
+        except OSError:
+            stats.add('failed')
+        finally:
+            sock.close()
+        seq += 1
+        time.sleep(args.char_interval * random.uniform(0.8, 1.2))
+
+
+def viewer_loop(args, stats, deadline):
+    """An /api/stream reader that reconnects every --viewer-lifetime seconds"""
+    while time.monotonic() < deadline:
+        lifetime = args.viewer_lifetime * random.uniform(0.5, 1.5) if args.viewer_lifetime else None
+        until = min(deadline, time.monotonic() + lifetime) if lifetime else deadline
+        try:
+            with urllib.request.urlopen(args.url + '/api/stream', timeout=30) as response:
+                stats.add('viewer_connects')
+                event = None
+                for raw in response:
+                    line = raw.decode('utf-8').rstrip('\n')
+                    if line.startswith('event: '):
+                        event = line[7:]
+                    elif line.startswith('data: ') and event == 'new_character':
+                        data = json.loads(line[6:])
+                        stats.add('received')
+                        stats.latency('delivery_latency', time.time() - data['timestamp'])
+                    if time.monotonic() >= until:
+                        break
+        except (OSError, ValueError):
+            stats.add('viewer_errors')
+            time.sleep(1.0)
+
+
+def socketio_viewer_loop(args, stats, deadline):
+    """A Socket.IO viewer like the page, reconnecting every --viewer-lifetime seconds"""
+    def on_character(data):
+        stats.add('received')
+        stats.latency('delivery_latency', time.time() - data['timestamp'])
+
+    while time.monotonic() < deadline:
+        lifetime = args.viewer_lifetime * random.uniform(0.5, 1.5) if args.viewer_lifetime else None
+        until = min(deadline, time.monotonic() + lifetime) if lifetime else deadline
+        client = socketio.Client(reconnection=False)
+        client.on('new_character', on_character)
+        try:
+            client.connect(args.url, wait_timeout=30)
+            stats.add('viewer_connects')
+            while client.connected and time.monotonic() < until:
+                time.sleep(0.5)
+            if not client.connected:
+                stats.add('viewer_errors')  # Dropped by the server, e.g. as a slow consumer
+        except socketio.exceptions.ConnectionError:
+            stats.add('viewer_errors')
+            time.sleep(1.0)
+        finally:
+            client.disconnect()
+
+
+def fetch_metrics(args):
+    request = urllib.request.Request(args.url + '/api/admin/metrics?top=5',
+                                     headers={'Authorization': f"Bearer {args.token}"})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.load(response)
+
+
+def verdict(samples, args):
+    """Checks of the last sample against the first one after the warm-up"""
+    after_warmup = [s for s in samples if s['elapsed'] >= args.warmup] or samples
+    base, last = after_warmup[0], samples[-1]
+    checks = []
+
+    def check(name, value, limit):
+        checks.append({'check': name, 'value': value, 'limit': limit, 'ok': value <= limit})
+
+    check('rss_growth_mb', round((last['rss_bytes'] - base['rss_bytes']) / 1e6, 1), args.max_rss_growth_mb)
+    check('thread_growth', last['threads'] - base['threads'], args.max_thread_growth)
+    for name, (size, capacity) in last['structures'].items():
+        if capacity is not None:
+            check(f"{name}_size", size, capacity)
+        else:
+            start = base['structures'].get(name, [0])[0]
+            check(f"{name}_size", size, int(start * args.max_structure_growth) + args.structure_slack)
+    worst_p99 = max((s['delivery_ms']['p99'] for s in after_warmup if s['delivery_ms']), default=0.0)
+    check('delivery_p99_ms', round(worst_p99, 1), args.max_p99_ms)
+    attempts = last['sent'] + last['failed']
+    check('device_failure_rate', round(last['failed'] / attempts, 4) if attempts else 0.0, args.max_failure_rate)
+    return {'verdict': 'pass' if all(c['ok'] for c in checks) else 'fail', 'checks': checks}
+
+
+def start_server(args):
+    """Run main.py for the soak and wait until it answers"""
+    args.token = args.token or secrets.token_hex(8)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    server = subprocess.Popen([
+        sys.executable, script, '--port', str(args.web_port), '--admin-token', args.token,
+        '--morse-port', str(args.device_port), '--tracemalloc', '--quiet',
+        '--max-connects-per-sec', '1e6', '--max-chars-per-sec', '1e6'
+    ])
+    args.url = f"http://127.0.0.1:{args.web_port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(args.url + '/api/status', timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test the server for memory, thread and latency drift")
+    parser.add_argument('--url', help="running server to test (default: start one)")
+    parser.add_argument('--token', help="its --admin-token")
+    parser.add_argument('--web-port', type=int, default=5077, help="web port of the started server")
+    parser.add_argument('--device-host', default='127.0.0.1')
+    parser.add_argument('--device-port', type=int, default=12345)
+    parser.add_argument('--duration', type=duration_arg, default=3600, help="e.g. 600, 30m, 4h")
+    parser.add_argument('--warmup', type=duration_arg, default=300, help="time before the baseline sample")
+    parser.add_argument('--sample-interval', type=duration_arg, default=60)
+    parser.add_argument('--devices', type=int, default=8)
+    parser.add_argument('--char-interval', type=float, default=0.25, help="seconds between characters per device")
+    parser.add_argument('--viewers', type=int, default=20, help="/api/stream readers")
+    parser.add_argument('--socketio-viewers', type=int, default=20, help="Socket.IO viewers")
+    parser.add_argument('--viewer-lifetime', type=duration_arg, default=120,
+                        help="average seconds before a viewer reconnects (0 = never)")
+    parser.add_argument('--out', default='soak.ndjson', help="time series and verdict")
+    parser.add_argument('--max-rss-growth-mb', type=float, default=50.0)
+    parser.add_argument('--max-thread-growth', type=int, default=10)
+    parser.add_argument('--max-structure-growth', type=float, default=2.0,
+                        help="allowed factor over the baseline for unbounded structures")
+    parser.add_argument('--structure-slack', type=int, default=50)
+    parser.add_argument('--max-p99-ms', type=float, default=1000.0)
+    parser.add_argument('--max-failure-rate', type=float, default=0.01)
+    args = parser.parse_args()
+
+    if args.url and not args.token:
+        parser.error("--url needs --token (the server's --admin-token)")
+    server = None if args.url else start_server(args)
+
+    stats = SoakStats()
+    start = time.monotonic()
+    deadline = start + args.duration
+    workers = [threading.Thread(target=device_loop, args=(args, i, stats, deadline), daemon=True)
+               for i in range(args.devices)]
+    workers += [threading.Thread(target=viewer_loop, args=(args, stats, deadline), daemon=True)
+                for _ in range(args.viewers)]
+    workers += [threading.Thread(target=socketio_viewer_loop, args=(args, stats, deadline), daemon=True)
+                for _ in range(args.socketio_viewers)]
+    for worker in workers:
+        worker.start()
+
+    samples = []
+    result = None
+    stopped_answering = False
+    try:
+        with open(args.out, 'w') as out:
+            next_sample = start + min(args.sample_interval, args.duration)
+            while True:
+                time.sleep(max(0.0, next_sample - time.monotonic()))
+                sample = {'elapsed': round(time.monotonic() - start, 1)}
+                try:
+                    sample.update(fetch_metrics(args))
+                except (OSError, ValueError) as e:
+                    print(f"Sampling failed: {e}")
+                    stopped_answering = True
+                    break
+                sample.update(stats.window())
+                samples.append(sample)
+                out.write(json.dumps(sample) + '\n')
+                out.flush()
+
+                delivery = sample['delivery_ms'] or {}
+                print(f"[{sample['elapsed']:>7.0f}s] rss {sample['rss_bytes'] / 1e6:6.1f} MB  "
+                      f"threads {sample['threads']:3d}  web clients {sample['structures']['web_clients'][0]}  "
+                      f"sent {sample['sent']}  received {sample['received']}  "
+                      f"p99 {delivery.get('p99', 0):.0f} ms")
+                if next_sample >= deadline:
+                    break
+                next_sample = min(deadline, next_sample + args.sample_interval)
+
+            if not stopped_answering:
+                result = verdict(samples, args)
+                out.write(json.dumps(result) + '\n')
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    if result is None:
+        print(f"Soak FAIL - the server stopped answering after {len(samples)} samples "
+              f"(time series so far in {args.out})")
+        return 1
+    for check in result['checks']:
+        print(f"  {'ok  ' if check['ok'] else 'FAIL'} {check['check']}: {check['value']} (limit {check['limit']})")
+    print(f"Soak {result['verdict'].upper()} - time series in {args.out}")
+    return 0 if result['verdict'] == 'pass' else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
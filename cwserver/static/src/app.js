@@ -0,0 +1,636 @@
+// WebSocket connection with better error handling
+// Stream position, sent back on reconnect so the server can replay
+// only the events we missed
+let streamEpoch = null;
+let lastSeq = 0;
+
+// ?codec=msgpack opts in to binary MessagePack frames
+const codec = new URLSearchParams(window.location.search).get('codec') || 'json';
+
+const socket = io({
+    transports: ['websocket', 'polling'],
+    timeout: 10000,
+    forceNew: true,
+    auth: function(cb) {
+        if (streamEpoch) {
+            cb({codec: codec, epoch: streamEpoch, last_seq: lastSeq});
+        } else {
+            cb({codec: codec});
+        }
+    }
+});
+
+// Live events arrive either as JSON events or wrapped in one binary 'mp' event
+const eventHandlers = {};
+
+function onEvent(name, handler) {
+    eventHandlers[name] = handler;
+    socket.on(name, function(data) {
+        handleEvent(name, data);
+    });
+}
+
+function handleEvent(name, data) {
+    if (data && data.seq) lastSeq = data.seq;
+    if (data && data.epoch) streamEpoch = data.epoch;
+    eventHandlers[name](data);
+}
+
+socket.on('mp', function(buffer) {
+    const message = decodeMsgpack(new Uint8Array(buffer));
+    if (eventHandlers[message[0]]) handleEvent(message[0], message[1]);
+});
+
+// Minimal MessagePack decoder for the binary frame mode
+function decodeMsgpack(bytes) {
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+    const textDecoder = new TextDecoder();
+    let pos = 0;
+    
+    function u8() { return view.getUint8(pos++); }
+    function u16() { const v = view.getUint16(pos); pos += 2; return v; }
+    function u32() { const v = view.getUint32(pos); pos += 4; return v; }
+    function bin(length) { const b = bytes.slice(pos, pos + length); pos += length; return b; }
+    function str(length) { return textDecoder.decode(bin(length)); }
+    function array(length) {
+        const out = new Array(length);
+        for (let i = 0; i < length; i++) out[i] = read();
+        return out;
+    }
+    function map(length) {
+        const out = {};
+        for (let i = 0; i < length; i++) {
+            const key = read();
+            out[key] = read();
+        }
+        return out;
+    }
+    function fixed(getter, size) { const v = getter.call(view, pos); pos += size; return v; }
+    
+    function read() {
+        const type = u8();
+        if (type < 0x80) return type;
+        if (type < 0x90) return map(type & 0x0f);
+        if (type < 0xa0) return array(type & 0x0f);
+        if (type < 0xc0) return str(type & 0x1f);
+        if (type >= 0xe0) return type - 0x100;
+        switch (type) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xc4: return bin(u8());
+            case 0xc5: return bin(u16());
+            case 0xc6: return bin(u32());
+            case 0xca: return fixed(view.getFloat32, 4);
+            case 0xcb: return fixed(view.getFloat64, 8);
+            case 0xcc: return u8();
+            case 0xcd: return u16();
+            case 0xce: return u32();
+            case 0xcf: return Number(fixed(view.getBigUint64, 8));
+            case 0xd0: return fixed(view.getInt8, 1);
+            case 0xd1: return fixed(view.getInt16, 2);
+            case 0xd2: return fixed(view.getInt32, 4);
+            case 0xd3: return Number(fixed(view.getBigInt64, 8));
+            case 0xd9: return str(u8());
+            case 0xda: return str(u16());
+            case 0xdb: return str(u32());
+            case 0xdc: return array(u16());
+            case 0xdd: return array(u32());
+            case 0xde: return map(u16());
+            case 0xdf: return map(u32());
+        }
+        throw new Error('Unsupported MessagePack type 0x' + type.toString(16));
+    }
+    
+    return read();
+}
+
+// Connection debugging
+socket.on('connect', function() {
+    console.log('✓ Connected to server');
+    document.getElementById('connection-status').textContent = 'Connected';
+    document.getElementById('status-indicator').style.background = '#27ae60';
+    
+    // Send ping to test connection
+    socket.emit('ping');
+});
+
+socket.on('disconnect', function(reason) {
+    console.log('✗ Disconnected from server:', reason);
+    document.getElementById('connection-status').textContent = 'Disconnected: ' + reason;
+    document.getElementById('status-indicator').style.background = '#e74c3c';
+    
+    // The server only drops a viewer itself when it fell too far behind;
+    // reconnect to resume from the replay log or a fresh snapshot
+    if (reason === 'io server disconnect') {
+        setTimeout(function() {
+            socket.connect();
+        }, 1000);
+    }
+});
+
+socket.on('connect_error', function(error) {
+    console.log('❌ Connection error:', error);
+    document.getElementById('connection-status').textContent = 'Connection Error';
+    document.getElementById('status-indicator').style.background = '#e74c3c';
+});
+
+socket.on('pong', function(data) {
+    console.log('✓ Server responded to ping:', data);
+});
+
+// Add connection timeout
+setTimeout(function() {
+    if (!socket.connected) {
+        console.log('⚠️ Connection timeout - check if server is running');
+        document.getElementById('connection-status').textContent = 'Timeout - Check Server';
+    }
+}, 5000);
+
+// Audio context for morse code sounds
+let audioContext;
+let audioEnabled = true;
+let volume = 0.5;
+
+// Device list, kept in step with versioned deltas
+let devices = {};
+let deviceVersion = 0;
+
+// Display state
+let currentLine = '';
+let currentLineChars = 0;
+let totalLines = 1;
+let totalChars = 0;
+
+// Server started with --line-mode per-device: every device has its
+// own lines, shown merged by time (?view=merged) or grouped by
+// device (?view=device)
+let lineMode = 'shared';
+const view = new URLSearchParams(window.location.search).get('view') === 'device' ? 'device' : 'merged';
+let deviceSections = {};
+let deviceCurrentLines = {};
+
+// Initialize audio context
+function initAudio() {
+    try {
+        audioContext = new (window.AudioContext || window.webkitAudioContext)();
+    } catch (e) {
+        console.log('Audio not supported');
+        audioEnabled = false;
+    }
+}
+
+// Play morse code tone
+function playTone(frequency, duration) {
+    if (!audioEnabled || !audioContext) return;
+    
+    const oscillator = audioContext.createOscillator();
+    const gainNode = audioContext.createGain();
+    
+    oscillator.connect(gainNode);
+    gainNode.connect(audioContext.destination);
+    
+    oscillator.frequency.value = frequency;
+    oscillator.type = 'sine';
+    
+    gainNode.gain.setValueAtTime(0, audioContext.currentTime);
+    gainNode.gain.linearRampToValueAtTime(volume * 0.3, audioContext.currentTime + 0.01);
+    gainNode.gain.linearRampToValueAtTime(volume * 0.3, audioContext.currentTime + duration - 0.01);
+    gainNode.gain.linearRampToValueAtTime(0, audioContext.currentTime + duration);
+    
+    oscillator.start(audioContext.currentTime);
+    oscillator.stop(audioContext.currentTime + duration);
+}
+
+// Play morse code sequence
+function playMorseCode(morse) {
+    // Slow viewers under the drop_morse policy get characters without it
+    if (!audioEnabled || !morse) return;
+    
+    let delay = 0;
+    const ditTime = 0.08;  // 80ms
+    const dahTime = 0.24;  // 240ms
+    const gapTime = 0.05;  // 50ms
+    
+    for (let symbol of morse) {
+        if (symbol === '.') {
+            setTimeout(() => playTone(600, ditTime), delay * 1000);
+            delay += ditTime + gapTime;
+        } else if (symbol === '-') {
+            setTimeout(() => playTone(600, dahTime), delay * 1000);
+            delay += dahTime + gapTime;
+        } else if (symbol === ' ') {
+            delay += 0.2; // Letter gap
+        }
+    }
+}
+
+// Prosigns such as <AR> must show as text, not markup
+function escapeHtml(text) {
+    return text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+}
+
+// Apply a device add/remove/update delta
+function applyDeviceDelta(delta) {
+    if (delta.version <= deviceVersion) return;  // already in our list
+    if (delta.version !== deviceVersion + 1) {
+        // Missed a delta - ask for the full list
+        socket.emit('request_devices');
+        return;
+    }
+    
+    if (delta.op === 'remove') {
+        delete devices[delta.device.ip];
+    } else {
+        devices[delta.device.ip] = delta.device;
+    }
+    deviceVersion = delta.version;
+    updateDeviceList(Object.values(devices));
+}
+
+// Update device list display
+function updateDeviceList(deviceArray) {
+    const deviceList = document.getElementById('device-list');
+    deviceList.innerHTML = '';
+    
+    deviceArray.forEach(device => {
+        const tag = document.createElement('div');
+        tag.className = 'device-tag';
+        tag.style.color = device.color;
+        tag.style.borderLeft = `4px solid ${device.color}`;
+        tag.textContent = device.ip;
+        
+        const stats = device.stats;
+        if (stats) {
+            const speed = document.createElement('span');
+            speed.className = 'device-stats';
+            speed.textContent = ` ${stats.wpm} wpm · ${Math.round(stats.active * 100)}% active`;
+            tag.appendChild(speed);
+            tag.title = `${stats.cpm} chars/min, keying ${stats.char_wpm ?? '-'} wpm, ` +
+                        `timing consistency ${stats.consistency ?? '-'}%, ${stats.chars} chars`;
+        }
+        deviceList.appendChild(tag);
+    });
+    
+    document.getElementById('device-count').textContent = deviceArray.length;
+}
+
+// Add character to display
+function addCharacter(charData) {
+    const currentLineText = document.getElementById('current-line-text');
+    
+    // Check if we need a new line
+    if (currentLineChars >= 100) {
+        addNewLine();
+    }
+    
+    // Create character span with color
+    const charSpan = document.createElement('span');
+    charSpan.textContent = charData.char;
+    charSpan.style.color = charData.color;
+    currentLineText.appendChild(charSpan);
+    
+    currentLine += charData.char;
+    currentLineChars++;
+    totalChars++;
+    
+    // Update counters
+    document.getElementById('current-line-chars').textContent = currentLineChars;
+    document.getElementById('char-count').textContent = totalChars;
+    
+    // Play morse audio
+    playMorseCode(charData.morse);
+    
+    // Auto-scroll to bottom
+    const textDisplay = document.getElementById('text-display');
+    textDisplay.scrollTop = textDisplay.scrollHeight;
+}
+
+// Per-device mode: container for a device's completed lines
+function deviceLinesContainer(device, color) {
+    if (view === 'merged') return document.getElementById('merged-lines');
+    
+    let section = deviceSections[device];
+    if (!section) {
+        section = document.createElement('div');
+        section.className = 'device-section';
+        section.style.borderLeftColor = color;
+        section.innerHTML = `
+            <div class="device-tag" style="color: ${color}">${escapeHtml(device)}</div>
+            <div class="device-lines"></div>
+        `;
+        document.getElementById('device-sections').appendChild(section);
+        deviceSections[device] = section;
+    }
+    return section.querySelector('.device-lines');
+}
+
+// Per-device mode: text element of the line a device is keying
+function deviceCurrentLine(device, color) {
+    let element = deviceCurrentLines[device];
+    if (!element) {
+        const line = document.createElement('div');
+        line.className = 'text-line current-line';
+        line.style.borderLeftColor = color;
+        line.innerHTML = `
+            <span class="line-number">${escapeHtml(device)}:</span>
+            <span class="device-line-text" style="color: ${color}"></span>
+        `;
+        if (view === 'merged') {
+            document.getElementById('device-sections').appendChild(line);
+        } else {
+            deviceLinesContainer(device, color).parentNode.appendChild(line);
+        }
+        element = line.querySelector('.device-line-text');
+        deviceCurrentLines[device] = element;
+    }
+    return element;
+}
+
+// Per-device mode: add a completed line to the merged list or its device section
+function addDeviceLine(line) {
+    const element = document.createElement('div');
+    element.className = 'text-line';
+    const label = view === 'merged' ? line.device : line.line_num.toString().padStart(3, '0');
+    element.innerHTML = `
+        <span class="line-number">${escapeHtml(label)}:</span>
+        <span style="color: ${line.color}">${escapeHtml(line.text)}</span>
+    `;
+    deviceLinesContainer(line.device, line.color).appendChild(element);
+    totalLines++;
+}
+
+function resetDeviceView() {
+    document.getElementById('text-display').innerHTML = `
+        <div id="merged-lines"></div>
+        <div id="device-sections"></div>
+    `;
+    deviceSections = {};
+    deviceCurrentLines = {};
+    totalLines = 0;
+}
+
+function addDeviceCharacter(charData) {
+    const text = deviceCurrentLine(charData.device, charData.color);
+    text.textContent += charData.char;
+    totalChars++;
+    document.getElementById('current-line-chars').textContent = text.textContent.length;
+    document.getElementById('char-count').textContent = totalChars;
+    playMorseCode(charData.morse);
+}
+
+function completeDeviceLine(line) {
+    addDeviceLine(line);
+    const text = deviceCurrentLines[line.device];
+    if (text) {
+        text.parentNode.remove();
+        delete deviceCurrentLines[line.device];
+    }
+    document.getElementById('total-lines').textContent = totalLines;
+}
+
+// Add new line
+function addNewLine() {
+    if (currentLine.trim() === '') return;
+    
+    const textDisplay = document.getElementById('text-display');
+    const currentLineElement = textDisplay.querySelector('.current-line');
+    
+    // Remove current-line class from old line
+    currentLineElement.classList.remove('current-line');
+    
+    // Create new current line
+    totalLines++;
+    const newLine = document.createElement('div');
+    newLine.className = 'text-line current-line';
+    newLine.innerHTML = `
+        <span class="line-number">${totalLines.toString().padStart(3, '0')}:</span>
+        <span id="current-line-text"></span>
+    `;
+    
+    textDisplay.appendChild(newLine);
+    
+    // Reset current line state
+    currentLine = '';
+    currentLineChars = 0;
+    
+    // Update counters
+    document.getElementById('current-line-chars').textContent = currentLineChars;
+    document.getElementById('total-lines').textContent = totalLines;
+    
+    // Auto-scroll to bottom
+    textDisplay.scrollTop = textDisplay.scrollHeight;
+}
+
+// Add auto space
+function addAutoSpace() {
+    const currentLineText = document.getElementById('current-line-text');
+    
+    if (currentLineChars >= 100) return;
+    
+    const spaceSpan = document.createElement('span');
+    spaceSpan.textContent = ' ';
+    spaceSpan.className = 'auto-space';
+    spaceSpan.style.color = '#95a5a6';
+    spaceSpan.title = 'Auto-generated space';
+    currentLineText.appendChild(spaceSpan);
+    
+    currentLine += ' ';
+    currentLineChars++;
+    totalChars++;
+    
+    // Update counters
+    document.getElementById('current-line-chars').textContent = currentLineChars;
+    document.getElementById('char-count').textContent = totalChars;
+}
+
+// Clear display
+function clearDisplay() {
+    if (confirm('Clear all text from display?')) {
+        socket.emit('request_clear');
+    }
+}
+
+// Toggle audio
+function toggleAudio() {
+    audioEnabled = !audioEnabled;
+    const button = document.getElementById('audio-toggle');
+    
+    if (audioEnabled) {
+        button.textContent = '🔊 Audio: ON';
+        button.style.background = '#9b59b6';
+        if (!audioContext) initAudio();
+    } else {
+        button.textContent = '🔇 Audio: OFF';
+        button.style.background = '#7f8c8d';
+    }
+}
+
+// Volume control
+function updateVolume() {
+    const slider = document.getElementById('volume-slider');
+    const display = document.getElementById('volume-display');
+    
+    volume = slider.value / 100;
+    display.textContent = slider.value + '%';
+}
+
+// Socket event handlers (already defined above with better error handling)
+
+onEvent('new_character', function(data) {
+    console.log('📨 Received character:', data);
+    if (lineMode === 'per-device') {
+        addDeviceCharacter(data);
+    } else {
+        addCharacter(data);
+    }
+});
+
+onEvent('auto_space', function(data) {
+    console.log('⎵ Auto space added');
+    if (lineMode === 'per-device') {
+        const text = deviceCurrentLines[data.device];
+        if (text) text.textContent += ' ';
+    } else {
+        addAutoSpace();
+    }
+});
+
+onEvent('line_complete', function(data) {
+    console.log('📝 Line completed:', data);
+    if (lineMode === 'per-device') {
+        completeDeviceLine(data);
+    } else {
+        addNewLine();
+    }
+});
+
+onEvent('device_update', function(data) {
+    console.log('🔄 Device update:', data);
+    devices = {};
+    data.devices.forEach(device => {
+        devices[device.ip] = device;
+    });
+    deviceVersion = data.version;
+    updateDeviceList(data.devices);
+});
+
+onEvent('device_delta', function(data) {
+    applyDeviceDelta(data);
+});
+
+onEvent('status_update', function(data) {
+    console.log('📊 Status update:', data);
+    document.getElementById('local-ip').textContent = data.local_ip;
+    document.getElementById('server-status').textContent = data.running ? 'Active' : 'Stopped';
+});
+
+// Position of the history snapshot in the event stream; handleEvent keeps it
+onEvent('stream_position', function(data) {});
+
+onEvent('history_update', function(data) {
+    lineMode = data.line_mode || 'shared';
+    if (lineMode === 'per-device') {
+        resetDeviceView();
+        data.lines.forEach(addDeviceLine);
+        Object.entries(data.current_lines || {}).forEach(([device, line]) => {
+            deviceCurrentLine(device, line.color).textContent = line.text;
+        });
+        document.getElementById('total-lines').textContent = totalLines;
+        return;
+    }
+    
+    // Load previous lines
+    const textDisplay = document.getElementById('text-display');
+    textDisplay.innerHTML = '';
+    
+    // Add historical lines
+    data.lines.forEach((line, index) => {
+        const lineElement = document.createElement('div');
+        lineElement.className = 'text-line';
+        lineElement.innerHTML = `
+            <span class="line-number">${line.line_num.toString().padStart(3, '0')}:</span>
+            <span>${escapeHtml(line.text)}</span>
+        `;
+        textDisplay.appendChild(lineElement);
+    });
+    
+    // Add current line
+    totalLines = data.lines.length + 1;
+    const currentLineElement = document.createElement('div');
+    currentLineElement.className = 'text-line current-line';
+    currentLineElement.innerHTML = `
+        <span class="line-number">${totalLines.toString().padStart(3, '0')}:</span>
+        <span id="current-line-text">${escapeHtml(data.current_line || '')}</span>
+    `;
+    textDisplay.appendChild(currentLineElement);
+    
+    currentLine = data.current_line || '';
+    currentLineChars = currentLine.length;
+    
+    // Update display
+    document.getElementById('current-line-chars').textContent = currentLineChars;
+    document.getElementById('total-lines').textContent = totalLines;
+    document.getElementById('char-count').textContent = totalChars;
+    
+    // Auto-scroll to bottom
+    textDisplay.scrollTop = textDisplay.scrollHeight;
+});
+
+socket.on('resync', function(data) {
+    // Sent just before the server drops us; the disconnect handler reconnects
+    console.log('⚠️ Resync requested:', data.reason);
+});
+
+onEvent('clear_display', function() {
+    if (lineMode === 'per-device') {
+        resetDeviceView();
+        totalChars = 0;
+        document.getElementById('total-lines').textContent = totalLines;
+        document.getElementById('char-count').textContent = totalChars;
+        return;
+    }
+    
+    const textDisplay = document.getElementById('text-display');
+    textDisplay.innerHTML = `
+        <div class="text-line current-line">
+            <span class="line-number">001:</span>
+            <span id="current-line-text"></span>
+        </div>
+    `;
+    
+    currentLine = '';
+    currentLineChars = 0;
+    totalLines = 1;
+    totalChars = 0;
+    
+    // Update counters
+    document.getElementById('current-line-chars').textContent = currentLineChars;
+    document.getElementById('total-lines').textContent = totalLines;
+    document.getElementById('char-count').textContent = totalChars;
+});
+
+// Initialize on page load
+document.addEventListener('DOMContentLoaded', function() {
+    // Initialize audio on first user interaction
+    document.addEventListener('click', function() {
+        if (!audioContext) {
+            initAudio();
+        }
+    }, { once: true });
+    
+    // Volume slider event
+    document.getElementById('volume-slider').addEventListener('input', updateVolume);
+    
+    // Initialize volume display
+    updateVolume();
+    
+    console.log('Morse Code Monitor initialized');
+});
+
+// Prevent audio context issues
+window.addEventListener('beforeunload', function() {
+    if (audioContext) {
+        audioContext.close();
+    }
+});
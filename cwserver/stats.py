@@ -0,0 +1,166 @@
+# stats.py - Incremental per-device speed and activity statistics
+#
+# Every character updates a handful of exponentially decayed accumulators
+# (time constant TAU), so an event costs O(1) whatever the traffic and a
+# summary can be read at any time:
+#
+#   cpm          characters per minute (decayed count / TAU)
+#   wpm          effective speed, cpm / 5 (PARIS: 5 characters a word)
+#   char_wpm     keying speed, 1.2 / dit length
+#   consistency  1 - coefficient of variation of the dit length, in %
+#   active       share of the window spent keying: gaps up to IDLE_AFTER
+#                count as active, longer ones as idle
+#
+# Devices only send whole characters, so the dit length is estimated per
+# character: within a word the time from one character to the next is the
+# 3-dit letter gap plus the character itself (dits 1, dahs 3, 1 between
+# elements).  Estimates far above the running mean are word gaps and are
+# left out.  The channel (every device together) only gets the rate and
+# activity figures; gaps between different operators say nothing about
+# anyone's timing.
+#
+# History is kept downsampled in one-minute buckets for the last hour.
+import math
+import threading
+import time
+from collections import deque
+
+TAU = 60.0
+IDLE_AFTER = 5.0
+BUCKET_SECONDS = 60
+BUCKETS = 60
+ALPHA = 0.1   # EWMA weight of one dit estimate
+
+
+def pattern_units(morse):
+    """Length of a '.-' pattern in dits, gaps between elements included"""
+    elements = [c for c in morse if c in '.-']
+    if not elements:
+        return 0
+    return sum(1 if c == '.' else 3 for c in elements) + len(elements) - 1
+
+
+class RollingStats:
+    """Decayed rate, activity and timing figures of one device or channel"""
+
+    __slots__ = ('timing', 'first', 'last', 'chars', 'count', 'active', 'idle',
+                 'dit_mean', 'dit_var', 'history')
+
+    def __init__(self, timing=True):
+        self.timing = timing
+        self.first = None
+        self.last = None
+        self.chars = 0         # all-time count
+        self.count = 0.0       # decayed count
+        self.active = 0.0      # decayed seconds
+        self.idle = 0.0
+        self.dit_mean = None
+        self.dit_var = 0.0
+        self.history = deque(maxlen=BUCKETS)  # [bucket start, chars, char_wpm]
+
+    def add(self, t, morse=''):
+        if self.last is None:
+            self.first = self.last = t
+        gap = t - self.last
+        if gap > 0:
+            decay = math.exp(-gap / TAU)
+            self.count *= decay
+            self.active *= decay
+            self.idle *= decay
+            if gap <= IDLE_AFTER:
+                self.active += gap
+            else:
+                self.idle += gap
+            if self.timing:
+                self.add_dit_estimate(gap, morse)
+            self.last = t
+        self.count += 1
+        self.chars += 1
+
+        start = t - t % BUCKET_SECONDS
+        if not self.history or self.history[-1][0] < start:
+            self.history.append([start, 0, None])
+        bucket = self.history[-1]
+        bucket[1] += 1
+        if self.dit_mean:
+            bucket[2] = round(1.2 / self.dit_mean, 1)
+
+    def add_dit_estimate(self, gap, morse):
+        units = pattern_units(morse)
+        if not units:
+            return
+        dit = gap / (units + 3)
+        if self.dit_mean is None:
+            if 0.02 <= dit <= 0.25:  # 5-60 WPM
+                self.dit_mean = dit
+            return
+        if dit > self.dit_mean * 1.6 or dit < self.dit_mean * 0.4:
+            return  # A word gap, or a character that arrived bunched up
+        delta = dit - self.dit_mean
+        self.dit_mean += ALPHA * delta
+        self.dit_var = (1 - ALPHA) * (self.dit_var + ALPHA * delta * delta)
+
+    def summary(self, now=None):
+        if self.last is None:
+            return None
+        now = now or time.time()
+        since = max(0.0, now - self.last)
+        decay = math.exp(-since / TAU)
+        active = self.active * decay
+        idle = self.idle * decay
+        if since <= IDLE_AFTER:
+            active += since
+        else:
+            idle += since
+        # Correct the start-up bias of the decayed count
+        window = TAU * (1 - math.exp(-max(now - self.first, 1.0) / TAU))
+        cpm = self.count * decay / window * 60
+
+        result = {
+            'cpm': round(cpm, 1),
+            'wpm': round(cpm / 5, 1),
+            'active': round(active / (active + idle), 2) if active + idle else 1.0,
+            'chars': self.chars
+        }
+        if self.timing:
+            result['char_wpm'] = round(1.2 / self.dit_mean, 1) if self.dit_mean else None
+            result['consistency'] = (
+                round(max(0.0, 1 - math.sqrt(self.dit_var) / self.dit_mean) * 100)
+                if self.dit_mean else None)
+        return result
+
+
+class StatsEngine:
+    """RollingStats per device plus one for the whole channel"""
+
+    def __init__(self):
+        self.devices = {}
+        self.channel = RollingStats(timing=False)
+        self.lock = threading.Lock()
+
+    def record(self, device, timestamp, morse):
+        with self.lock:
+            stats = self.devices.get(device)
+            if stats is None:
+                stats = self.devices[device] = RollingStats()
+            stats.add(timestamp, morse)
+            self.channel.add(timestamp)
+
+    def forget(self, device):
+        with self.lock:
+            self.devices.pop(device, None)
+
+    def summary(self, device, now=None):
+        with self.lock:
+            stats = self.devices.get(device)
+            return stats.summary(now) if stats else None
+
+    def history(self, device=None):
+        """Per-minute [start, chars, char_wpm] buckets of a device or the channel"""
+        with self.lock:
+            stats = self.channel if device is None else self.devices.get(device)
+            return [list(bucket) for bucket in stats.history] if stats else []
+
+    def channel_summary(self, now=None):
+        with self.lock:
+            return self.channel.summary(now)
@@ -0,0 +1,58 @@
+import threading
+
+from frames import FrameLog
+
+
+def test_resume_returns_only_the_missed_frames():
+    log = FrameLog()
+    for i in range(5):
+        log.append('new_character', {'char': str(i)})
+    epoch, _ = log.position()
+    missed = log.since(epoch, 2)
+    assert [frame.seq for frame in missed] == [3, 4, 5]
+    assert [frame.data['char'] for frame in missed] == ['2', '3', '4']
+
+
+def test_up_to_date_client_gets_nothing():
+    log = FrameLog()
+    log.append('new_character', {'char': 'E'})
+    assert log.since(*log.position()) == []
+
+
+def test_gap_beyond_the_ring_needs_a_snapshot():
+    log = FrameLog(maxlen=3)
+    for i in range(5):
+        log.append('new_character', {'char': str(i)})
+    epoch, _ = log.position()
+    assert log.since(epoch, 1) is None           # Frame 2 has been dropped
+    assert [frame.seq for frame in log.since(epoch, 2)] == [3, 4, 5]
+
+
+def test_other_epoch_or_future_position_needs_a_snapshot():
+    log = FrameLog()
+    log.append('new_character', {'char': 'E'})
+    epoch, seq = log.position()
+    assert log.since('restarted', seq) is None
+    assert log.since(epoch, seq + 1) is None
+
+
+def test_frames_carry_their_sequence_number():
+    log = FrameLog()
+    frame = log.append('new_character', {'char': 'E'})
+    assert frame.data['seq'] == 1
+    assert frame.sse(log.epoch).startswith(f"id: {log.epoch}:1\nevent: new_character\n".encode('utf-8'))
+
+
+def test_wait_wakes_up_on_append():
+    log = FrameLog()
+    epoch, seq = log.position()
+    timer = threading.Timer(0.05, log.append, args=('new_character', {'char': 'E'}))
+    timer.start()
+    pending = log.wait(epoch, seq, timeout=5.0)
+    timer.join()
+    assert [frame.seq for frame in pending] == [1]
+
+
+def test_wait_times_out_empty():
+    log = FrameLog()
+    assert log.wait(*log.position(), timeout=0.01) == []
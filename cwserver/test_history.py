@@ -0,0 +1,69 @@
+from history import CharHistory
+
+
+def chars(history):
+    return ''.join(row['char'] for row in history.recent())
+
+
+def test_ring_keeps_the_newest_characters():
+    history = CharHistory(capacity=3)
+    for i, char in enumerate("CQDE"):
+        history.append(char, '10.0.0.7', '#e74c3c', '-.-.', 1000.0 + i)
+    assert chars(history) == "QDE"
+    assert history.start == 1
+    assert history.recent(2)[0]['char'] == 'D'
+    assert history.recent()[0]['morse'] == '-.-.'
+
+
+def test_positions_skip_what_the_ring_overwrote():
+    history = CharHistory(capacity=3)
+    for i, char in enumerate("CQ"):
+        history.append(char, '10.0.0.7', '#e74c3c', '', 1000.0 + i)
+    position = history.position_at()
+    for i, char in enumerate("DE K"):
+        history.append(char, '10.0.0.7', '#e74c3c', '', 1002.0 + i)
+    rows, end = history.read(position)
+    assert [row[3] for row in rows] == ["E", " ", "K"]
+    assert end == history.end_position() == 6
+    assert history.position_at(1004.5) == 5
+
+
+def test_late_character_is_inserted_in_time_order():
+    history = CharHistory(capacity=4)
+    for char, timestamp in (('C', 1.0), ('D', 3.0), ('Q', 2.0)):
+        history.append(char, '10.0.0.7', '#e74c3c', '', timestamp)
+    assert chars(history) == "CQD"
+    assert [row['timestamp'] for row in history.recent()] == [1.0, 2.0, 3.0]
+
+
+def test_late_character_in_a_full_ring_drops_the_oldest():
+    history = CharHistory(capacity=3)
+    for char, timestamp in (('A', 1.0), ('C', 3.0), ('D', 4.0)):
+        history.append(char, '10.0.0.7', '#e74c3c', '', timestamp)
+    history.append('B', '10.0.0.7', '#e74c3c', '', 2.0)
+    assert chars(history) == "BCD"
+    history.append('Z', '10.0.0.7', '#e74c3c', '', 0.5)  # Older than anything kept
+    assert chars(history) == "BCD"
+
+
+def test_full_table_is_compacted_and_ids_renumbered():
+    history = CharHistory(capacity=2)
+    history.device_table.limit = 2
+    history.append('C', '10.0.0.1', '#e74c3c', '', 1.0)
+    history.append('Q', '10.0.0.2', '#3498db', '', 2.0)
+    history.append('D', '10.0.0.2', '#3498db', '', 3.0)  # Overwrites 10.0.0.1's only character
+    history.append('E', '10.0.0.3', '#2ecc71', '', 4.0)
+    assert history.dropped == 0
+    assert history.device_table.values == [('10.0.0.2', '#3498db'), ('10.0.0.3', '#2ecc71')]
+    assert [(row['char'], row['device']) for row in history.recent()] == [('D', '10.0.0.2'), ('E', '10.0.0.3')]
+
+
+def test_character_is_dropped_when_the_table_stays_full():
+    history = CharHistory(capacity=2)
+    history.device_table.limit = 2
+    history.append('C', '10.0.0.1', '#e74c3c', '', 1.0)
+    history.append('Q', '10.0.0.2', '#3498db', '', 2.0)
+    assert history.device_table.intern(('10.0.0.3', '#2ecc71')) is None
+    history.append('D', '10.0.0.3', '#2ecc71', '', 3.0)  # Both stored characters still need their ids
+    assert history.dropped == 1
+    assert chars(history) == "CQ"
@@ -0,0 +1,44 @@
+import socket
+import threading
+
+from ingest import DeviceTurns, shard_by_source_ip
+
+
+def test_connections_from_one_device_forward_in_accept_order():
+    turns = DeviceTurns()
+    tickets = [turns.ticket('10.0.0.7') for _ in range(3)]
+    forwarded = []
+
+    def connection(ticket):
+        turns.wait('10.0.0.7', ticket)
+        forwarded.append(ticket)
+        turns.done('10.0.0.7', ticket)
+
+    # The last accepted connection finishes reading first
+    threads = [threading.Thread(target=connection, args=(ticket,)) for ticket in reversed(tickets)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=2)
+    assert forwarded == [0, 1, 2]
+    assert turns.issued == {} and turns.serving == {}
+
+
+def test_other_devices_do_not_wait():
+    turns = DeviceTurns()
+    turns.ticket('10.0.0.7')  # Still reading
+    ticket = turns.ticket('10.0.0.8')
+    turns.wait('10.0.0.8', ticket)
+    turns.done('10.0.0.8', ticket)
+    assert list(turns.issued) == ['10.0.0.7']
+
+
+def test_sharding_program_is_accepted():
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server_socket.bind(('127.0.0.1', 0))
+        server_socket.listen(1)
+        assert shard_by_source_ip(server_socket, 3)
+    finally:
+        server_socket.close()
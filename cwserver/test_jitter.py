@@ -0,0 +1,41 @@
+import threading
+
+from jitter import JitterBuffer
+
+
+def test_offset_follows_the_fastest_delivery():
+    buffer = JitterBuffer(lambda *args: None)
+    assert buffer.offset('10.0.0.7', 'boot1', 10.0, 1000.3) == 990.3
+    assert round(buffer.offset('10.0.0.7', 'boot1', 11.0, 1001.1), 6) == 990.1
+    assert round(buffer.offset('10.0.0.7', 'boot1', 12.0, 1002.5), 6) == 990.1
+    assert [round(sample, 6) for sample in buffer.jitter] == [0.0, 0.0, 0.4]
+
+
+def test_new_boot_and_forget_drop_the_device_clock():
+    buffer = JitterBuffer(lambda *args: None)
+    buffer.offset('10.0.0.7', 'boot1', 10.0, 1000.0)
+    buffer.offset('10.0.0.8', 'boot1', 10.0, 1000.0)
+    assert buffer.offset('10.0.0.7', 'boot2', 1.0, 1001.0) == 1000.0
+    assert sorted(buffer.offsets) == [('10.0.0.7', 'boot2'), ('10.0.0.8', 'boot1')]
+    buffer.forget('10.0.0.7')
+    assert list(buffer.offsets) == [('10.0.0.8', 'boot1')]
+
+
+def test_events_are_released_in_keying_order():
+    released = []
+    done = threading.Event()
+
+    def release(device, keyed_at, payload):
+        released.append(payload)
+        if len(released) == 4:
+            done.set()
+
+    buffer = JitterBuffer(release, min_delay=0.01)
+    # The second delivery overtook the first on the network
+    buffer.push('10.0.0.7', 'boot1', [(10.2, 'Q'), (10.3, 'D')], arrival=1000.4)
+    buffer.push('10.0.0.7', 'boot1', [(10.0, 'C'), (10.1, 'E')], arrival=1000.5)
+    buffer.start()
+    assert done.wait(2)
+    buffer.running = False
+    assert released == ['C', 'E', 'Q', 'D']
+    assert buffer.stats()['released'] == 4
@@ -0,0 +1,119 @@
+import socket
+
+import bus
+import jitter
+import main
+
+
+def keyed_server():
+    """A standalone server with one completed line and one being keyed"""
+    server = main.MorseFlaskServer()
+    server.register_device('10.0.0.7')
+    server.process_character('C', '-.-.', '10.0.0.7')
+    server.add_new_line()
+    server.process_character('Q', '--.-', '10.0.0.7')
+    return server
+
+
+def send_batch(server, boot, records=(), now=100.0, ip='10.0.0.9'):
+    """Deliver a BATCH over the device port handler; returns the reply"""
+    lines = [f"BATCH: {boot}", f"NOW: {now}", ""]
+    for seq, char, keyed in records:
+        lines += [f"SEQ: {seq}", f"CHAR: {char}", "MORSE: .", f"TIME: {keyed}", ""]
+    device, handler = socket.socketpair()
+    device.sendall(("\n".join(lines) + "\nEND\n").encode('utf-8'))
+    server.handle_morse_client(handler, (ip, 40000))
+    reply = device.recv(100).decode('utf-8')
+    device.close()
+    return reply
+
+
+def stored(server):
+    return ''.join(row['char'] for row in server.message_history.recent())
+
+
+def web_worker():
+    server = main.MorseFlaskServer()
+    server.role = 'web'
+    return server
+
+
+def test_web_worker_mirrors_a_history_snapshot():
+    worker = web_worker()
+    assert worker.on_bus_event('history_snapshot', keyed_server().get_snapshot(), bus.MIRROR_ROOM)
+    assert [line['text'] for line in worker.line_history] == ['C']
+    assert worker.current_line == 'Q'
+    assert list(worker.connected_devices) == ['10.0.0.7']
+    assert worker.connected_devices['10.0.0.7']['char_count'] == 2
+
+
+def test_web_worker_applies_live_events_after_the_snapshot():
+    worker = web_worker()
+    worker.on_bus_event('history_snapshot', keyed_server().get_snapshot(), bus.MIRROR_ROOM)
+    worker.on_bus_event('new_character', {'char': 'R', 'device': '10.0.0.7', 'color': '#e74c3c',
+                                          'morse': '.-.', 'timestamp': 1000.0}, None)
+    assert worker.current_line == 'QR'
+
+
+def test_web_worker_leaves_client_addressed_emits_to_the_local_manager():
+    worker = web_worker()
+    assert not worker.on_bus_event('device_update', {'devices': [], 'count': 0, 'version': 9}, 'some-sid')
+    assert worker.device_version == 0
+    assert worker.on_bus_event('request_clear', {}, bus.INGEST_ROOM)
+
+
+def test_connect_frames_are_encoded_once_per_state_version():
+    server = keyed_server()
+    connect = server.get_connect_frames()
+    assert server.get_connect_frames() is connect
+    assert server.get_resync_frames() == connect[1:]
+    assert [frame.event for frame in connect] == ['status_update', 'device_update', 'history_update']
+    server.process_character('R', '.-.', '10.0.0.7')
+    assert server.get_connect_frames()[2].data['current_line'] == 'QR'
+
+
+def test_empty_batch_probes_the_last_sequence():
+    server = main.MorseFlaskServer()
+    assert send_batch(server, 'boot1') == "ACK: -1\n"
+    send_batch(server, 'boot1', [(1, 'C', 99.0), (2, 'Q', 99.5)])
+    assert send_batch(server, 'boot1') == "ACK: 2\n"
+    assert send_batch(server, 'boot2') == "ACK: -1\n"  # Rebooted
+
+
+def test_resent_records_are_applied_once():
+    server = main.MorseFlaskServer()
+    assert send_batch(server, 'boot1', [(1, 'C', 99.0), (2, 'Q', 99.5)]) == "ACK: 2\n"
+    # The ACK was lost: the device resends with one more record
+    assert send_batch(server, 'boot1', [(1, 'C', 99.0), (2, 'Q', 99.5), (3, 'D', 99.8)]) == "ACK: 3\n"
+    assert stored(server) == "CQD"
+    # A new boot starts its sequence over
+    assert send_batch(server, 'boot2', [(1, 'E', 99.9)]) == "ACK: 1\n"
+    assert stored(server) == "CQDE"
+
+
+def test_backlog_keeps_its_own_breaks_and_skips_the_char_rate():
+    server = main.MorseFlaskServer()
+    server.admission.char_burst = 2
+    records = [(1, 'C', 10.0), (2, 'Q', 10.2), (3, 'D', 13.0), (4, 'E', 13.2), (5, 'K', 40.0)]
+    assert send_batch(server, 'boot1', records) == "ACK: 5\n"
+    assert [line['text'] for line in server.line_history] == ["CQ DE"]
+    assert server.current_line == "K"
+    times = [row['timestamp'] for row in server.message_history.recent()]
+    assert round(times[-1] - times[0], 3) == 30.0  # Placed at their keying times
+
+
+def test_device_sequences_are_bounded():
+    server = main.MorseFlaskServer()
+    server.max_device_sequences = 2
+    for ip in ('10.0.0.1', '10.0.0.2', '10.0.0.1', '10.0.0.3'):
+        send_batch(server, 'boot1', [(1, 'E', 99.0)], ip=ip)
+    assert list(server.device_sequences) == ['10.0.0.1', '10.0.0.3']
+
+
+def test_expired_device_is_forgotten_by_the_jitter_buffer():
+    server = keyed_server()
+    server.jitter = jitter.JitterBuffer(server.release_buffered)
+    server.jitter.offset('10.0.0.7', 'boot1', 10.0, 1000.0)
+    server.connected_devices['10.0.0.7']['last_seen'] -= 60
+    server.cleanup_old_devices()
+    assert server.jitter.offsets == {}
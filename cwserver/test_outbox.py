@@ -0,0 +1,133 @@
+import threading
+import time
+
+import outbox
+from frames import Frame
+from outbox import OutboxDispatcher
+
+
+class FakeServer:
+    """The parts of a python-socketio server the dispatcher uses"""
+
+    def __init__(self):
+        self.log = []        # ('packet', sid, event) and ('disconnect', sid)
+        self.backlog = {}    # eio sid -> packets waiting in the transport
+        self.manager = self
+        self.eio = self
+        self.sockets = {}
+
+    def eio_sid_from_sid(self, sid, namespace):
+        return 'eio-' + sid
+
+    def _send_eio_packet(self, eio_sid, pkt):
+        self.log.append(('packet', eio_sid[4:], pkt.data))
+
+    def disconnect(self, sid, namespace=None):
+        self.log.append(('disconnect', sid))
+
+
+class FakeSocketIO:
+    def __init__(self):
+        self.server = FakeServer()
+
+    def start_background_task(self, target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+def events(server, sid):
+    return [entry[2] for entry in server.log if entry[0] == 'packet' and entry[1] == sid]
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_queued_events_reach_the_client():
+    sio = FakeSocketIO()
+    dispatcher = OutboxDispatcher(sio)
+    dispatcher.add_client('a')
+    dispatcher.start()
+    dispatcher.publish('new_character', {'char': 'E'})
+    assert wait_for(lambda: len(events(sio.server, 'a')) == 1)
+    assert 'new_character' in events(sio.server, 'a')[0]
+    dispatcher.running = False
+
+
+def test_resync_hint_is_sent_before_the_disconnect():
+    sio = FakeSocketIO()
+    dispatcher = OutboxDispatcher(sio, max_queue=2, policy='disconnect')
+    dispatcher.add_client('a')
+    for char in 'CQD':
+        dispatcher.publish('new_character', {'char': char})
+    dispatcher.publish('new_character', {'char': 'X'})  # Not queued any more
+    dispatcher.start()
+    assert wait_for(lambda: ('disconnect', 'a') in sio.server.log)
+    dispatcher.running = False
+    packets = [entry for entry in sio.server.log if entry[1] == 'a']
+    assert len(packets) == 2
+    assert 'resync' in packets[0][2] and 'slow_consumer' in packets[0][2]
+    assert packets[1] == ('disconnect', 'a')
+    assert 'a' not in dispatcher.clients
+    assert dispatcher.disconnected == 1
+
+
+def test_disconnect_waits_for_the_transport_to_take_the_hint():
+    sio = FakeSocketIO()
+    dispatcher = OutboxDispatcher(sio, max_queue=1, policy='disconnect')
+    dispatcher.add_client('a')
+    dispatcher.publish('new_character', {'char': 'C'})
+    dispatcher.publish('new_character', {'char': 'Q'})
+    client = dispatcher.clients['a']
+    client.queue.clear()  # As if the sender had just written the hint
+
+    dispatcher.transport_backlog = lambda eio_sid: 3
+    dispatcher.finish_resync(client, 'eio-a')
+    assert sio.server.log == []
+
+    client.closing -= outbox.RESYNC_GRACE  # A stuck transport is dropped anyway
+    dispatcher.finish_resync(client, 'eio-a')
+    assert sio.server.log == [('disconnect', 'a')]
+
+
+def test_drop_morse_strips_audio_fields():
+    sio = FakeSocketIO()
+    dispatcher = OutboxDispatcher(sio, max_queue=1, policy='drop_morse')
+    dispatcher.add_client('a')
+    dispatcher.publish('new_character', {'char': 'E', 'morse': '.'})
+    dispatcher.publish('new_character', {'char': 'T', 'morse': '-'})
+    client = dispatcher.clients['a']
+    assert client.drop_morse
+    assert all('morse' not in frame.data for frame in client.queue)
+
+
+def test_snapshot_frames_are_shared_and_followed_by_the_position():
+    sio = FakeSocketIO()
+    dispatcher = OutboxDispatcher(sio)
+    snapshot = [Frame(None, 'device_update', {'devices': []}),
+                Frame(None, 'history_update', {'lines': []})]
+    dispatcher.add_client('a', lambda: snapshot)
+    dispatcher.publish('new_character', {'char': 'E'})
+    dispatcher.add_client('b', lambda: snapshot)
+    a, b = dispatcher.clients['a'].queue, dispatcher.clients['b'].queue
+    assert a[0] is b[0] and a[1] is b[1]
+    epoch = dispatcher.frame_log.position()[0]
+    assert (a[2].event, a[2].data) == ('stream_position', {'epoch': epoch, 'seq': 0})
+    assert (b[2].event, b[2].data) == ('stream_position', {'epoch': epoch, 'seq': 1})
+
+
+def test_resuming_client_gets_the_missed_frames_instead_of_the_snapshot():
+    sio = FakeSocketIO()
+    dispatcher = OutboxDispatcher(sio)
+    epoch = dispatcher.frame_log.position()[0]
+    dispatcher.publish('new_character', {'char': 'E'})
+    snapshot = [Frame(None, 'status_update', {'running': True}),
+                Frame(None, 'history_update', {'lines': []})]
+    dispatcher.add_client('a', lambda: snapshot, resume=(epoch, 0))
+    assert [frame.event for frame in dispatcher.clients['a'].queue] == ['status_update', 'new_character']
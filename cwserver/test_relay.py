@@ -0,0 +1,92 @@
+import json
+import zlib
+
+from frames import Frame
+from relay import BatchEncoder, RecentIds, RelayLink, relay_event
+
+
+def character(**fields):
+    data = {'char': 'E', 'morse': '.', 'device': '10.0.0.7', 'timestamp': 1000.0}
+    data.update(fields)
+    return data
+
+
+def receiver(node='C'):
+    applied = []
+    link = RelayLink('http://peer:5000', node, lambda link, events: applied.extend(events))
+    return link, applied
+
+
+def test_local_character_gets_origin_and_path():
+    data = relay_event(Frame(5, 'new_character', character()), 'ep', 'A', requester='B')
+    assert data['origin'] == 'A'
+    assert data['origin_id'] == 'A:ep:5'
+    assert data['device'] == 'A/10.0.0.7'
+    assert data['path'] == ['A']
+    assert 'seq' not in data
+
+
+def test_relayed_character_keeps_its_origin():
+    relayed = character(device='A/10.0.0.7', origin='A', origin_id='A:ep:5', path=['A'])
+    data = relay_event(Frame(9, 'new_character', relayed), 'ep2', 'B', requester='C')
+    assert data['origin_id'] == 'A:ep:5'
+    assert data['device'] == 'A/10.0.0.7'
+    assert data['path'] == ['A', 'B']
+
+
+def test_never_sent_back_along_its_path():
+    relayed = character(device='A/10.0.0.7', origin='A', origin_id='A:ep:5', path=['A'])
+    assert relay_event(Frame(9, 'new_character', relayed), 'ep2', 'B', requester='A') is None
+
+
+def test_only_characters_are_relayed():
+    assert relay_event(Frame(1, 'line_complete', {'text': 'CQ'}), 'ep', 'A', requester='B') is None
+    assert relay_event(Frame(2, 'clear_display', None), 'ep', 'A', requester='B') is None
+
+
+def test_character_that_passed_through_this_server_is_dropped():
+    link, applied = receiver(node='A')
+    link.apply({'epoch': 'ep', 'seq': 3, 'events': [
+        ['new_character', character(origin='A', origin_id='A:ep:1', path=['A', 'B'])]]})
+    assert applied == []
+    assert link.dropped == 1
+    assert (link.epoch, link.seq) == ('ep', 3)
+
+
+def test_duplicate_over_a_second_route_is_applied_once():
+    seen = RecentIds()
+    applied = []
+    on_events = lambda link, events: applied.extend(events)
+    via_b = RelayLink('http://b:5000', 'C', on_events, seen)
+    via_d = RelayLink('http://d:5000', 'C', on_events, seen)
+    data = character(origin='A', origin_id='A:ep:1')
+    via_b.apply({'epoch': 'b', 'seq': 1, 'events': [['new_character', dict(data, path=['A', 'B'])]]})
+    via_d.apply({'epoch': 'd', 'seq': 1, 'events': [['new_character', dict(data, path=['A', 'D'])]]})
+    assert len(applied) == 1
+    assert via_d.dropped == 1
+
+
+def test_recent_ids_are_bounded():
+    seen = RecentIds(maxlen=2)
+    assert seen.add('a') and seen.add('b') and seen.add('c')
+    assert not seen.add('c')
+    assert seen.add('a')  # Forgotten
+
+
+def test_reset_batch_is_counted():
+    link, _ = receiver()
+    link.apply({'epoch': 'ep', 'seq': 1, 'events': []})
+    link.apply({'epoch': 'ep2', 'seq': 7, 'events': [], 'reset': True})
+    assert link.resets == 1
+    assert link.stats()['position'] == 'ep2:7'
+
+
+def test_batches_decode_one_at_a_time_from_the_stream():
+    encoder = BatchEncoder()
+    batches = [{'epoch': 'ep', 'seq': seq, 'events': [['new_character', character()]]}
+               for seq in range(3)]
+    decompressor = zlib.decompressobj()
+    for batch in batches:
+        # Each batch is complete as soon as its chunk arrives
+        line = decompressor.decompress(encoder.encode(batch))
+        assert json.loads(line) == batch
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+import snapshot
+from history import CharHistory
+from transcript import TranscriptIndex
+
+
+def test_pack_unpack_round_trip():
+    sections = {'state': b'{"a":1}', 'history.times': bytes(range(256)) * 4, 'empty': b''}
+    assert snapshot.unpack(snapshot.pack(sections)) == sections
+
+
+def test_damaged_section_is_rejected():
+    data = bytearray(snapshot.pack({'state': b'x' * 1000}))
+    data[-3] ^= 0xFF
+    with pytest.raises(ValueError):
+        snapshot.unpack(bytes(data))
+
+
+def test_truncated_or_foreign_file_is_rejected():
+    data = snapshot.pack({'state': b'x' * 1000})
+    with pytest.raises(ValueError):
+        snapshot.unpack(data[:len(data) // 2])
+    with pytest.raises(ValueError):
+        snapshot.unpack(b'NOTSNAP' + data[7:])
+    with pytest.raises(ValueError):
+        snapshot.unpack(b'')
+
+
+def test_state_round_trip():
+    history = CharHistory(capacity=8)
+    for i, char in enumerate("CQ DE HS1ABC"):
+        history.append(char, f"10.0.0.{i % 2}", '#e74c3c', '-.-.', 1000.0 + i)
+    transcript = TranscriptIndex()
+    transcript.add("CQ DE HS1ABC", ['10.0.0.1'], timestamp=1000.0)
+    state = {'current_line': "CQ", 'next_color_index': 2}
+
+    data = snapshot.pack(snapshot.encode_state(state, history.snapshot(), transcript.snapshot()))
+    state_out, chars, lines = snapshot.decode_state(snapshot.unpack(data))
+
+    restored = CharHistory(capacity=8)
+    restored.restore(chars)
+    restored_transcript = TranscriptIndex()
+    restored_transcript.restore(lines)
+    assert state_out == state
+    assert restored.recent() == history.recent()
+    assert restored_transcript.query(call='HS1*') == transcript.query(call='HS1*')
+
+
+def test_missing_section_is_rejected():
+    sections = snapshot.encode_state({}, CharHistory(capacity=4).snapshot(), TranscriptIndex().snapshot())
+    del sections['history.morse']
+    with pytest.raises(ValueError):
+        snapshot.decode_state(sections)
+
+
+def test_write_replaces_the_file_atomically(tmp_path):
+    path = str(tmp_path / 'state.snap')
+    snapshot.write(path, {'state': b'old'})
+    snapshot.write(path, {'state': b'new'})
+    assert snapshot.read(path) == {'state': b'new'}
+    assert os.listdir(tmp_path) == ['state.snap']
+
+
+def test_writer_saves_only_after_a_change(tmp_path):
+    path = str(tmp_path / 'state.snap')
+    version = [1]
+    collected = []
+
+    def collect():
+        collected.append(version[0])
+        return {'state': str(version[0]).encode('ascii')}
+
+    writer = snapshot.SnapshotWriter(path, collect, lambda: version[0], interval=3600)
+    assert writer.save()
+    assert not writer.save()
+    version[0] = 2
+    writer.stop()
+    assert collected == [1, 2]
+    assert snapshot.read(path) == {'state': b'2'}
@@ -0,0 +1,77 @@
+from transcript import TranscriptIndex, tokenize
+
+
+def texts(lines):
+    return [line['text'] for line in lines]
+
+
+def sample_index():
+    index = TranscriptIndex()
+    index.add("CQ CQ DE HS1ABC K", ['10.0.0.1'], timestamp=100.0)
+    index.add("HS1ABC DE HS2XYZ GM", ['10.0.0.2'], timestamp=200.0)
+    index.add("CQ DX DE JA1ZZZ <AR>", ['10.0.0.3'], timestamp=300.0)
+    index.add("HS2XYZ DE HS1ABC TU 73 <SK>", ['10.0.0.1'], timestamp=400.0)
+    return index
+
+
+def test_tokenize():
+    assert tokenize("cq de hs1abc <AR> 5nn, k") == {'CQ', 'DE', 'HS1ABC', '<AR>', '5NN', 'K'}
+
+
+def test_words_must_all_appear_newest_first():
+    index = sample_index()
+    assert texts(index.query(tokens=['CQ'])) == ["CQ DX DE JA1ZZZ <AR>", "CQ CQ DE HS1ABC K"]
+    assert texts(index.query(tokens=['cq', 'dx'])) == ["CQ DX DE JA1ZZZ <AR>"]
+    assert index.query(tokens=['CQ', 'NOPE']) == []
+
+
+def test_callsign_pattern():
+    index = sample_index()
+    assert len(index.query(call='HS1*')) == 3
+    assert texts(index.query(call='HS?XYZ')) == ["HS2XYZ DE HS1ABC TU 73 <SK>", "HS1ABC DE HS2XYZ GM"]
+    assert index.query(call='VK*') == []
+
+
+def test_device_and_time_range():
+    index = sample_index()
+    assert texts(index.query(device='10.0.0.1')) == ["HS2XYZ DE HS1ABC TU 73 <SK>", "CQ CQ DE HS1ABC K"]
+    assert texts(index.query(since=150.0, until=350.0)) == ["CQ DX DE JA1ZZZ <AR>", "HS1ABC DE HS2XYZ GM"]
+    assert texts(index.query(call='HS1*', device='10.0.0.1', since=150.0)) == ["HS2XYZ DE HS1ABC TU 73 <SK>"]
+
+
+def test_limit():
+    assert len(sample_index().query(limit=2)) == 2
+
+
+def test_oldest_lines_are_evicted_from_the_index():
+    index = TranscriptIndex(capacity=2)
+    index.add("CQ DE HS1ABC", ['a'], timestamp=1.0)
+    index.add("QRZ DE HS2XYZ", ['b'], timestamp=2.0)
+    index.add("CQ DE JA1ZZZ", ['c'], timestamp=3.0)
+    assert len(index) == 2
+    assert texts(index.query(tokens=['CQ'])) == ["CQ DE JA1ZZZ"]
+    assert index.query(call='HS1*') == []
+    assert index.query(device='a') == []
+    assert 'HS1ABC' not in index.vocabulary
+
+
+def test_snapshot_restore_keeps_line_ids():
+    index = sample_index()
+    restored = TranscriptIndex()
+    restored.restore(index.snapshot())
+    assert restored.query(call='JA1*') == index.query(call='JA1*')
+    assert restored.add("NEW", [], timestamp=500.0) == index.next_id
+
+
+def test_clear():
+    index = sample_index()
+    index.clear()
+    assert len(index) == 0
+    assert index.query(tokens=['CQ']) == []
+    assert index.query() == []
+
+
+def test_zero_time_bounds_are_applied():
+    index = sample_index()
+    assert len(index.query(since=0.0)) == 4
+    assert index.query(until=0.0) == []
@@ -0,0 +1,239 @@
+# transcript.py - Searchable transcript of completed lines
+#
+# Completed lines go into a bounded ring with increasing line ids, and an
+# inverted index is updated as each line is added: token -> line ids and
+# device -> line ids.  Posting lists are sorted by construction (ids only
+# grow), so eviction pops from their front together with the ring and
+# intersections are bisect lookups.  Time ranges map to an id range with
+# one bisect over the line timestamps.
+#
+#   /api/query?call=HS1*&since=-3600     who sent an HS1 call in the last hour
+#   /api/query?q=CQ+DX&device=10.0.0.7   lines from one device with both words
+import fnmatch
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+
+TOKEN_RE = re.compile(r'<[A-Z]+>|[A-Z0-9/]+')
+
+
+def tokenize(text):
+    """Distinct upper-case words and prosigns of a line"""
+    return set(TOKEN_RE.findall(text.upper()))
+
+
+class Postings:
+    """Sorted list of line ids; evicted from the front"""
+
+    __slots__ = ('ids', 'head')
+
+    def __init__(self):
+        self.ids = []
+        self.head = 0
+
+    def __len__(self):
+        return len(self.ids) - self.head
+
+    def add(self, line_id):
+        self.ids.append(line_id)
+
+    def evict(self, line_id):
+        if self.head < len(self.ids) and self.ids[self.head] == line_id:
+            self.head += 1
+            if self.head > 64 and self.head * 2 > len(self.ids):
+                del self.ids[:self.head]
+                self.head = 0
+
+    def __contains__(self, line_id):
+        i = bisect_left(self.ids, line_id, self.head)
+        return i < len(self.ids) and self.ids[i] == line_id
+
+    def between(self, low, high):
+        """Ids in [low, high]"""
+        return self.ids[bisect_left(self.ids, low, self.head):bisect_right(self.ids, high, self.head)]
+
+
+class TranscriptIndex:
+    """Bounded line ring with an incrementally maintained inverted index"""
+
+    def __init__(self, capacity=20000):
+        self.capacity = capacity
+        self.lines = []       # ring entries, oldest at self.head
+        self.times = []       # completion time of each entry, for range lookups
+        self.head = 0
+        self.base_id = 0      # line id of self.lines[0]
+        self.next_id = 0
+        self.tokens = {}      # token -> Postings
+        self.devices = {}     # device -> Postings
+        self.vocabulary = []  # sorted tokens, for callsign patterns
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.lines) - self.head
+
+    def add(self, text, devices, timestamp=None):
+        """Index a completed line; evicts the oldest one when full"""
+        timestamp = timestamp or time.time()
+        tokens = tokenize(text)
+        with self.lock:
+            if len(self) >= self.capacity:
+                self._evict_oldest()
+
+            line_id = self.next_id
+            self.next_id += 1
+            self.lines.append({
+                'id': line_id,
+                'text': text,
+                'devices': sorted(devices),
+                'timestamp': timestamp
+            })
+            self.times.append(timestamp)
+
+            for token in tokens:
+                postings = self.tokens.get(token)
+                if postings is None:
+                    postings = self.tokens[token] = Postings()
+                    insort(self.vocabulary, token)
+                postings.add(line_id)
+            for device in devices:
+                postings = self.devices.get(device)
+                if postings is None:
+                    postings = self.devices[device] = Postings()
+                postings.add(line_id)
+            return line_id
+
+    def _evict_oldest(self):
+        line = self.lines[self.head]
+        self.lines[self.head] = None
+        self.head += 1
+
+        for token in tokenize(line['text']):
+            postings = self.tokens[token]
+            postings.evict(line['id'])
+            if not len(postings):
+                del self.tokens[token]
+                del self.vocabulary[bisect_left(self.vocabulary, token)]
+        for device in line['devices']:
+            postings = self.devices[device]
+            postings.evict(line['id'])
+            if not len(postings):
+                del self.devices[device]
+
+        if self.head > 1024 and self.head * 2 > len(self.lines):
+            del self.lines[:self.head]
+            del self.times[:self.head]
+            self.base_id += self.head
+            self.head = 0
+
+    def clear(self):
+        with self.lock:
+            self.base_id = self.next_id
+            self.lines = []
+            self.times = []
+            self.head = 0
+            self.tokens = {}
+            self.devices = {}
+            self.vocabulary = []
+
+    def snapshot(self):
+        """Lines kept and the next line id"""
+        with self.lock:
+            return {'next_id': self.next_id, 'lines': self.lines[self.head:]}
+
+    def restore(self, snapshot):
+        """Rebuild the ring and the index from a snapshot(); line ids are kept"""
+        lines = snapshot['lines'][-self.capacity:] if self.capacity else []
+        with self.lock:
+            self.next_id = lines[0]['id'] if lines else snapshot['next_id']
+        self.clear()
+        for line in lines:
+            self.add(line['text'], line['devices'], line['timestamp'])
+        with self.lock:
+            self.next_id = snapshot['next_id']
+
+    def read(self, line_id, limit=1000):
+        """Up to ``limit`` lines from ``line_id`` on, and the id after them"""
+        with self.lock:
+            first = self.base_id + self.head
+            line_id = max(line_id, first)
+            start = line_id - self.base_id
+            lines = self.lines[start:start + limit]
+        return lines, line_id + len(lines)
+
+    def id_at(self, timestamp=None):
+        """Id of the first line completed at or after ``timestamp``"""
+        with self.lock:
+            if timestamp is None:
+                return self.base_id + self.head
+            return self.base_id + bisect_left(self.times, timestamp, self.head)
+
+    def matching_tokens(self, pattern):
+        """Vocabulary entries matching a callsign pattern ('*' and '?' wildcards)"""
+        pattern = pattern.upper()
+        prefix = re.split(r'[*?\[]', pattern, 1)[0]
+        start = bisect_left(self.vocabulary, prefix)
+        matches = []
+        for token in self.vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            if fnmatch.fnmatchcase(token, pattern):
+                matches.append(token)
+        return matches
+
+    def query(self, tokens=(), call=None, device=None, since=None, until=None, limit=100):
+        """Lines matching every given filter, newest first"""
+        with self.lock:
+            if not len(self):
+                return []
+
+            # Time range -> id range
+            low = self.base_id + bisect_left(self.times, since, self.head) if since is not None else self.base_id + self.head
+            high = self.base_id + bisect_right(self.times, until, self.head) - 1 if until is not None else self.next_id - 1
+
+            # Every filter is a list of posting lists; a line must be in one
+            # list of each filter
+            filters = []
+            for token in tokens:
+                postings = self.tokens.get(token.upper())
+                if postings is None:
+                    return []
+                filters.append([postings])
+            if call:
+                matches = [self.tokens[token] for token in self.matching_tokens(call)]
+                if not matches:
+                    return []
+                filters.append(matches)
+            if device:
+                postings = self.devices.get(device)
+                if postings is None:
+                    return []
+                filters.append([postings])
+
+            if filters:
+                # Walk the smallest filter newest first, check the others by bisect
+                filters.sort(key=lambda lists: sum(len(p) for p in lists))
+                if len(filters[0]) == 1:
+                    candidates = reversed(filters[0][0].between(low, high))
+                else:
+                    candidates = set()
+                    for postings in filters[0]:
+                        candidates.update(postings.between(low, high))
+                    candidates = sorted(candidates, reverse=True)
+                single = [lists[0] for lists in filters[1:] if len(lists) == 1]
+                multiple = [lists for lists in filters[1:] if len(lists) > 1]
+            else:
+                candidates = range(high, low - 1, -1)
+                single = multiple = []
+
+            results = []
+            for line_id in candidates:
+                if not all(line_id in postings for postings in single):
+                    continue
+                if multiple and not all(any(line_id in postings for postings in lists)
+                                        for lists in multiple):
+                    continue
+                results.append(self.lines[line_id - self.base_id])
+                if len(results) >= limit:
+                    break
+            return results
@@ -0,0 +1,69 @@
+# device_protocol.py - Reading and parsing messages from the Pico devices
+#
+# Shared by the web server (cwserver/) and the GUI server.  Devices send
+# either one character per connection
+#
+#   CHAR: A
+#   MORSE: .-
+#
+# or, with store-and-forward firmware, a batch that the receiver answers
+# with "ACK: <last SEQ applied>" before closing:
+#
+#   BATCH: <boot id>
+#   NOW: <device monotonic time>
+#
+#   SEQ: 17
+#   CHAR: A
+#   MORSE: .-
+#   TIME: <device monotonic time the character was keyed>
+#
+#   END
+#
+# SEQ numbers restart with every boot id, so receivers remember the last
+# (boot id, SEQ) applied per device and skip records a resend repeats.
+
+
+def read_device_message(client_socket, max_size=65536):
+    """Read until the device closes the connection or ends its batch"""
+    data = b""
+    while len(data) < max_size:
+        chunk = client_socket.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+        if data.startswith(b"BATCH:") and data.endswith(b"\nEND\n"):
+            break
+    return data
+
+
+def parse_fields(text):
+    """'KEY: value' lines of a message block as a dict"""
+    fields = {}
+    for line in text.strip().split('\n'):
+        key, sep, value = line.partition(':')
+        if sep:
+            fields[key.strip()] = value.strip()
+    return fields
+
+
+def parse_batch(data, max_records=256):
+    """Header fields and (seq, fields) records of a store-and-forward batch"""
+    blocks = data.split('\n\n')
+    header = parse_fields(blocks[0])
+    records = []
+    for block in blocks[1:]:
+        fields = parse_fields(block)
+        try:
+            records.append((int(fields['SEQ']), fields))
+        except (KeyError, ValueError):
+            continue
+    records.sort(key=lambda record: record[0])
+    return header, records[:max_records]
+
+
+def parse_message(data, max_records=256):
+    """Parsed form of a device message, as forwarded to the owner"""
+    if data.startswith("BATCH:"):
+        header, records = parse_batch(data, max_records)
+        return {'kind': 'batch', 'header': header, 'records': records}
+    return {'kind': 'char', 'fields': parse_fields(data)}
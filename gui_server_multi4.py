@@ -1,25 +1,275 @@
 # gui_server.py - Tkinter GUI Server for CW Paddle Morse Code
+#
+# Startup order: bind the device port first, so devices are queued by the
+# kernel instead of refused while the window is built, then the window,
+# then audio in a background thread.  tkinter is only imported for the
+# window and pygame/numpy only by the audio thread; --headless imports
+# neither and just logs what it receives.
+import time
+STARTED = time.perf_counter()
+
+import argparse
 import socket
+import sys
 import threading
-import datetime
-import time
-import tkinter as tk
-from tkinter import ttk
-import pygame
-import numpy as np
+from morse_decoder import MorseDecoder
+from device_protocol import read_device_message, parse_fields, parse_batch
+import cwlog
+from cwlog import log, char_log
 
-class GUIMorseServer:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("CW Paddle Morse Code Server - GUI")
-        self.root.geometry("1000x700")
-        self.root.configure(bg='#2c3e50')
-        
+IMPORTED = time.perf_counter()
+
+# Imported on demand, see load_tk() and GUIMorseServer.setup_audio()
+tk = None
+ttk = None
+pygame = None
+np = None
+
+
+def load_tk():
+    global tk, ttk
+    import tkinter
+    from tkinter import ttk as tkinter_ttk
+    tk, ttk = tkinter, tkinter_ttk
+
+
+def elapsed_ms(since=None):
+    return (time.perf_counter() - (since or STARTED)) * 1000
+
+
+def open_device_port(host, port):
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind((host, port))
+    server_socket.listen(10)
+    return server_socket
+
+
+class MorseServerCore:
+    """Device port, device tracking and decoding; no UI or audio"""
+    
+    def __init__(self, port=12345):
         # Server settings
         self.host = '0.0.0.0'
-        self.port = 12345
+        self.port = port
         self.server_socket = None
         self.running = False
+        self.last_error = None
+        
+        # Multiple device tracking
+        self.connected_devices = {}  # Track connected devices
+        self.device_colors = ['#e74c3c', '#2ecc71', '#3498db', '#f39c12', '#9b59b6', '#1abc9c']  # Red first, then green
+        self.next_color_index = 0
+        
+        # Re-decodes characters older firmware could not resolve
+        self.decoder = MorseDecoder()
+        
+        # Store-and-forward batches: last (boot id, sequence number) per device
+        self.device_sequences = {}
+        self.client_timeout = 5.0
+    
+    def on_new_device(self, client_ip):
+        """Called from the client thread when a device is first seen"""
+    
+    def on_character(self, char, morse, client_ip, device_color):
+        """Called from the client thread for every decoded character"""
+    
+    def listen(self):
+        """Bind the device port; connections queue until start_accepting()"""
+        try:
+            self.server_socket = open_device_port(self.host, self.port)
+            self.running = True
+            return True
+        except Exception as e:
+            log.error(f"Failed to start server: {e}")
+            self.server_socket = None
+            self.last_error = e
+            return False
+    
+    def start_accepting(self):
+        server_thread = threading.Thread(target=self.server_loop)
+        server_thread.daemon = True
+        server_thread.start()
+    
+    def server_loop(self):
+        """Main server loop"""
+        while self.running:
+            try:
+                client_socket, client_address = self.server_socket.accept()
+                
+                # Handle client in separate thread
+                client_thread = threading.Thread(
+                    target=self.handle_client, 
+                    args=(client_socket, client_address)
+                )
+                client_thread.daemon = True
+                client_thread.start()
+                
+            except socket.error as e:
+                if self.running:
+                    log.error(f"Socket error: {e}")
+    
+    def handle_client(self, client_socket, client_address):
+        """Handle individual client connections"""
+        client_ip = client_address[0]
+        
+        # Assign color to device if new
+        if client_ip not in self.connected_devices:
+            device_color = self.device_colors[self.next_color_index % len(self.device_colors)]
+            self.connected_devices[client_ip] = {
+                'color': device_color,
+                'last_seen': time.time(),
+                'char_count': 0
+            }
+            self.next_color_index += 1
+            
+            self.on_new_device(client_ip)
+            log.info("New device connected: %s", client_ip, extra={'fields': {'device': client_ip}})
+        
+        # Update last seen time
+        self.connected_devices[client_ip]['last_seen'] = time.time()
+        
+        try:
+            client_socket.settimeout(self.client_timeout)
+            data = read_device_message(client_socket).decode('utf-8')
+            
+            if data.startswith("BATCH:"):
+                last_seq = self.process_batch(data, client_ip)
+                client_socket.sendall(f"ACK: {last_seq}\n".encode('utf-8'))
+            elif data:
+                self.process_morse_data(data, client_ip)
+                
+        except Exception as e:
+            log.error(f"Error handling client {client_address}: {e}")
+        finally:
+            client_socket.close()
+    
+    def expire_devices(self):
+        """Forget devices not seen for 30 seconds"""
+        current_time = time.time()
+        devices_to_remove = []
+        
+        for ip, info in self.connected_devices.items():
+            if current_time - info['last_seen'] > 30:
+                devices_to_remove.append(ip)
+        
+        for ip in devices_to_remove:
+            del self.connected_devices[ip]
+            log.info("Device disconnected: %s", ip, extra={'fields': {'device': ip}})
+    
+    def process_batch(self, data, client_ip):
+        """Apply a store-and-forward batch; returns the last sequence number taken"""
+        header, records = parse_batch(data)
+        boot = header.get('BATCH', '')
+        seen_boot, last_seq = self.device_sequences.get(client_ip, (None, -1))
+        if seen_boot != boot:
+            last_seq = -1  # Device rebooted, sequence numbers start over
+        
+        for seq, fields in records:
+            if seq <= last_seq:
+                continue  # Already applied, the device missed our ACK
+            last_seq = seq
+            self.process_character(fields.get('CHAR'), fields.get('MORSE'), client_ip)
+        
+        self.device_sequences[client_ip] = (boot, last_seq)
+        return last_seq
+    
+    def process_morse_data(self, data, client_ip):
+        """Process received morse code data"""
+        fields = parse_fields(data)
+        self.process_character(fields.get('CHAR'), fields.get('MORSE'), client_ip)
+    
+    def process_character(self, char, morse, client_ip):
+        """Apply one decoded character from a device"""
+        try:
+            if char and morse:
+                # Skip explicit space characters - we'll handle spacing by timing
+                if char == "[SPACE]":
+                    return
+                
+                # Devices with the old A-Z/0-9 table send '?' for everything else
+                if char == "?" and morse != "..--..":
+                    char = self.decoder.decode(morse) or "?"
+                
+                # Update device character count
+                self.connected_devices[client_ip]['char_count'] += 1
+                
+                device_color = self.connected_devices[client_ip]['color']
+                self.on_character(char, morse, client_ip, device_color)
+                
+                # Console log (formatted and written off this thread)
+                char_log.info("%s -> %s (%s) [Devices: %d]", client_ip, char, morse, len(self.connected_devices),
+                              extra={'fields': {'device': client_ip, 'char': char, 'morse': morse}})
+                
+        except Exception as e:
+            log.error(f"Error processing data: {e}")
+    
+    def stop_server(self):
+        """Stop the server"""
+        self.running = False
+        if self.server_socket:
+            self.server_socket.close()
+    
+    def get_local_ip(self):
+        """Get the local IP address"""
+        try:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.connect(("8.8.8.8", 80))
+            local_ip = s.getsockname()[0]
+            s.close()
+            return local_ip
+        except:
+            return "127.0.0.1"
+
+
+class HeadlessMorseServer(MorseServerCore):
+    """Receive and log without a window or audio (--headless)"""
+    
+    def __init__(self, port=12345, word_gap_time=1.5, newline_timeout=8.0):
+        super().__init__(port)
+        self.word_gap_time = word_gap_time
+        self.newline_timeout = newline_timeout
+        self.current_line = ""
+        self.last_char_time = time.time()
+        self.lock = threading.Lock()
+    
+    def on_character(self, char, morse, client_ip, device_color):
+        with self.lock:
+            self.current_line += char
+            self.last_char_time = time.time()
+    
+    def check_timeout(self):
+        """Word spaces and line ends from the pause since the last character"""
+        with self.lock:
+            if not self.current_line.strip():
+                return
+            pause = time.time() - self.last_char_time
+            if pause > self.newline_timeout:
+                log.info("[LINE] %s", self.current_line.strip(),
+                         extra={'fields': {'text': self.current_line.strip()}})
+                self.current_line = ""
+            elif pause > self.word_gap_time and not self.current_line.endswith(" "):
+                self.current_line += " "
+    
+    def run(self):
+        self.start_accepting()
+        try:
+            while self.running:
+                time.sleep(0.1)
+                self.check_timeout()
+                self.expire_devices()
+        except KeyboardInterrupt:
+            pass
+        self.stop_server()
+
+
+class GUIMorseServer(MorseServerCore):
+    def __init__(self, root, port=12345, server_socket=None):
+        super().__init__(port)
+        self.root = root
+        self.root.title("CW Paddle Morse Code Server - GUI")
+        self.root.geometry("1000x700")
+        self.root.configure(bg='#2c3e50')
         
         # Text display settings
         self.current_line = ""
@@ -31,19 +281,15 @@ class GUIMorseServer:
         self.word_gap_time = 1.5      # Longer pause indicates word boundary  
         self.newline_timeout = 8.0    # seconds before adding newline
         
-        # Multiple device tracking
-        self.connected_devices = {}  # Track connected devices
-        self.device_colors = ['#e74c3c', '#2ecc71', '#3498db', '#f39c12', '#9b59b6', '#1abc9c']  # Red first, then green
-        self.next_color_index = 0
-        
         # Character tracking for mixed colors
         self.current_line_chars = []  # List of (char, color) tuples
         
         # Timing-based spacing
         self.auto_space_added = False  # Track if we already added auto-space
         
-        # Audio setup
-        self.setup_audio()
+        # Audio is set up in the background once the window is up
+        self.audio_enabled = False
+        self.audio_status = "loading"
         
         # Morse timing (15 WPM default to match Pico)
         self.wpm = 15
@@ -55,9 +301,25 @@ class GUIMorseServer:
         # Start timeout checker
         self.check_timeout_timer()
         
+        # Port already opened by main()
+        if server_socket is not None:
+            self.server_socket = server_socket
+            self.running = True
+            self.start_server()
+        
+    def start_audio(self):
+        """Set up audio in a background thread"""
+        audio_thread = threading.Thread(target=self.setup_audio)
+        audio_thread.daemon = True
+        audio_thread.start()
+    
     def setup_audio(self):
         """Setup audio system for morse code tones"""
+        global pygame, np
+        started = time.perf_counter()
         try:
+            import pygame
+            import numpy as np
             pygame.mixer.init(frequency=22050, size=-16, channels=2, buffer=512)
             self.tone_frequency = 600  # Hz (standard CW tone)
             sample_rate = 22050
@@ -67,19 +329,29 @@ class GUIMorseServer:
             self.dah_sound = self.generate_tone(self.tone_frequency, 0.24, sample_rate)
             
             self.audio_enabled = True
+            self.audio_status = "enabled"
+            log.info(f"Audio ready in {elapsed_ms(started):.0f} ms")
             
         except Exception as e:
-            print(f"Audio initialization failed: {e}")
+            log.error(f"Audio initialization failed: {e}")
             self.audio_enabled = False
+            self.audio_status = "disabled"
+        
+        self.root.after(0, self.update_audio_label)
+    
+    def update_audio_label(self):
+        texts = {
+            'loading': "Audio: … Loading",
+            'enabled': "Audio: ✓ Enabled",
+            'disabled': "Audio: ✗ Disabled"
+        }
+        self.audio_label.config(text=texts[self.audio_status])
     
     def generate_tone(self, frequency, duration, sample_rate):
         """Generate a sine wave tone"""
         frames = int(duration * sample_rate)
-        arr = np.zeros((frames, 2))
-        for i in range(frames):
-            wave = np.sin(2 * np.pi * frequency * i / sample_rate)
-            arr[i][0] = wave * 0.3  # Left channel
-            arr[i][1] = wave * 0.3  # Right channel
+        wave = np.sin(2 * np.pi * frequency * np.arange(frames) / sample_rate) * 0.3
+        arr = np.column_stack((wave, wave))  # Left and right channel
         
         arr = (arr * 32767).astype(np.int16)
         return pygame.sndarray.make_sound(arr)
@@ -108,7 +380,7 @@ class GUIMorseServer:
                     elif symbol == '/':
                         time.sleep(self.dot_duration * 4)
             except Exception as e:
-                print(f"Audio playback error: {e}")
+                log.error(f"Audio playback error: {e}")
         
         audio_thread = threading.Thread(target=play_sequence)
         audio_thread.daemon = True
@@ -146,10 +418,10 @@ class GUIMorseServer:
         self.device_count_label.pack()
         
         # Audio status
-        audio_status = "Audio: ✓ Enabled" if self.audio_enabled else "Audio: ✗ Disabled"
-        self.audio_label = tk.Label(status_frame, text=audio_status, 
+        self.audio_label = tk.Label(status_frame, text="", 
                                    font=('Courier', 10), fg='#3498db', bg='#34495e')
         self.audio_label.pack(side='right', padx=10, pady=5)
+        self.update_audio_label()
         
         # Control frame
         control_frame = tk.Frame(self.root, bg='#2c3e50')
@@ -349,12 +621,12 @@ class GUIMorseServer:
             self.total_chars += 1
             self.update_current_line("#95a5a6")
             
-            print(f"[AUTO] Added space after {self.word_gap_time}s pause")
+            char_log.info("[AUTO] Added space after %ss pause", self.word_gap_time)
     
     def add_auto_newline(self):
         """Add an automatic newline based on timing"""
         if self.current_line.strip():  # Only if line has content
-            print(f"[AUTO] Added newline after {self.newline_timeout}s pause")
+            char_log.info("[AUTO] Added newline after %ss pause", self.newline_timeout)
             self.add_new_line()
     
     def clear_text(self):
@@ -386,95 +658,38 @@ class GUIMorseServer:
     
     def start_server(self):
         """Start the server"""
-        try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(10)
-            self.running = True
-            
-            # Update GUI
-            self.status_label.config(text="Server: Running", fg='#2ecc71')
-            self.start_button.config(text="Stop Server", bg='#e74c3c')
-            
-            # Get local IP
-            local_ip = self.get_local_ip()
-            self.connection_label.config(text=f"Listening on {local_ip}:{self.port}")
-            
-            # Start server thread
-            server_thread = threading.Thread(target=self.server_loop)
-            server_thread.daemon = True
-            server_thread.start()
-            
-            print(f"GUI Server started on {self.host}:{self.port}")
-            
-        except Exception as e:
-            print(f"Failed to start server: {e}")
-            self.status_label.config(text=f"Server: Error - {e}", fg='#e74c3c')
-    
-    def server_loop(self):
-        """Main server loop"""
-        while self.running:
-            try:
-                client_socket, client_address = self.server_socket.accept()
-                
-                # Handle client in separate thread
-                client_thread = threading.Thread(
-                    target=self.handle_client, 
-                    args=(client_socket, client_address)
-                )
-                client_thread.daemon = True
-                client_thread.start()
-                
-            except socket.error as e:
-                if self.running:
-                    print(f"Socket error: {e}")
+        if self.server_socket is None and not self.listen():
+            self.status_label.config(text=f"Server: Error - {self.last_error}", fg='#e74c3c')
+            return
+        self.show_listening()
+        self.start_accepting()
     
-    def handle_client(self, client_socket, client_address):
-        """Handle individual client connections"""
-        client_ip = client_address[0]
+    def show_listening(self):
+        # Update GUI
+        self.status_label.config(text="Server: Running", fg='#2ecc71')
+        self.start_button.config(text="Stop Server", bg='#e74c3c')
         
-        # Assign color to device if new
-        if client_ip not in self.connected_devices:
-            device_color = self.device_colors[self.next_color_index % len(self.device_colors)]
-            self.connected_devices[client_ip] = {
-                'color': device_color,
-                'last_seen': time.time(),
-                'char_count': 0
-            }
-            self.next_color_index += 1
-            
-            # Update device count in GUI
-            self.root.after(0, self.update_device_count)
-            print(f"New device connected: {client_ip}")
+        # Get local IP
+        local_ip = self.get_local_ip()
+        self.connection_label.config(text=f"Listening on {local_ip}:{self.port}")
         
-        # Update last seen time
-        self.connected_devices[client_ip]['last_seen'] = time.time()
+        log.info(f"GUI Server started on {self.host}:{self.port}")
+    
+    def on_new_device(self, client_ip):
+        # Update device count in GUI
+        self.root.after(0, self.update_device_count)
+    
+    def on_character(self, char, morse, client_ip, device_color):
+        # Add character to GUI (must be done in main thread)
+        self.root.after(0, lambda: self.add_character(char, client_ip, device_color))
         
-        try:
-            data = client_socket.recv(1024).decode('utf-8')
-            
-            if data:
-                self.process_morse_data(data, client_ip)
-                
-        except Exception as e:
-            print(f"Error handling client {client_address}: {e}")
-        finally:
-            client_socket.close()
+        # Play audio
+        self.play_morse_audio(morse)
     
     def update_device_count(self):
         """Update the device count display"""
         # Clean up old devices (not seen for 30 seconds)
-        current_time = time.time()
-        devices_to_remove = []
-        
-        for ip, info in self.connected_devices.items():
-            if current_time - info['last_seen'] > 30:
-                devices_to_remove.append(ip)
-        
-        for ip in devices_to_remove:
-            del self.connected_devices[ip]
-            print(f"Device disconnected: {ip}")
+        self.expire_devices()
         
         # Update display
         device_count = len(self.connected_devices)
@@ -491,65 +706,17 @@ class GUIMorseServer:
             local_ip = self.get_local_ip()
             self.connection_label.config(text=f"Listening on {local_ip}:{self.port}")
     
-    def process_morse_data(self, data, client_ip):
-        """Process received morse code data"""
-        try:
-            lines = data.strip().split('\n')
-            char = None
-            morse = None
-            
-            for line in lines:
-                if line.startswith("CHAR:"):
-                    char = line.replace("CHAR:", "").strip()
-                elif line.startswith("MORSE:"):
-                    morse = line.replace("MORSE:", "").strip()
-            
-            if char and morse:
-                # Skip explicit space characters - we'll handle spacing by timing
-                if char == "[SPACE]":
-                    return
-                
-                # Update device character count
-                self.connected_devices[client_ip]['char_count'] += 1
-                
-                # Add character to GUI (must be done in main thread)
-                device_color = self.connected_devices[client_ip]['color']
-                self.root.after(0, lambda: self.add_character(char, client_ip, device_color))
-                
-                # Play audio
-                self.play_morse_audio(morse)
-                
-                # Print to console for debugging
-                timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-                device_count = len(self.connected_devices)
-                print(f"[{timestamp}] {client_ip} -> {char} ({morse}) [Devices: {device_count}]")
-                
-        except Exception as e:
-            print(f"Error processing data: {e}")
-    
     def stop_server(self):
         """Stop the server"""
-        self.running = False
-        if self.server_socket:
-            self.server_socket.close()
+        super().stop_server()
+        self.server_socket = None
         
         # Update GUI
         self.status_label.config(text="Server: Stopped", fg='#e74c3c')
         self.start_button.config(text="Start Server", bg='#27ae60')
         self.connection_label.config(text="")
         
-        print("GUI Server stopped")
-    
-    def get_local_ip(self):
-        """Get the local IP address"""
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            local_ip = s.getsockname()[0]
-            s.close()
-            return local_ip
-        except:
-            return "127.0.0.1"
+        log.info("GUI Server stopped")
     
     def on_closing(self):
         """Handle window closing"""
@@ -566,8 +733,44 @@ class GUIMorseServer:
 
 def main():
     """Main function"""
+    parser = argparse.ArgumentParser(description="CW Paddle Morse Code Server - GUI")
+    parser.add_argument('--port', type=int, default=12345, help="device port")
+    parser.add_argument('--headless', action='store_true',
+                        help="no window or audio: receive and log to the console only")
+    parser.add_argument('--no-listen', action='store_true',
+                        help="don't open the device port until Start Server is pressed")
+    cwlog.add_arguments(parser)
+    args = parser.parse_args()
+    cwlog.setup(args.log_format, args.quiet, args.log_char_rate, loggers=())
+    
+    log.info(f"Imports: {(IMPORTED - STARTED) * 1000:.0f} ms")
+    
+    if args.headless:
+        server = HeadlessMorseServer(args.port)
+        if not server.listen():
+            return 1
+        log.info(f"Listening on {server.host}:{server.port} after {elapsed_ms():.0f} ms (headless)")
+        server.run()
+        return 0
+    
+    # Open the port before building the window: devices that connect in
+    # the meantime wait in the listen backlog
+    server_socket = None
+    if not args.no_listen:
+        try:
+            server_socket = open_device_port('0.0.0.0', args.port)
+            log.info(f"Listening on port {args.port} after {elapsed_ms():.0f} ms")
+        except OSError as e:
+            log.error(f"Failed to start server: {e}")
+    
+    load_tk()
     root = tk.Tk()
-    app = GUIMorseServer(root)
+    app = GUIMorseServer(root, args.port, server_socket)
+    
+    def window_ready():
+        log.info(f"Window ready after {elapsed_ms():.0f} ms")
+        app.start_audio()
+    root.after(0, window_ready)
     
     # Handle window closing
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
@@ -576,6 +779,7 @@ def main():
         root.mainloop()
     except KeyboardInterrupt:
         app.on_closing()
+    return 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
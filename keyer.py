@@ -0,0 +1,211 @@
+# keyer.py - Event-driven iambic keyer for the CW paddle
+#
+# Copy this file next to code.py on the Pico W.  Paddle edges come from the
+# keypad module, which debounces in the background and queues events, so the
+# main loop no longer has to poll the pins every millisecond.  The keyer
+# state machine times every element from time.monotonic() deadlines and
+# supports iambic mode A and mode B squeeze keying.
+#
+# The same code runs on a PC with SimulatedPaddles for checking the timing:
+#
+#   python keyer.py
+
+DIT = 0
+DAH = 1
+ELEMENT_CHARS = '.-'
+
+
+class KeypadPaddles:
+    """Paddle edges from keypad.Keys (debounced and queued in the background)"""
+
+    def __init__(self, dit_pin, dah_pin, interval=0.005):
+        import keypad
+        self.keys = keypad.Keys((dit_pin, dah_pin), value_when_pressed=False,
+                                pull=True, interval=interval)
+        self.event = keypad.Event()
+
+    def poll(self, now):
+        events = []
+        while self.keys.events.get_into(self.event):
+            events.append((self.event.key_number, self.event.pressed, now))
+        return events
+
+
+class PolledPaddles:
+    """Fallback for builds without keypad: edge detection on digitalio pins"""
+
+    def __init__(self, dit_pin, dah_pin, debounce=0.005):
+        import digitalio
+        self.pins = []
+        for pin in (dit_pin, dah_pin):
+            io = digitalio.DigitalInOut(pin)
+            io.direction = digitalio.Direction.INPUT
+            io.pull = digitalio.Pull.UP
+            self.pins.append(io)
+        self.debounce = debounce
+        self.state = [False, False]
+        self.changed = [0.0, 0.0]
+
+    def poll(self, now):
+        events = []
+        for paddle in (DIT, DAH):
+            pressed = not self.pins[paddle].value  # pulled up, LOW when pressed
+            if pressed != self.state[paddle] and now - self.changed[paddle] > self.debounce:
+                self.state[paddle] = pressed
+                self.changed[paddle] = now
+                events.append((paddle, pressed, now))
+        return events
+
+
+class SimulatedPaddles:
+    """Scripted paddle edges for running the keyer on a PC"""
+
+    def __init__(self):
+        self.script = []
+
+    def press(self, paddle, at):
+        self.script.append((paddle, True, at))
+        self.script.sort(key=lambda event: event[2])
+
+    def release(self, paddle, at):
+        self.script.append((paddle, False, at))
+        self.script.sort(key=lambda event: event[2])
+
+    def poll(self, now):
+        events = []
+        while self.script and self.script[0][2] <= now:
+            events.append(self.script.pop(0))
+        return events
+
+
+class IambicKeyer:
+    """Iambic mode A/B keyer state machine.
+
+    Feed paddle edges with ``paddle()`` and call ``update(now)`` at least at
+    every ``next_deadline()``.  ``on_element(element, at)`` is called when a
+    dit or dah starts, ``on_key(down, at)`` on every key down/up.
+    """
+
+    def __init__(self, dit_time, mode='B', on_element=None, on_key=None):
+        self.dit_time = dit_time
+        self.mode = mode
+        self.on_element = on_element
+        self.on_key = on_key
+
+        self.pressed = [False, False]
+        self.memory = [False, False]  # opposite paddle tapped during an element
+        self.squeezed = False         # both paddles down during the element
+        self.element = None           # element being keyed
+        self.last_element = None
+        self.element_end = 0.0        # key up time of the current element
+        self.next_start = 0.0         # earliest start of the next element
+        self.last_key_up = 0.0
+
+    def paddle(self, paddle, pressed, at):
+        self.pressed[paddle] = pressed
+        if pressed and self.element is not None and paddle != self.element:
+            self.memory[paddle] = True
+        if self.element is not None and self.pressed[DIT] and self.pressed[DAH]:
+            self.squeezed = True
+
+    def busy(self):
+        """True while an element or its trailing gap is in progress"""
+        return self.element is not None or self.pressed[DIT] or self.pressed[DAH]
+
+    def next_deadline(self):
+        """Next time update() has work to do, None when idle"""
+        if self.element is not None:
+            return self.element_end
+        if self.pressed[DIT] or self.pressed[DAH] or self.memory[DIT] or self.memory[DAH]:
+            return self.next_start
+        if self.mode == 'B' and self.squeezed:
+            return self.next_start
+        return None
+
+    def update(self, now):
+        if self.element is not None and now >= self.element_end:
+            self.last_element = self.element
+            self.element = None
+            self.last_key_up = self.element_end
+            if self.on_key:
+                self.on_key(False, self.element_end)
+
+        if self.element is None and now >= self.next_start:
+            element = self.choose_next()
+            if element is not None:
+                # Keep the element grid while keying continuously
+                start = self.next_start if now - self.next_start < self.dit_time else now
+                self.start_element(element, start)
+
+    def choose_next(self):
+        dit, dah = self.pressed
+        opposite = DIT if self.last_element == DAH else DAH
+        if self.last_element is None:
+            opposite = DIT
+
+        if self.memory[DIT] or self.memory[DAH]:
+            element = DAH if self.memory[DAH] and self.last_element != DAH else DIT
+            if not self.memory[element]:
+                element = DAH if element == DIT else DIT
+        elif dit and dah:
+            element = opposite
+        elif dit:
+            element = DIT
+        elif dah:
+            element = DAH
+        elif self.mode == 'B' and self.squeezed:
+            # Mode B: a squeeze released mid-element adds one opposite element
+            element = opposite
+        else:
+            element = None
+
+        self.memory = [False, False]
+        self.squeezed = False
+        return element
+
+    def start_element(self, element, start):
+        duration = self.dit_time * (3 if element == DAH else 1)
+        self.element = element
+        self.element_end = start + duration
+        self.next_start = self.element_end + self.dit_time
+        self.squeezed = self.pressed[DIT] and self.pressed[DAH]
+        if self.on_key:
+            self.on_key(True, start)
+        if self.on_element:
+            self.on_element(element, start)
+
+
+def simulate(paddles, keyer, until, step=0.001):
+    """Run a keyer against simulated paddles; returns [(element, start)]"""
+    elements = []
+    previous = keyer.on_element
+
+    def record(element, at):
+        elements.append((ELEMENT_CHARS[element], round(at, 3)))
+        if previous:
+            previous(element, at)
+
+    keyer.on_element = record
+    now = 0.0
+    while now <= until:
+        for paddle, pressed, at in paddles.poll(now):
+            keyer.paddle(paddle, pressed, at)
+        keyer.update(now)
+        now += step
+    keyer.on_element = previous
+    return elements
+
+
+if __name__ == '__main__':
+    dit_time = 0.08  # 15 WPM
+    for mode in ('A', 'B'):
+        # Squeeze dah then dit and let go during the third element:
+        # mode A stops there (K), mode B adds one more dit (C)
+        paddles = SimulatedPaddles()
+        paddles.press(DAH, 0.0)
+        paddles.press(DIT, 0.05)
+        paddles.release(DAH, 0.5)
+        paddles.release(DIT, 0.5)
+        keyer = IambicKeyer(dit_time, mode)
+        elements = simulate(paddles, keyer, 1.5)
+        print(f"Mode {mode}: {''.join(e for e, _ in elements)}  {elements}")
@@ -0,0 +1,150 @@
+# morse_decoder.py - Table-driven Morse decoder shared by the Pico and the servers
+#
+# Copy this file next to code.py on the Pico W; the servers import it from
+# the repository root.  Runs on CircuitPython and CPython.
+#
+# The code table is compiled once into a binary dit/dah tree stored in a
+# bytearray: the root is index 1, a dit moves to 2*i and a dah to 2*i + 1.
+# Decoding a letter is one index step per element and a single lookup at
+# the letter gap - no strings are built on the way.
+
+MAX_ELEMENTS = 9  # longest pattern in the table (SOS)
+TREE_SIZE = 1 << (MAX_ELEMENTS + 1)
+
+# ITU-R M.1677-1 characters
+ITU_TABLE = (
+    ('.-', 'A'), ('-...', 'B'), ('-.-.', 'C'), ('-..', 'D'), ('.', 'E'),
+    ('..-.', 'F'), ('--.', 'G'), ('....', 'H'), ('..', 'I'), ('.---', 'J'),
+    ('-.-', 'K'), ('.-..', 'L'), ('--', 'M'), ('-.', 'N'), ('---', 'O'),
+    ('.--.', 'P'), ('--.-', 'Q'), ('.-.', 'R'), ('...', 'S'), ('-', 'T'),
+    ('..-', 'U'), ('...-', 'V'), ('.--', 'W'), ('-..-', 'X'), ('-.--', 'Y'),
+    ('--..', 'Z'),
+    ('-----', '0'), ('.----', '1'), ('..---', '2'), ('...--', '3'), ('....-', '4'),
+    ('.....', '5'), ('-....', '6'), ('--...', '7'), ('---..', '8'), ('----.', '9'),
+    ('.-.-.-', '.'), ('--..--', ','), ('..--..', '?'), ('.----.', "'"),
+    ('-.-.--', '!'), ('-..-.', '/'), ('-.--.', '('), ('-.--.-', ')'),
+    ('.-...', '&'), ('---...', ':'), ('-.-.-.', ';'), ('-...-', '='),
+    ('.-.-.', '+'), ('-....-', '-'), ('..--.-', '_'), ('.-..-.', '"'),
+    ('...-..-', '$'), ('.--.-.', '@'),
+)
+
+# Prosigns share patterns with some punctuation; when enabled they win
+PROSIGNS = (
+    ('.-.-.', '<AR>'),      # end of message (+)
+    ('...-.-', '<SK>'),     # end of contact
+    ('-...-', '<BT>'),      # break (=)
+    ('-.--.', '<KN>'),      # go ahead, named station only (()
+    ('.-...', '<AS>'),      # wait (&)
+    ('-.-.-', '<CT>'),      # attention
+    ('...-.', '<SN>'),      # understood
+    ('........', '<HH>'),   # error
+    ('...---...', '<SOS>'),
+)
+
+
+def pattern_index(pattern):
+    """Tree index of a '.-' pattern"""
+    index = 1
+    for element in pattern:
+        index = index * 2 + (1 if element == '-' else 0)
+    return index
+
+
+def index_pattern(index):
+    """'.-' pattern of a tree index (only needed for the fallback)"""
+    elements = []
+    while index > 1:
+        elements.append('-' if index & 1 else '.')
+        index >>= 1
+    elements.reverse()
+    return ''.join(elements)
+
+
+def build_tree(prosigns=True):
+    """Compile the tables into (tree, symbols, indices)"""
+    tree = bytearray(TREE_SIZE)
+    symbols = ['']  # slot 0 means "no symbol"
+    indices = [0]
+    table = ITU_TABLE + PROSIGNS if prosigns else ITU_TABLE
+    for pattern, symbol in table:
+        symbols.append(symbol)
+        indices.append(pattern_index(pattern))
+        tree[indices[-1]] = len(symbols) - 1
+    return tree, tuple(symbols), tuple(indices)
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance of two short patterns, or limit + 1 if above it"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        best = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if current[j] < best:
+                best = current[j]
+        if best > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class MorseDecoder:
+    """Element-by-element decoder over the precompiled tree"""
+
+    def __init__(self, prosigns=True, max_distance=1):
+        self.tree, self.symbols, self.indices = build_tree(prosigns)
+        self.max_distance = max_distance
+        self.index = 1
+
+    def dit(self):
+        self.index = self.index * 2
+
+    def dah(self):
+        self.index = self.index * 2 + 1
+
+    def pending(self):
+        """True while a letter is being keyed"""
+        return self.index > 1
+
+    def end_letter(self):
+        """Decode the elements keyed since the last letter gap"""
+        index = self.index
+        self.index = 1
+        return self.lookup(index)
+
+    def reset(self):
+        self.index = 1
+
+    def lookup(self, index):
+        """Symbol at a tree index, falling back to the nearest pattern"""
+        if index < TREE_SIZE and self.tree[index]:
+            return self.symbols[self.tree[index]]
+        if index <= 1:
+            return None
+        return self.nearest(index_pattern(index))
+
+    def decode(self, pattern):
+        """Decode a whole '.-' pattern, None if nothing is close enough"""
+        if len(pattern) > MAX_ELEMENTS:
+            return self.nearest(pattern)
+        return self.lookup(pattern_index(pattern))
+
+    def nearest(self, pattern):
+        """Closest known pattern within max_distance edits (first in table order wins)"""
+        if not self.max_distance:
+            return None
+        best = None
+        best_distance = self.max_distance + 1
+        for slot in range(1, len(self.symbols)):
+            index = self.indices[slot]
+            if self.tree[index] != slot:
+                continue  # pattern taken over by a prosign
+            distance = edit_distance(pattern, index_pattern(index), self.max_distance)
+            if distance < best_distance:
+                best = self.symbols[slot]
+                best_distance = distance
+        return best
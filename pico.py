@@ -6,6 +6,11 @@ import socketpool
 import time
 import board
 import digitalio
+import random
+
+# Shared decoder and keyer - copy morse_decoder.py and keyer.py to the Pico next to code.py
+from morse_decoder import MorseDecoder
+from keyer import IambicKeyer, KeypadPaddles, PolledPaddles, DIT, ELEMENT_CHARS
 
 # WiFi Configuration
 WIFI_SSID = "HD_2.4G"
@@ -22,17 +27,6 @@ DIT_PIN = board.GP15    # Dit paddle (dot)
 DAH_PIN = board.GP10    # Dah paddle (dash) 
 LED_PIN = board.LED     # Onboard LED (correct for Pico W)
 
-# Morse Code Dictionary (reverse lookup)
-MORSE_TO_CHAR = {
-    '.-': 'A', '-...': 'B', '-.-.': 'C', '-..': 'D', '.': 'E', '..-.': 'F',
-    '--.': 'G', '....': 'H', '..': 'I', '.---': 'J', '-.-': 'K', '.-..': 'L',
-    '--': 'M', '-.': 'N', '---': 'O', '.--.': 'P', '--.-': 'Q', '.-.': 'R',
-    '...': 'S', '-': 'T', '..-': 'U', '...-': 'V', '.--': 'W', '-..-': 'X',
-    '-.--': 'Y', '--..': 'Z',
-    '-----': '0', '.----': '1', '..---': '2', '...--': '3', '....-': '4',
-    '.....': '5', '-....': '6', '--...': '7', '---..': '8', '----.': '9'
-}
-
 # CW Speed Configuration
 WPM = 15                # Words per minute (adjust as needed: 5-40 typical range)
 
@@ -40,24 +34,84 @@ WPM = 15                # Words per minute (adjust as needed: 5-40 typical range
 # Standard: PARIS = 50 dit units, so dit_time = 1.2 / WPM
 DIT_TIME = 1.2 / WPM    # Base timing unit
 DAH_TIME = DIT_TIME * 3 # Dash is 3 times dit
-ELEMENT_GAP = DIT_TIME  # Gap between dits and dahs
 LETTER_GAP = DIT_TIME * 3  # Gap between letters
 WORD_GAP = DIT_TIME * 7    # Gap between words
 
-# Paddle timing (from your simulator)
-DEBOUNCE_TIME = 0.005   # 5ms debounce (faster than before)
-LOOP_DELAY = 0.001      # 1ms loop delay for responsiveness
+# Keyer configuration
+KEYER_MODE = 'B'        # Iambic mode 'A' or 'B'
+DEBOUNCE_TIME = 0.005   # 5ms debounce (done by keypad in the background)
+MAX_SLEEP = 0.005       # Longest idle sleep; keyer deadlines wake the loop earlier
+LOG_ELEMENTS = False    # Log every element (buffered, printed at letter gaps)
+
+# Store-and-forward while WiFi or the server is unreachable
+BUFFER_SIZE = 256       # Events kept while the link is down (oldest dropped first)
+BATCH_SIZE = 64         # Events sent per connection when flushing the backlog
+RECONNECT_MIN = 1.0     # First retry delay in seconds
+RECONNECT_MAX = 60.0    # Retry delay ceiling (doubles after every failure)
+
+
+class BufferedLog:
+    """Collects log lines and prints them in one go outside keying"""
+
+    def __init__(self, enabled, max_lines=32):
+        self.enabled = enabled
+        self.max_lines = max_lines
+        self.lines = []
+
+    def add(self, line):
+        if self.enabled:
+            if len(self.lines) >= self.max_lines:
+                self.lines.pop(0)
+            self.lines.append(line)
+
+    def flush(self):
+        if self.lines:
+            print("\n".join(self.lines))
+            self.lines = []
+
+
+class EventBuffer:
+    """Bounded ring of outgoing events with sequence numbers and timestamps"""
+
+    def __init__(self, size):
+        self.events = [None] * size
+        self.size = size
+        self.start = 0      # Slot of the oldest event
+        self.count = 0
+        self.next_seq = 0
+        self.dropped = 0
+
+    def add(self, char, morse, timestamp):
+        if self.count == self.size:
+            # Full: the oldest event makes room
+            self.events[self.start] = None
+            self.start = (self.start + 1) % self.size
+            self.count -= 1
+            self.dropped += 1
+        self.events[(self.start + self.count) % self.size] = (self.next_seq, char, morse, timestamp)
+        self.count += 1
+        self.next_seq += 1
+
+    def peek(self, limit):
+        """Oldest events, up to limit, without removing them"""
+        return [self.events[(self.start + i) % self.size] for i in range(min(limit, self.count))]
+
+    def ack(self, seq):
+        """Drop every event up to and including seq"""
+        while self.count and self.events[self.start][0] <= seq:
+            self.events[self.start] = None
+            self.start = (self.start + 1) % self.size
+            self.count -= 1
+
 
 class MorsePaddle:
     def __init__(self):
-        # Setup paddle pins with pull-up resistors
-        self.dit_paddle = digitalio.DigitalInOut(DIT_PIN)
-        self.dit_paddle.direction = digitalio.Direction.INPUT
-        self.dit_paddle.pull = digitalio.Pull.UP
-        
-        self.dah_paddle = digitalio.DigitalInOut(DAH_PIN)
-        self.dah_paddle.direction = digitalio.Direction.INPUT
-        self.dah_paddle.pull = digitalio.Pull.UP
+        # Paddle edges: keypad scans and debounces in the background,
+        # plain polling is the fallback on builds without it
+        try:
+            self.paddles = KeypadPaddles(DIT_PIN, DAH_PIN, interval=DEBOUNCE_TIME)
+        except ImportError:
+            self.paddles = PolledPaddles(DIT_PIN, DAH_PIN, debounce=DEBOUNCE_TIME)
         
         # Setup LED
         self.led = digitalio.DigitalInOut(LED_PIN)
@@ -65,17 +119,23 @@ class MorsePaddle:
         
         # State variables
         self.current_morse = ""
+        self.decoder = MorseDecoder()  # ITU table + prosigns, near-miss fallback
         self.last_activity = time.monotonic()
         self.socket_pool = None
         self.connected = False
+        self.log = BufferedLog(LOG_ELEMENTS)
         
-        # Paddle state tracking (from your simulator)
-        self.dit_pressed = False
-        self.dah_pressed = False
-        self.last_dit_state = True
-        self.last_dah_state = True
-        self.last_dit_time = 0
-        self.last_dah_time = 0
+        # Outgoing events survive link outages; the server drops repeats by
+        # (boot id, sequence number)
+        self.buffer = EventBuffer(BUFFER_SIZE)
+        self.boot_id = "%08x" % random.getrandbits(32)
+        self.retry_delay = RECONNECT_MIN
+        self.next_retry = 0
+        self.in_word = False  # A character was sent since the last space
+        
+        # Iambic keyer times the elements; the LED follows the key
+        self.keyer = IambicKeyer(DIT_TIME, KEYER_MODE,
+                                 on_element=self.on_element, on_key=self.on_key)
         
     def connect_to_wifi(self):
         """Connect to WiFi network"""
@@ -84,140 +144,153 @@ class MorsePaddle:
             wifi.radio.connect(WIFI_SSID, WIFI_PASSWORD)
             print(f"Connected to WiFi!")
             print(f"IP Address: {wifi.radio.ipv4_address}")
-            self.socket_pool = socketpool.SocketPool(wifi.radio)
+            if self.socket_pool is None:
+                self.socket_pool = socketpool.SocketPool(wifi.radio)
             return True
         except Exception as e:
             print(f"WiFi connection failed: {e}")
             return False
     
     def send_character(self, char, morse_code):
-        """Send a single character and its morse code to server"""
+        """Queue a character and its morse code for the server"""
+        self.buffer.add(char, morse_code, time.monotonic())
+        self.in_word = True
+        self.flush()
+    
+    def send_space(self):
+        """Queue a space after a word; idle gaps after that add nothing, so
+        an outage cannot fill the buffer with spaces"""
+        if not self.in_word:
+            return
+        self.in_word = False
+        self.buffer.add("[SPACE]", "/", time.monotonic())
+        self.flush()
+    
+    def flush(self):
+        """Send buffered events in batches; False if the link went down"""
+        if not self.connected:
+            return False
+        
+        while self.buffer.count:
+            batch = self.buffer.peek(BATCH_SIZE)
+            try:
+                acked = self.send_batch(batch)
+            except Exception as e:
+                self.link_down(e)
+                return False
+            self.buffer.ack(acked)
+            
+            if len(batch) == 1:
+                seq, char, morse, _ = batch[0]
+                print(f"Sent: '{char}' ({morse})")
+            else:
+                print(f"Flushed {len(batch)} buffered events")
+        
+        # Flash LED to confirm transmission
+        self.led.value = True
+        time.sleep(0.05)
+        self.led.value = False
+        return True
+    
+    def send_batch(self, batch):
+        """Send events in one connection; returns the last sequence number acknowledged"""
+        sock = self.socket_pool.socket(self.socket_pool.AF_INET, self.socket_pool.SOCK_STREAM)
         try:
-            # Create socket
-            sock = self.socket_pool.socket(self.socket_pool.AF_INET, self.socket_pool.SOCK_STREAM)
             sock.settimeout(2.0)  # 2 second timeout
-            
-            # Connect to server
             sock.connect((SERVER_IP, SERVER_PORT))
             
-            # Prepare message
-            message = f"CHAR: {char}\nMORSE: {morse_code}\nTIME: {time.monotonic()}\n"
+            # Header, one block per event, END so the server knows it has everything
+            parts = [f"BATCH: {self.boot_id}\nNOW: {time.monotonic()}\n"]
+            for seq, char, morse, timestamp in batch:
+                parts.append(f"\nSEQ: {seq}\nCHAR: {char}\nMORSE: {morse}\nTIME: {timestamp}\n")
+            parts.append("\nEND\n")
+            message = "".join(parts).encode('utf-8')
             
-            # Send the message
-            sock.send(message.encode('utf-8'))
-            sock.close()
+            sent = 0
+            while sent < len(message):
+                sent += sock.send(message[sent:])
             
-            print(f"Sent: '{char}' ({morse_code})")
-            
-            # Flash LED to confirm transmission
+            reply = bytearray(32)
+            size = sock.recv_into(reply)
+            text = bytes(reply[:size]).decode('utf-8')
+            if not text.startswith("ACK:"):
+                raise OSError(f"unexpected reply {text!r}")
+            return int(text[4:].strip())
+        finally:
+            sock.close()
+    
+    def link_down(self, error):
+        """Start backing off after a failed send or connect"""
+        self.connected = False
+        self.next_retry = time.monotonic() + self.retry_delay
+        print(f"Link down ({error}), {self.buffer.count} events buffered, "
+              f"retry in {self.retry_delay:.0f}s")
+        self.retry_delay = min(self.retry_delay * 2, RECONNECT_MAX)
+        
+        # Error indication - 3 quick flashes
+        for _ in range(3):
             self.led.value = True
             time.sleep(0.05)
             self.led.value = False
-            
-        except Exception as e:
-            print(f"Error sending character: {e}")
-            # Error indication - 3 quick flashes
-            for _ in range(3):
-                self.led.value = True
-                time.sleep(0.05)
-                self.led.value = False
-                time.sleep(0.05)
-    
-    def send_space(self):
-        """Send a space character to server"""
-        try:
-            sock = self.socket_pool.socket(self.socket_pool.AF_INET, self.socket_pool.SOCK_STREAM)
-            sock.settimeout(2.0)
-            sock.connect((SERVER_IP, SERVER_PORT))
-            
-            message = f"CHAR: [SPACE]\nMORSE: /\nTIME: {time.monotonic()}\n"
-            sock.send(message.encode('utf-8'))
-            sock.close()
-            
-            print("Sent: [SPACE]")
-            
-        except Exception as e:
-            print(f"Error sending space: {e}")
-    
-    def play_element(self, duration):
-        """Play a morse code element (dit or dah) with LED"""
-        self.led.value = True
-        time.sleep(duration)
-        self.led.value = False
-        time.sleep(ELEMENT_GAP)
+            time.sleep(0.05)
     
-    def read_paddle_input(self):
-        """Read paddle input with proper debouncing (from your simulator)"""
-        current_time = time.monotonic()
-        element_detected = None
+    def service_link(self, current_time):
+        """Reconnect with exponential backoff and flush the backlog"""
+        if self.connected or current_time < self.next_retry:
+            return
         
-        # === DIT PADDLE HANDLING ===
-        current_dit_state = self.dit_paddle.value
-        if (current_dit_state != self.last_dit_state and 
-            current_time - self.last_dit_time > DEBOUNCE_TIME):
-            
-            if not current_dit_state:  # Pressed (LOW)
-                if not self.dit_pressed:
-                    self.dit_pressed = True
-                    element_detected = 'dit_start'
-            else:  # Released (HIGH)
-                if self.dit_pressed:
-                    self.dit_pressed = False
-                    element_detected = 'dit_end'
-            
-            self.last_dit_state = current_dit_state
-            self.last_dit_time = current_time
-        
-        # === DAH PADDLE HANDLING ===
-        current_dah_state = self.dah_paddle.value
-        if (current_dah_state != self.last_dah_state and 
-            current_time - self.last_dah_time > DEBOUNCE_TIME):
-            
-            if not current_dah_state:  # Pressed (LOW)
-                if not self.dah_pressed:
-                    self.dah_pressed = True
-                    element_detected = 'dah_start'
-            else:  # Released (HIGH)
-                if self.dah_pressed:
-                    self.dah_pressed = False
-                    element_detected = 'dah_end'
-            
-            self.last_dah_state = current_dah_state
-            self.last_dah_time = current_time
-        
-        # Update LED to show paddle state
-        self.led.value = self.dit_pressed or self.dah_pressed
+        if (self.socket_pool is None or wifi.radio.ipv4_address is None) and not self.connect_to_wifi():
+            self.link_down("no WiFi")
+            return
         
-        return element_detected
+        self.connected = True
+        if not self.buffer.count:
+            # Nothing to flush: an empty batch checks that the server answers
+            try:
+                self.send_batch([])
+            except Exception as e:
+                self.link_down(e)
+                return
+        if self.flush():
+            self.retry_delay = RECONNECT_MIN
+            if self.buffer.dropped:
+                print(f"Link restored ({self.buffer.dropped} events were dropped while down)")
+                self.buffer.dropped = 0
+            else:
+                print("Link restored")
+    
+    def on_element(self, element, at):
+        """Keyer started a dit or dah"""
+        self.current_morse += ELEMENT_CHARS[element]
+        if element == DIT:
+            self.decoder.dit()
+        else:
+            self.decoder.dah()
+        self.log.add(f"{at:.3f} {ELEMENT_CHARS[element]} - Current: {self.current_morse}")
+    
+    def on_key(self, down, at):
+        """Key down/up from the keyer"""
+        self.led.value = down
+        self.last_activity = at
     
     def process_morse_input(self):
-        """Process morse code input from paddle"""
+        """Feed paddle events to the keyer and detect letter/word gaps"""
         current_time = time.monotonic()
         
-        # Read current paddle state with debouncing
-        paddle_event = self.read_paddle_input()
-        
-        if paddle_event:
-            # Update last activity time
+        for paddle, pressed, at in self.paddles.poll(current_time):
+            self.keyer.paddle(paddle, pressed, at)
             self.last_activity = current_time
-            
-            if paddle_event == 'dit_start':
-                print("Dit pressed")
-            elif paddle_event == 'dit_end':
-                self.current_morse += '.'
-                print(f"Dit complete - Current: {self.current_morse}")
-                
-            elif paddle_event == 'dah_start':
-                print("Dah pressed")
-            elif paddle_event == 'dah_end':
-                self.current_morse += '-'
-                print(f"Dah complete - Current: {self.current_morse}")
+        self.keyer.update(current_time)
+        
+        if self.keyer.busy():
+            return
         
         # Check for letter completion (no activity for LETTER_GAP time)
-        elif self.current_morse and (current_time - self.last_activity > LETTER_GAP):
-            # Try to decode the morse code
-            if self.current_morse in MORSE_TO_CHAR:
-                char = MORSE_TO_CHAR[self.current_morse]
+        if self.current_morse and (current_time - self.last_activity > LETTER_GAP):
+            # Decode the elements keyed since the last gap
+            char = self.decoder.end_letter()
+            self.log.flush()
+            if char:
                 self.send_character(char, self.current_morse)
             else:
                 print(f"Unknown morse code: {self.current_morse}")
@@ -233,6 +306,15 @@ class MorsePaddle:
             self.send_space()
             self.last_activity = current_time  # Reset timer
     
+    def idle_sleep(self):
+        """Sleep until the keyer's next deadline, at most MAX_SLEEP"""
+        delay = MAX_SLEEP
+        deadline = self.keyer.next_deadline()
+        if deadline is not None:
+            delay = min(delay, deadline - time.monotonic())
+        if delay > 0:
+            time.sleep(delay)
+    
     def status_blink(self):
         """Blink LED to show system is running"""
         self.led.value = True
@@ -248,24 +330,19 @@ class MorsePaddle:
         print("LED: Onboard LED")
         print(f"Speed: {WPM} WPM")
         print(f"Dit time: {DIT_TIME:.3f}s")
+        print(f"Keyer: iambic mode {KEYER_MODE}")
         print()
         
-        # Connect to WiFi
-        if not self.connect_to_wifi():
-            print("Cannot proceed without WiFi connection")
-            while True:
-                # Error blink pattern
-                for _ in range(5):
-                    self.led.value = True
-                    time.sleep(0.1)
-                    self.led.value = False
-                    time.sleep(0.1)
-                time.sleep(2)
+        # Connect to WiFi; without it characters are buffered until it comes back
+        if self.connect_to_wifi():
+            self.connected = True
+            print(f"Sending to server at {SERVER_IP}:{SERVER_PORT}")
+        else:
+            self.link_down("no WiFi")
         
-        print(f"Connected to server at {SERVER_IP}:{SERVER_PORT}")
         print("Ready for CW input!")
-        print("- Short press Dit paddle for dots (.)")
-        print("- Short press Dah paddle for dashes (-)")
+        print("- Hold Dit paddle for dots (.), Dah paddle for dashes (-)")
+        print("- Squeeze both paddles for alternating elements")
         print("- Pause between letters to send character")
         print("- Longer pause between words to send space")
         print()
@@ -285,15 +362,19 @@ class MorsePaddle:
                 # Process paddle input
                 self.process_morse_input()
                 
-                # Status blink every 5 seconds when idle
+                # Reconnect only between letters: joining WiFi blocks
                 current_time = time.monotonic()
+                if not self.keyer.busy() and not self.current_morse:
+                    self.service_link(current_time)
+                
+                # Status blink every 5 seconds when idle
                 if (current_time - last_status_blink > 5.0 and 
                     current_time - self.last_activity > 2.0):
                     self.status_blink()
                     last_status_blink = current_time
                 
-                # Small delay for responsiveness (from your simulator)
-                time.sleep(LOOP_DELAY)
+                # Wait for the next keyer deadline instead of a fixed 1ms tick
+                self.idle_sleep()
                 
             except KeyboardInterrupt:
                 print("\nProgram interrupted")
@@ -0,0 +1,113 @@
+import socket
+import threading
+
+from device_protocol import parse_batch, parse_fields, parse_message, read_device_message
+from gui_server_multi4 import MorseServerCore
+
+
+def batch(boot, *records):
+    """A store-and-forward message with (seq, char, morse) records"""
+    blocks = [f"BATCH: {boot}\nNOW: 100.0\n"]
+    blocks += [f"SEQ: {seq}\nCHAR: {char}\nMORSE: {morse}\nTIME: 99.0\n" for seq, char, morse in records]
+    return '\n'.join(blocks) + "\nEND\n"
+
+
+class RecordingServer(MorseServerCore):
+    """Receiver that keeps the characters it would have shown"""
+
+    def __init__(self):
+        super().__init__()
+        self.received = []
+
+    def on_character(self, char, morse, client_ip, device_color):
+        self.received.append(char)
+
+
+def deliver(server, data, ip='10.0.0.7'):
+    """Send one device message through handle_client; returns the reply"""
+    device, receiver = socket.socketpair()
+    thread = threading.Thread(target=server.handle_client, args=(receiver, (ip, 50000)))
+    thread.start()
+    device.sendall(data.encode('utf-8'))
+    reply = device.recv(64).decode('utf-8')
+    thread.join()
+    device.close()
+    return reply
+
+
+def test_parse_fields_ignores_lines_without_a_colon():
+    assert parse_fields("CHAR: A\nMORSE: .-\ngarbage\n") == {'CHAR': 'A', 'MORSE': '.-'}
+
+
+def test_parse_batch_sorts_records_and_skips_bad_ones():
+    data = batch('b1', (2, 'B', '-...'), (1, 'A', '.-')) + "\nSEQ: x\nCHAR: C\n"
+    header, records = parse_batch(data)
+    assert header == {'BATCH': 'b1', 'NOW': '100.0'}
+    assert [(seq, fields['CHAR']) for seq, fields in records] == [(1, 'A'), (2, 'B')]
+
+
+def test_parse_batch_limits_the_record_count():
+    data = batch('b1', *[(seq, 'E', '.') for seq in range(10)])
+    _, records = parse_batch(data, max_records=3)
+    assert [seq for seq, _ in records] == [0, 1, 2]
+
+
+def test_parse_message_kinds():
+    assert parse_message("CHAR: E\nMORSE: .\n") == {'kind': 'char', 'fields': {'CHAR': 'E', 'MORSE': '.'}}
+    assert parse_message(batch('b1', (0, 'E', '.')))['kind'] == 'batch'
+
+
+def test_read_device_message_stops_at_the_end_of_a_batch():
+    device, receiver = socket.socketpair()
+    data = batch('b1', (0, 'E', '.')).encode('utf-8')
+    device.sendall(data)  # Left open: the device waits for the ACK
+    assert read_device_message(receiver) == data
+    device.close()
+    receiver.close()
+
+
+def test_batch_is_acknowledged_with_the_last_sequence_number():
+    server = RecordingServer()
+    assert deliver(server, batch('b1', (0, 'C', '-.-.'), (1, 'Q', '--.-'))) == "ACK: 1\n"
+    assert server.received == ['C', 'Q']
+
+
+def test_resent_records_are_applied_once():
+    server = RecordingServer()
+    deliver(server, batch('b1', (0, 'C', '-.-.'), (1, 'Q', '--.-')))
+    # The ACK was lost: the device resends its buffer with one new record
+    assert deliver(server, batch('b1', (0, 'C', '-.-.'), (1, 'Q', '--.-'), (2, 'X', '-..-'))) == "ACK: 2\n"
+    assert server.received == ['C', 'Q', 'X']
+
+
+def test_a_new_boot_restarts_the_sequence_numbers():
+    server = RecordingServer()
+    deliver(server, batch('b1', (0, 'C', '-.-.'), (1, 'Q', '--.-')))
+    assert deliver(server, batch('b2', (0, 'E', '.'))) == "ACK: 0\n"
+    assert server.received == ['C', 'Q', 'E']
+
+
+def test_devices_are_deduplicated_separately():
+    server = RecordingServer()
+    deliver(server, batch('b1', (0, 'C', '-.-.')), ip='10.0.0.7')
+    deliver(server, batch('b1', (0, 'Q', '--.-')), ip='10.0.0.8')
+    assert server.received == ['C', 'Q']
+
+
+def test_empty_batch_probe_is_answered():
+    server = RecordingServer()
+    assert deliver(server, batch('b1')) == "ACK: -1\n"
+    assert server.received == []
+
+
+def test_single_character_messages_get_no_reply():
+    server = RecordingServer()
+    device, receiver = socket.socketpair()
+    thread = threading.Thread(target=server.handle_client, args=(receiver, ('10.0.0.7', 50000)))
+    thread.start()
+    device.sendall(b"CHAR: E\nMORSE: .\n")
+    device.shutdown(socket.SHUT_WR)
+    assert device.recv(64) == b""
+    thread.join()
+    device.close()
+    assert server.received == ['E']
@@ -0,0 +1,70 @@
+import pytest
+
+from keyer import DAH, DIT, IambicKeyer, SimulatedPaddles, simulate
+
+DIT_TIME = 0.08  # 15 WPM
+
+
+def run(script, mode='B', until=1.5):
+    """Elements keyed for (press|release, paddle, at) edges, and the key edges"""
+    paddles = SimulatedPaddles()
+    for action, paddle, at in script:
+        getattr(paddles, action)(paddle, at)
+    keys = []
+    keyer = IambicKeyer(DIT_TIME, mode, on_key=lambda down, at: keys.append((down, round(at, 3))))
+    return simulate(paddles, keyer, until), keys
+
+
+def pattern(elements):
+    return ''.join(element for element, _ in elements)
+
+
+def test_single_dit_tap():
+    elements, keys = run([('press', DIT, 0.0), ('release', DIT, 0.03)])
+    assert elements == [('.', 0.0)]
+    assert keys == [(True, 0.0), (False, 0.08)]
+
+
+def test_single_dah_tap():
+    elements, keys = run([('press', DAH, 0.0), ('release', DAH, 0.03)])
+    assert elements == [('-', 0.0)]
+    assert keys == [(True, 0.0), (False, 0.24)]
+
+
+def test_held_paddle_repeats_on_the_element_grid():
+    elements, _ = run([('press', DIT, 0.0), ('release', DIT, 0.5)])
+    assert elements == [('.', 0.0), ('.', 0.16), ('.', 0.32), ('.', 0.48)]
+    elements, _ = run([('press', DAH, 0.0), ('release', DAH, 0.7)])
+    assert elements == [('-', 0.0), ('-', 0.32), ('-', 0.64)]
+
+
+def test_elements_and_spaces_follow_the_timing_grid():
+    _, keys = run([('press', DAH, 0.0), ('press', DIT, 0.05),
+                   ('release', DAH, 0.5), ('release', DIT, 0.5)], mode='A')
+    downs = [at for down, at in keys if down]
+    ups = [at for down, at in keys if not down]
+    # Dah is three dits, dit is one, every element is followed by a one-dit space
+    assert [round(up - down, 3) for down, up in zip(downs, ups)] == [0.24, 0.08, 0.24]
+    assert [round(down - up, 3) for up, down in zip(ups, downs[1:])] == [0.08, 0.08]
+
+
+def test_tap_after_a_pause_starts_at_once():
+    elements, _ = run([('press', DIT, 0.0), ('release', DIT, 0.03),
+                       ('press', DIT, 0.5), ('release', DIT, 0.53)])
+    assert elements == [('.', 0.0), ('.', 0.5)]
+
+
+@pytest.mark.parametrize('mode, expected', [('A', '-.-'), ('B', '-.-.')])
+def test_squeeze_released_mid_element(mode, expected):
+    # Let go of both paddles during the third element: mode B adds one
+    # more element opposite to it, mode A stops
+    elements, _ = run([('press', DAH, 0.0), ('press', DIT, 0.05),
+                       ('release', DAH, 0.5), ('release', DIT, 0.5)], mode=mode)
+    assert pattern(elements) == expected
+    assert elements[:3] == [('-', 0.0), ('.', 0.32), ('-', 0.48)]
+
+
+def test_opposite_paddle_tapped_during_an_element_is_remembered():
+    elements, _ = run([('press', DAH, 0.0), ('press', DIT, 0.1),
+                       ('release', DIT, 0.15), ('release', DAH, 0.2)], mode='A')
+    assert elements == [('-', 0.0), ('.', 0.32)]
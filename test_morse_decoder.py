@@ -0,0 +1,63 @@
+from morse_decoder import ITU_TABLE, PROSIGNS, MorseDecoder, index_pattern, pattern_index
+
+
+def key(decoder, pattern):
+    """Feed a pattern element by element and end the letter"""
+    for element in pattern:
+        if element == '.':
+            decoder.dit()
+        else:
+            decoder.dah()
+    return decoder.end_letter()
+
+
+def test_tree_index_round_trip():
+    for pattern, _ in ITU_TABLE + PROSIGNS:
+        assert index_pattern(pattern_index(pattern)) == pattern
+
+
+def test_every_itu_pattern_decodes_without_prosigns():
+    decoder = MorseDecoder(prosigns=False)
+    for pattern, symbol in ITU_TABLE:
+        assert decoder.decode(pattern) == symbol
+
+
+def test_prosigns_take_over_shared_patterns():
+    assert MorseDecoder().decode('.-.-.') == '<AR>'
+    assert MorseDecoder().decode('-...-') == '<BT>'
+    assert MorseDecoder(prosigns=False).decode('.-.-.') == '+'
+    assert MorseDecoder().decode('...---...') == '<SOS>'
+
+
+def test_element_by_element():
+    decoder = MorseDecoder()
+    assert not decoder.pending()
+    decoder.dit()
+    assert decoder.pending()
+    decoder.dah()
+    assert decoder.end_letter() == 'A'
+    assert not decoder.pending()
+    assert key(decoder, '--.-') == 'Q'
+
+
+def test_letter_gap_without_elements():
+    assert MorseDecoder().end_letter() is None
+
+
+def test_reset_drops_the_elements_keyed_so_far():
+    decoder = MorseDecoder()
+    decoder.dah()
+    decoder.reset()
+    assert key(decoder, '.') == 'E'
+
+
+def test_unknown_pattern_falls_back_to_the_nearest():
+    decoder = MorseDecoder()
+    assert decoder.decode('......') == '5'        # One dit too many
+    assert key(decoder, '......') == '5'
+    assert decoder.decode('...---...-') == '<SOS>'  # Longer than the tree
+
+
+def test_nothing_close_enough():
+    assert MorseDecoder().decode('..........') is None
+    assert MorseDecoder(max_distance=0).decode('......') is None